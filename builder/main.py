@@ -30,6 +30,7 @@ from jinja2 import Environment, FileSystemLoader
 import ast
 import os
 import subprocess
+import sys
 import validate
 import re
 
@@ -175,6 +176,22 @@ def build_args(parser):
         action="store_true",
         help="Use absolute paths in generated test_cases.yaml"
     )
+    parser.add_argument(
+        "--prebuild-engines",
+        action="store_true",
+        help="Build the TensorRT engines of the deepstream models into their engine caches, requires TensorRT and a GPU"
+    )
+    parser.add_argument(
+        "--model-repo",
+        type=str,
+        help="Model repository to prebuild the engines in, defaults to model_repo of the configuration"
+    )
+    parser.add_argument(
+        "--device-id",
+        type=int,
+        default=0,
+        help="GPU to prebuild the engines on, it must be of the same architecture as the deployment GPU"
+    )
 
 def build_tree(server_type, config, temp_dir):
     cookiecutter.main.cookiecutter(
@@ -287,6 +304,20 @@ def build_inference(server_type, config, output_dir: Path):
         with open (target_dir/"model.py", 'w') as o:
             o.write(output)
 
+def prebuild_engines(config, model_repo: str, device_id: int):
+    """Build the engines the deepstream models would build when the service starts"""
+    sys.path.insert(0, get_resource_path(""))
+    from lib.engine_cache import EngineCache, prebuild_engines as build_engines
+    for model in config.models:
+        if model.backend.split('/')[0] != "deepstream":
+            continue
+        parameters = OmegaConf.to_container(model.parameters) if "parameters" in model else {}
+        model_home = os.path.join(model_repo, model.name)
+        config_paths = [p if os.path.isabs(p) else os.path.join(model_home, p) for p in parameters.get("infer_config_path", [])]
+        cache = EngineCache(parameters.get("engine_cache_dir", model_home))
+        engines = build_engines(cache, config_paths, model.max_batch_size, device_id)
+        logger.info(f"Engines of {model.name}: {engines}")
+
 def build_serverless(name: str, output_dir: Path):
     output_dir = output_dir / "app"
     tpl_dir = get_resource_path("templates")
@@ -414,6 +445,9 @@ def main(args):
     if args.validation_dir and not validate_directory_path(args.validation_dir):
         raise ValueError(f"Invalid validation directory: {args.validation_dir}")
 
+    if args.model_repo and not validate_directory_path(args.model_repo):
+        raise ValueError(f"Invalid model repository: {args.model_repo}")
+
     # Validate custom modules if provided
     if args.custom_module:
         for module in args.custom_module:
@@ -455,6 +489,8 @@ def main(args):
                 logger.error(f"validation build failed: {e}")
                 # Continue with other builds
                 # Continue to finish the build without validation
+    if args.prebuild_engines:
+        prebuild_engines(config, args.model_repo or config.model_repo, args.device_id)
     print("Build completed successfully")
 
 
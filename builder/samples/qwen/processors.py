@@ -16,6 +16,8 @@
 from transformers import AutoProcessor
 import torch
 import numpy as np
+import json
+from lib.cache import LRUCache, content_key
 
 class QwenVLProcessor:
     name = "qwen-vl-processor"
@@ -24,12 +26,16 @@ class QwenVLProcessor:
         model_home = config["model_home"]
         self._processor = AutoProcessor.from_pretrained(model_home)
         self._process_vision_info = process_vision_info
+        # rendered chat templates keyed by the prompt and the media placeholders
+        self._templates = LRUCache(config.get("template_cache_size", 1024))
+        # decoded and resized images and videos keyed by the digest of their sources
+        self._vision_inputs = LRUCache(config.get("vision_cache_size", 64))
 
     def __call__(self, *args):
         messages = args[0]
         max_new_tokens = args[1]
         text = self._processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-        image_inputs, video_inputs = self._process_vision_info(messages)
+        image_inputs, video_inputs = self.process_vision_info(messages)
         inputs = self._processor(
             text=[text],
             images=image_inputs,
@@ -43,7 +49,31 @@ class QwenVLProcessor:
         else:
             return inputs["input_ids"], inputs["attention_mask"], None, None, inputs["pixel_values_videos"], inputs["video_grid_thw"], max_new_tokens, inputs["input_ids"]
 
+    def process_vision_info(self, messages):
+        """process_vision_info() of qwen_vl_utils, skipping the fetching and resizing of the media seen before"""
+        sources = [
+            {k: v for k, v in item.items() if k != "text"}
+            for message in messages if isinstance(message.get("content", None), list)
+            for item in message["content"] if isinstance(item, dict) and item.get("type", None) != "text"
+        ]
+        if not sources:
+            return self._process_vision_info(messages)
+        key = content_key({"sources": json.dumps(sources, sort_keys=True)})
+        vision_inputs = self._vision_inputs.get(key)
+        if vision_inputs is None:
+            vision_inputs = self._process_vision_info(messages)
+            self._vision_inputs.put(key, vision_inputs)
+        return vision_inputs
+
     def apply_chat_template(self, prompt, multimodal_data):
+        key = (prompt, tuple((media_type, len(items)) for media_type, items in multimodal_data.items()))
+        text = self._templates.get(key)
+        if text is None:
+            text = self._render_chat_template(prompt, multimodal_data)
+            self._templates.put(key, text)
+        return text
+
+    def _render_chat_template(self, prompt, multimodal_data):
         # Build content list with media placeholders
         content = []
 
@@ -39,7 +39,7 @@ current_dir = Path(__file__).parent
 project_root = current_dir.parent
 sys.path.append(str(project_root))
 
-from nim_client import main as nim_client_main, convert_masks_to_image_size
+from nim_client import main as nim_client_main, convert_masks_to_image_size, decode_mask
 from validation_utils import (
     validate_safe_path, validate_config_path, validate_dump_vis_path,
     validate_directory_path, validate_split_name
@@ -173,8 +173,8 @@ class SegmentationEvaluator:
         original_shape = tuple(data["shape"])
         masks = data["masks"][0]  # Get the first (and only) mask
 
-        # Reshape the flattened mask to match original dimensions
-        pred_mask = np.array(masks).reshape(original_shape)
+        # Decode the mask, or reshape the flattened mask, to match original dimensions
+        pred_mask = decode_mask(masks, original_shape)
 
         # Resize prediction to match target shape
         resized_masks = convert_masks_to_image_size([pred_mask], original_shape, target_shape)
@@ -32,6 +32,7 @@ from requests_toolbelt import MultipartEncoder
 project_root = Path(__file__).parent.parent.parent.parent
 sys.path.append(str(project_root))
 from builder.utils import PayloadBuilder
+from lib.masks import decode_mask
 
 API_KEY_REQUIRED_IF_EXECUTING_OUTSIDE_NGC="shfklsjlfjsljgl"
 
@@ -121,7 +122,7 @@ def convert_masks_to_image_size(masks_list, original_shape, target_shape):
     """
     Convert masks from relative size to target image size
     Args:
-        masks_list: List of masks with label indices
+        masks_list: List of masks with label indices, flattened or encoded as rle, png or bits
         original_shape: Shape that masks are based on (height, width)
         target_shape: Target image shape to convert to (height, width)
     Returns:
@@ -137,8 +138,8 @@ def convert_masks_to_image_size(masks_list, original_shape, target_shape):
     converted_masks = []
     for mask in masks_list:
         try:
-            # Convert flattened list back to 2D numpy array
-            mask = np.array(mask).reshape(original_shape)
+            # Decode the mask, or reshape the flattened list, to a 2D numpy array
+            mask = decode_mask(mask, original_shape)
 
             if mask.max() > 255:
                 # If we have more than 255 labels, we need to:
@@ -15,6 +15,7 @@
 
 import numpy as np
 import os
+from lib.masks import encode_mask
 
 def generate_masks_with_special_tokens_and_transfer_map(tokenized, special_tokens_list):
     """Generate attention mask between each pair of special tokens.
@@ -172,6 +173,8 @@ class GDinoPostProcessor:
         self.top_k = 300
         self.item_threshold = 0.5  # threshold for the score per inferenced item
         self.segmentation_threshold = 0.5  # threshold per pixel for segmentation mask
+        # encoding of the masks in the response: list, rle, png or bits
+        self.mask_encoding = config.get("mask_encoding", "list")
         # load top_k and threshold from nvdsinfer_config.yaml
         self._load_config()
 
@@ -442,8 +445,8 @@ class GDinoPostProcessor:
                     # ]
                     mask_array[idx] = ((mask_array[idx] > self.segmentation_threshold) * (label_idx + 1)).astype(np.uint8)  # uint8 [0, 255]
                 masks.append(mask_array)
-            # Convert to flattened masks
-            mask_list = [mask.flatten().astype(np.uint8).tolist() for mask in masks[0]]
+            # Encode the masks, flattened lists by default
+            mask_list = [encode_mask(mask.astype(np.uint8), self.mask_encoding) for mask in masks[0]]
         else:
             mask_list = [[]]
 
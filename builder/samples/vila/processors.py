@@ -17,6 +17,7 @@
 import os, json
 import numpy as np
 import transformers
+from lib.cache import PrefixTokenizer
 
 class VilaTokenizer:
     name = "vila-tokenizer"
@@ -25,10 +26,15 @@ class VilaTokenizer:
         if not self._is_encoder:
             self._skip_special_tokens = config["skip_special_tokens"]
         self._tokenizer = transformers.AutoTokenizer.from_pretrained(config["model_home"])
+        if self._is_encoder:
+            # the prompts share the conversation scaffolding, whose tokens are cached
+            self._prefix_tokenizer = PrefixTokenizer(self._tokenizer, config.get("prefix_cache_size", 4096))
 
     def __call__(self, *args):
         if self._is_encoder:
             msg_strs = [ v.decode() for v in args[0] ]
+            if len(msg_strs) == 1:
+                return np.array(self._prefix_tokenizer.encode(msg_strs[0]))
             output = self._tokenizer(*msg_strs)
             return np.array(output["input_ids"])
         else:
@@ -0,0 +1,279 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+import torch
+from .transfer import HostBufferPool
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class IORunner(ABC):
+    """The engine operations the IOBufferPool relies on"""
+
+    @property
+    @abstractmethod
+    def input_dtypes(self) -> Dict[str, torch.dtype]:
+        raise Exception("Not Implemented")
+
+    @property
+    @abstractmethod
+    def output_dtypes(self) -> Dict[str, torch.dtype]:
+        raise Exception("Not Implemented")
+
+    @property
+    @abstractmethod
+    def profiles(self) -> List[Dict[str, Tuple[Tuple, Tuple]]]:
+        """The min and max shapes of each input per optimization profile"""
+        raise Exception("Not Implemented")
+
+    @abstractmethod
+    def set_profile(self, index: int, stream: Optional[torch.cuda.Stream]):
+        raise Exception("Not Implemented")
+
+    @abstractmethod
+    def set_input_shapes(self, shapes: Dict[str, Tuple]) -> Dict[str, Tuple]:
+        """Set the shapes of the inputs and return the resulting shapes of the outputs"""
+        raise Exception("Not Implemented")
+
+    @abstractmethod
+    def execute(self, inputs: Dict[str, torch.Tensor], outputs: Dict[str, torch.Tensor], stream: Optional[torch.cuda.Stream]):
+        """Enqueue the inference on the stream, reading the inputs and writing the outputs in place"""
+        raise Exception("Not Implemented")
+
+
+class _ProfileBuffers:
+    """Device and pinned host buffers sized for the max shapes of a profile"""
+    def __init__(self, runner: IORunner, index: int, device: torch.device, stream):
+        pinned = device.type == "cuda"
+        max_shapes = {name: shapes[1] for name, shapes in runner.profiles[index].items()}
+        runner.set_profile(index, stream)
+        output_shapes = runner.set_input_shapes(max_shapes)
+        self.inputs = {
+            name: torch.empty(int(np.prod(shape)), dtype=runner.input_dtypes[name], device=device)
+            for name, shape in max_shapes.items()
+        }
+        self.host_inputs = {
+            name: torch.empty(int(np.prod(shape)), dtype=runner.input_dtypes[name], pin_memory=True)
+            for name, shape in max_shapes.items()
+        } if pinned else {}
+        self.outputs = {
+            name: torch.empty(int(np.prod(shape)), dtype=runner.output_dtypes[name], device=device)
+            for name, shape in output_shapes.items()
+        }
+
+    @staticmethod
+    def view(buffer: torch.Tensor, shape: Tuple) -> torch.Tensor:
+        return buffer[:int(np.prod(shape))].view(shape)
+
+
+class IOBufferPool:
+    """Pre-allocated IO buffers of an engine reused across the calls
+
+    The buffers of an optimization profile are allocated once for its max shapes, and
+    each call runs on views of them, so no memory is allocated per call. With
+    cuda_graph enabled, the inference of each distinct set of input shapes is captured
+    into a CUDA graph and replayed on the next calls with the same shapes.
+
+    The outputs are copied out of the buffers before they are returned, because the
+    downstream consumes them asynchronously while the next call reuses the buffers.
+    """
+    def __init__(self, runner: IORunner, device="cuda", cuda_graph: bool = False):
+        self._runner = runner
+        self._device = torch.device(device)
+        on_gpu = self._device.type == "cuda"
+        self._stream = torch.cuda.Stream(self._device) if on_gpu else None
+        self._cuda_graph = cuda_graph and on_gpu
+        self._buffers: Dict[int, _ProfileBuffers] = {}
+        self._graphs: Dict[Tuple, torch.cuda.CUDAGraph] = {}
+        self._active_profile = None
+        self._n_allocations = 0
+
+    @property
+    def n_allocations(self):
+        """Number of profiles whose buffers have been allocated"""
+        return self._n_allocations
+
+    @property
+    def n_graphs(self):
+        return len(self._graphs)
+
+    def run(self, in_data: Dict) -> Dict[str, torch.Tensor]:
+        shapes = {name: tuple(value.shape) for name, value in in_data.items()}
+        index = self._find_profile(shapes)
+        buffers = self._buffers.get(index, None)
+        if buffers is None:
+            buffers = _ProfileBuffers(self._runner, index, self._device, self._stream)
+            self._buffers[index] = buffers
+            self._active_profile = index
+            self._n_allocations += 1
+            logger.info(f"IO buffers allocated for optimization profile {index}")
+        if self._active_profile != index:
+            self._runner.set_profile(index, self._stream)
+            self._active_profile = index
+        output_shapes = self._runner.set_input_shapes(shapes)
+        inputs = {name: buffers.view(buffers.inputs[name], shape) for name, shape in shapes.items()}
+        outputs = {name: buffers.view(buffers.outputs[name], shape) for name, shape in output_shapes.items()}
+        with torch.cuda.stream(self._stream):
+            for name, value in in_data.items():
+                self._copy_input(value, inputs[name], buffers.host_inputs.get(name, None))
+            if self._cuda_graph:
+                self._replay(index, shapes, inputs, outputs)
+            else:
+                self._runner.execute(inputs, outputs, self._stream)
+            results = {name: output.clone() for name, output in outputs.items()}
+        if self._stream is not None:
+            self._stream.synchronize()
+        return results
+
+    def _find_profile(self, shapes: Dict[str, Tuple]) -> int:
+        for index, profile in enumerate(self._runner.profiles):
+            if all(
+                name in profile and len(shape) == len(profile[name][0]) and
+                all(lo <= s <= hi for s, lo, hi in zip(shape, profile[name][0], profile[name][1]))
+                for name, shape in shapes.items()
+            ):
+                return index
+        raise ValueError(f"No optimization profile covers the input shapes {shapes}")
+
+    def _copy_input(self, value, target: torch.Tensor, host: Optional[torch.Tensor]):
+        if isinstance(value, np.ndarray):
+            value = torch.from_numpy(np.ascontiguousarray(value))
+        elif not isinstance(value, torch.Tensor):
+            value = torch.utils.dlpack.from_dlpack(value)
+        if host is not None and value.device.type == "cpu":
+            # stage through the pinned buffer so that the copy to the device is asynchronous
+            staged = host[:value.numel()].view(value.shape)
+            staged.copy_(value)
+            value = staged
+        target.copy_(value, non_blocking=True)
+
+    def _replay(self, index: int, shapes: Dict[str, Tuple], inputs, outputs):
+        key = (index, tuple(sorted(shapes.items())))
+        graph = self._graphs.get(key, None)
+        if graph is None:
+            # the first run initializes the engine outside of the capture
+            self._runner.execute(inputs, outputs, self._stream)
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph, stream=self._stream):
+                self._runner.execute(inputs, outputs, self._stream)
+            self._graphs[key] = graph
+            logger.info(f"CUDA graph captured for input shapes {shapes}")
+        graph.replay()
+
+
+class TrtIORunner(IORunner):
+    """IORunner of a TensorRT engine and its execution context"""
+    def __init__(self, engine, context):
+        import tensorrt as trt
+        self._engine = engine
+        self._context = context
+        dtypes = {
+            trt.float32: torch.float32,
+            trt.float16: torch.float16,
+            trt.int32: torch.int32,
+            trt.int64: torch.int64,
+            trt.int8: torch.int8,
+            trt.uint8: torch.uint8,
+            trt.bool: torch.bool,
+        }
+        if hasattr(trt, "bfloat16"):
+            dtypes[trt.bfloat16] = torch.bfloat16
+        names = [engine.get_tensor_name(i) for i in range(engine.num_io_tensors)]
+        input_names = [n for n in names if engine.get_tensor_mode(n) == trt.TensorIOMode.INPUT]
+        self._input_dtypes = {n: dtypes[engine.get_tensor_dtype(n)] for n in input_names}
+        self._output_dtypes = {n: dtypes[engine.get_tensor_dtype(n)] for n in names if n not in self._input_dtypes}
+        self._profiles = []
+        for index in range(engine.num_optimization_profiles):
+            profile = {}
+            for name in input_names:
+                min_shape, _, max_shape = engine.get_tensor_profile_shape(name, index)
+                profile[name] = (tuple(min_shape), tuple(max_shape))
+            self._profiles.append(profile)
+
+    @property
+    def input_dtypes(self):
+        return self._input_dtypes
+
+    @property
+    def output_dtypes(self):
+        return self._output_dtypes
+
+    @property
+    def profiles(self):
+        return self._profiles
+
+    def set_profile(self, index, stream):
+        self._context.set_optimization_profile_async(index, stream.cuda_stream)
+
+    def set_input_shapes(self, shapes):
+        for name, shape in shapes.items():
+            self._context.set_input_shape(name, shape)
+        return {n: tuple(self._context.get_tensor_shape(n)) for n in self._output_dtypes}
+
+    def execute(self, inputs, outputs, stream):
+        for name, tensor in list(inputs.items()) + list(outputs.items()):
+            self._context.set_tensor_address(name, tensor.data_ptr())
+        if not self._context.execute_async_v3(torch.cuda.current_stream().cuda_stream):
+            raise Exception("TensorRT execution failed")
+
+
+class EncodedBufferPool:
+    """Hands the encoded media over to the pipeline buffers without copying them to lists
+
+    The files are read straight into pooled host buffers, and the encoded bytes are
+    passed to buffer_class through the buffer protocol, so a multi-megabyte image is
+    neither read into a temporary bytes object nor converted to a python list. The
+    pooled buffer of a file must be released once the pipeline is done with its bytes.
+
+    If buffer_class doesn't take the buffer protocol, which is found on its first use,
+    the bytes are passed as a list.
+    """
+    def __init__(self, buffer_class: Callable[[Any], Any], max_bytes: int = 64 * 2**20):
+        self._buffer_class = buffer_class
+        self._pool = HostBufferPool(max_bytes, pin_memory=False)
+        self._zero_copy = True
+
+    @property
+    def zero_copy(self):
+        return self._zero_copy
+
+    def read(self, path: str) -> Tuple[np.ndarray, torch.Tensor]:
+        """Read a file into a pooled buffer, return its bytes and the buffer to release"""
+        with open(path, "rb", buffering=0) as f:
+            size = os.fstat(f.fileno()).st_size
+            storage = self._pool.acquire(size)
+            data = storage.numpy()[:size]
+            n_read = f.readinto(data)
+        return data[:n_read], storage
+
+    def wrap(self, data: np.ndarray):
+        """Create a buffer of the encoded bytes"""
+        data = np.ascontiguousarray(data).view(np.uint8).reshape(-1)
+        if self._zero_copy:
+            try:
+                return self._buffer_class(memoryview(data))
+            except TypeError:
+                logger.warning(f"{self._buffer_class} doesn't take the buffer protocol, encoded bytes are passed as lists")
+                self._zero_copy = False
+        return self._buffer_class(data.tolist())
+
+    def release(self, storage: torch.Tensor):
+        self._pool.release(storage)
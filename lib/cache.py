@@ -0,0 +1,289 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Tuple
+import numpy as np
+import torch
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class LRUCache:
+    """A thread safe LRU cache with hit and miss counters"""
+    def __init__(self, max_entries: int = 1024):
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: Hashable, default: Any = None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return self._entries[key]
+            self._misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+            }
+
+
+class PrefixTokenizer:
+    """Tokenizer wrapper reusing the token ids of the prompt segments seen before
+
+    Templated prompts share long system prompts and chat scaffolding, which are
+    delimited by the special tokens of the chat template. A prompt is split at the
+    special tokens, and only the segments not in the cache are tokenized, so the
+    common prefixes are tokenized once.
+
+    Splitting is only valid if the tokenizer never merges tokens across the special
+    tokens. The first prompts are checked against the full tokenization, and the
+    cache is disabled on any mismatch.
+    """
+    def __init__(self, tokenizer, max_entries: int = 4096, n_verify: int = 8):
+        self._tokenizer = tokenizer
+        special = set(tokenizer.all_special_tokens) | set(tokenizer.get_added_vocab().keys())
+        special = sorted((t for t in special if t), key=len, reverse=True)
+        self._pattern = re.compile("(" + "|".join(re.escape(t) for t in special) + ")") if special else None
+        self._special_ids = {t: tokenizer.convert_tokens_to_ids(t) for t in special}
+        # the special tokens the tokenizer adds around a text, e.g. BOS, found with a probe
+        probe = "a"
+        framed = list(tokenizer(probe)["input_ids"])
+        bare = list(tokenizer.encode(probe, add_special_tokens=False))
+        start = next((i for i in range(len(framed) - len(bare) + 1) if framed[i:i + len(bare)] == bare), 0)
+        self._head = framed[:start]
+        self._tail = framed[start + len(bare):]
+        self._segments = LRUCache(max_entries)
+        self._n_verify = n_verify
+        self._enabled = True
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    def stats(self) -> Dict:
+        return self._segments.stats()
+
+    def encode(self, text: str) -> List[int]:
+        """Token ids of the text, same as tokenizer(text)["input_ids"]"""
+        if not self._enabled:
+            return list(self._tokenizer(text)["input_ids"])
+        ids = []
+        segments = self._pattern.split(text) if self._pattern is not None else [text]
+        for segment in segments:
+            if not segment:
+                continue
+            special_id = self._special_ids.get(segment, None)
+            if special_id is not None:
+                ids.append(special_id)
+                continue
+            segment_ids = self._segments.get(segment)
+            if segment_ids is None:
+                segment_ids = self._tokenizer.encode(segment, add_special_tokens=False)
+                self._segments.put(segment, segment_ids)
+            ids.extend(segment_ids)
+        ids = self._head + ids + self._tail
+        if self._n_verify > 0:
+            self._n_verify -= 1
+            expected = list(self._tokenizer(text)["input_ids"])
+            if expected != ids:
+                logger.warning("Segmented tokenization doesn't match the tokenizer, prefix cache is disabled")
+                self._enabled = False
+                return expected
+        return ids
+
+
+def content_key(values: Dict[str, Any]) -> str:
+    """A digest identifying the content of the tensors and the values"""
+    digest = hashlib.blake2b(digest_size=16)
+    def update(value):
+        if isinstance(value, torch.Tensor):
+            value = value.detach().cpu().contiguous().numpy()
+        if isinstance(value, np.ndarray) and value.dtype == object:
+            value = value.tolist()
+        if isinstance(value, np.ndarray):
+            digest.update(str((value.dtype.str, value.shape)).encode())
+            digest.update(np.ascontiguousarray(value).view(np.uint8).data)
+        elif isinstance(value, (list, tuple)):
+            digest.update(f"[{len(value)}".encode())
+            for v in value:
+                update(v)
+        elif isinstance(value, dict):
+            for k in sorted(value):
+                digest.update(str(k).encode())
+                update(value[k])
+        elif isinstance(value, (bytes, bytearray)):
+            digest.update(value)
+        elif hasattr(value, "__dlpack__"):
+            update(torch.utils.dlpack.from_dlpack(value))
+        else:
+            digest.update(repr(value).encode())
+    for name in sorted(values):
+        digest.update(name.encode())
+        update(values[name])
+    return digest.hexdigest()
+
+
+def _map_tensors(value, fn):
+    if isinstance(value, torch.Tensor):
+        return fn(value)
+    if isinstance(value, list):
+        return [_map_tensors(v, fn) for v in value]
+    if isinstance(value, tuple):
+        return tuple(_map_tensors(v, fn) for v in value)
+    if isinstance(value, dict):
+        return {k: _map_tensors(v, fn) for k, v in value.items()}
+    return value
+
+
+def _device_bytes(value) -> Tuple[int, int]:
+    """Bytes of the value held on the GPU and on the host"""
+    if isinstance(value, torch.Tensor):
+        size = value.element_size() * value.nelement()
+        return (size, 0) if value.is_cuda else (0, size)
+    if isinstance(value, np.ndarray):
+        return 0, value.nbytes
+    if isinstance(value, (list, tuple)):
+        sizes = [_device_bytes(v) for v in value]
+        return sum(s[0] for s in sizes), sum(s[1] for s in sizes)
+    if isinstance(value, dict):
+        return _device_bytes(list(value.values()))
+    return 0, 0
+
+
+class TensorCache:
+    """An LRU cache of tensors within a GPU and a host memory budget
+
+    When the GPU budget is exceeded, the least recently used entries are moved to the
+    host, and they are moved back to their GPU on the next hit. When the host budget is
+    exceeded, the least recently used entries are evicted.
+    """
+    def __init__(self, device_budget: int, host_budget: int):
+        self._device_budget = device_budget
+        self._host_budget = host_budget
+        # key -> [value, device bytes, host bytes, original device]
+        self._entries = OrderedDict()
+        self._device_bytes = 0
+        self._host_bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._entries.move_to_end(key)
+            value, device_bytes, host_bytes, device = entry
+            if device is not None and device_bytes == 0 and host_bytes <= self._device_budget:
+                # promote the entry back to its GPU
+                self._remove(key)
+                self._add(key, _map_tensors(value, lambda t: t.to(device, non_blocking=True)), device)
+                value = self._entries[key][0]
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        device = next(iter(_find_cuda_devices(value)), None)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            device_bytes, host_bytes = _device_bytes(value)
+            if device_bytes > self._device_budget:
+                # too large for the GPU budget, keep it on the host
+                value = _map_tensors(value, lambda t: t.cpu())
+                device_bytes, host_bytes = 0, device_bytes + host_bytes
+            if host_bytes > self._host_budget:
+                return
+            self._add(key, value, device)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "device_bytes": self._device_bytes,
+                "host_bytes": self._host_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+            }
+
+    def _add(self, key, value, device):
+        device_bytes, host_bytes = _device_bytes(value)
+        self._entries[key] = [value, device_bytes, host_bytes, device]
+        self._device_bytes += device_bytes
+        self._host_bytes += host_bytes
+        self._trim()
+
+    def _remove(self, key):
+        _, device_bytes, host_bytes, _ = self._entries.pop(key)
+        self._device_bytes -= device_bytes
+        self._host_bytes -= host_bytes
+
+    def _trim(self):
+        # demote the least recently used entries from the GPU
+        for key in list(self._entries.keys()):
+            if self._device_bytes <= self._device_budget:
+                break
+            value, device_bytes, host_bytes, device = self._entries[key]
+            if device_bytes == 0:
+                continue
+            self._entries[key] = [_map_tensors(value, lambda t: t.cpu()), 0, device_bytes + host_bytes, device]
+            self._device_bytes -= device_bytes
+            self._host_bytes += device_bytes
+        # evict the least recently used entries from the host
+        while self._host_bytes > self._host_budget and self._entries:
+            key = next(iter(self._entries))
+            self._remove(key)
+            self._evictions += 1
+
+
+def _find_cuda_devices(value):
+    devices = []
+    _map_tensors(value, lambda t: devices.append(t.device) if t.is_cuda else None)
+    return devices
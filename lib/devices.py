@@ -0,0 +1,110 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import contextlib
+import threading
+from typing import Any, Dict, List, Optional
+import torch
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def model_device_ids(model_config: Dict, n_devices: Optional[int] = None) -> List[int]:
+    """The devices a model is placed on, from its device_ids, [0] by default
+
+    The ids are checked against the number of devices if given, or the CUDA devices if
+    CUDA is available, so that simulated devices can be used without a GPU.
+    """
+    device_ids = model_config.get("device_ids", None)
+    if device_ids is None:
+        return [0]
+    if isinstance(device_ids, int):
+        device_ids = [device_ids]
+    device_ids = list(device_ids)
+    if not device_ids or any(not isinstance(d, int) or d < 0 for d in device_ids):
+        raise ValueError(f"Invalid device_ids {device_ids} of model {model_config['name']}, expecting a list of device indices")
+    if len(set(device_ids)) != len(device_ids):
+        raise ValueError(f"Duplicated device_ids {device_ids} of model {model_config['name']}")
+    if n_devices is None and torch.cuda.is_available():
+        n_devices = torch.cuda.device_count()
+    if n_devices is not None and max(device_ids) >= n_devices:
+        raise ValueError(f"device_ids {device_ids} of model {model_config['name']} exceed the {n_devices} devices available")
+    return device_ids
+
+
+def device_scope(device_id: int):
+    """Make the device current for the CUDA work of the calling thread, no-op without CUDA"""
+    if torch.cuda.is_available():
+        return torch.cuda.device(device_id)
+    return contextlib.nullcontext()
+
+
+class DeviceScheduler:
+    """Spreads the requests of a model across its devices
+
+    A request is placed on the device with the fewest requests in flight, the ties going
+    round robin, and it stays there through the image decode, the preprocessors and the
+    backend. The placement is recorded on the request context, so the downstream models of
+    the request also run on the same device when they are placed on it, and no tensor moves
+    across the devices. The scheduler only deals with device indices, so any of them can
+    be simulated.
+    """
+    def __init__(self, device_ids: List[int]):
+        if not device_ids:
+            raise ValueError("DeviceScheduler needs at least one device")
+        self._device_ids = list(device_ids)
+        self._inflight = {d: 0 for d in self._device_ids}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    @property
+    def device_ids(self) -> List[int]:
+        return self._device_ids.copy()
+
+    @property
+    def load(self) -> Dict[int, int]:
+        """Number of requests in flight on each device"""
+        with self._lock:
+            return dict(self._inflight)
+
+    def place(self, context: Any = None) -> int:
+        """The device of a request, the one recorded on its context if it is among the devices"""
+        device_id = getattr(context, "device_id", None)
+        if device_id in self._inflight:
+            return device_id
+        if len(self._device_ids) == 1:
+            device_id = self._device_ids[0]
+        else:
+            with self._lock:
+                n = len(self._device_ids)
+                order = [self._device_ids[(self._next + i) % n] for i in range(n)]
+                device_id = min(order, key=lambda d: self._inflight[d])
+                self._next = (self._device_ids.index(device_id) + 1) % n
+        if context is not None:
+            context.device_id = device_id
+        return device_id
+
+    @contextlib.contextmanager
+    def running(self, device_id: int):
+        """Count a request in flight on the device while it runs"""
+        with self._lock:
+            self._inflight[device_id] += 1
+        try:
+            yield device_id
+        finally:
+            with self._lock:
+                self._inflight[device_id] -= 1
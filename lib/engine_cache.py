@@ -0,0 +1,311 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Content addressed cache of the TensorRT engines built from the ONNX models
+
+An engine is keyed by the digests of its ONNX file and of its infer config, its batch
+size, its precision, the TensorRT version and the GPU architecture, so a cached engine
+is never used with a model, a config or a TensorRT it wasn't built for. Each engine is
+stored with a manifest of its key, which is checked before the engine is used.
+
+The module doesn't depend on the GPU nor on TensorRT, except for build_engine(), so that
+the builder can prebuild the engines and the keys can be checked anywhere.
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import subprocess
+import threading
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+NETWORK_MODES = {0: "fp32", 1: "int8", 2: "fp16"}
+
+# infer config properties which don't change the engine
+RUNTIME_PROPERTIES = {"model-engine-file", "gpu-id", "batch-size", "labelfile-path", "gie-unique-id", "interval"}
+
+_digests: Dict[Tuple, str] = {}
+_digests_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """sha256 of a file, memoized while the file is unchanged"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _digests_lock:
+        digest = _digests.get(memo_key, None)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        with _digests_lock:
+            _digests[memo_key] = digest
+    return digest
+
+
+def _short_version(version: str) -> str:
+    """major.minor.patch, which all the sources of the version agree on"""
+    return ".".join(re.findall(r"\d+", version)[:3])
+
+
+def tensorrt_version() -> str:
+    """Version of the TensorRT the engines are built with, from its python module or its headers"""
+    try:
+        import tensorrt
+        return _short_version(tensorrt.__version__)
+    except ImportError:
+        pass
+    for header in glob.glob("/usr/include/*/NvInferVersion.h") + glob.glob("/usr/include/NvInferVersion.h"):
+        with open(header, "r") as f:
+            defines = dict(re.findall(r"#define\s+NV_TENSORRT_(MAJOR|MINOR|PATCH)\s+(\d+)", f.read()))
+        if defines:
+            return ".".join(defines.get(k, "0") for k in ("MAJOR", "MINOR", "PATCH"))
+    libraries = sorted(glob.glob("/usr/lib/*/libnvinfer.so.*.*") + glob.glob("/usr/local/tensorrt/lib/libnvinfer.so.*.*"))
+    if libraries:
+        return _short_version(libraries[-1].split("libnvinfer.so.")[-1])
+    return "unknown"
+
+
+def gpu_architecture(device_id: int = 0) -> str:
+    """Compute capability of the GPU, engines don't run on other architectures"""
+    try:
+        import torch
+        if torch.cuda.is_available():
+            major, minor = torch.cuda.get_device_capability(device_id)
+            return f"sm{major}{minor}"
+    except ImportError:
+        pass
+    try:
+        result = subprocess.run(
+            ["nvidia-smi", "--query-gpu=compute_cap", "--format=csv,noheader", "-i", str(device_id)],
+            capture_output=True, text=True, timeout=10
+        )
+        if result.returncode == 0 and result.stdout.strip():
+            return "sm" + result.stdout.strip().replace(".", "")
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return "unknown"
+
+
+@dataclass(frozen=True)
+class EngineSpec:
+    """What an engine is built from"""
+    onnx_file: str
+    onnx_digest: str
+    config_digest: str
+    batch_size: int
+    precision: str
+    tensorrt: str
+    gpu: str
+
+    @property
+    def key(self) -> str:
+        fields = asdict(self)
+        # the same model at another path builds the same engine
+        fields.pop("onnx_file")
+        return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def read_infer_property(config_path: str) -> Optional[Dict]:
+    """The property section of an nvinfer config in yaml"""
+    with open(config_path, "r") as f:
+        config = yaml.safe_load(f)
+    if not isinstance(config, dict) or "property" not in config:
+        return None
+    return config["property"]
+
+
+def config_digest(property: Dict, base_dir: str) -> str:
+    """Digest of the infer config properties the engine depends on"""
+    values = {k: v for k, v in property.items() if k not in RUNTIME_PROPERTIES and k != "onnx-file"}
+    calibration = property.get("int8-calib-file", None)
+    if calibration:
+        path = calibration if os.path.isabs(calibration) else os.path.join(base_dir, calibration)
+        if os.path.exists(path):
+            values["int8-calib-file"] = file_digest(path)
+    return hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def precision_of(property: Dict) -> str:
+    return NETWORK_MODES.get(property.get("network-mode", None), "fp16")
+
+
+class EngineCache:
+    """Engines of a directory named after their keys, each with a json manifest"""
+    def __init__(self, cache_dir: str, tensorrt: Optional[str] = None, gpu: Optional[str] = None):
+        self._cache_dir = cache_dir
+        self._tensorrt = tensorrt
+        self._gpu = gpu
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    def spec(self, config_path: str, batch_size: int, device_id: int = 0) -> Optional[EngineSpec]:
+        """The spec of the engine of an infer config, None if the config has no onnx model"""
+        property = read_infer_property(config_path)
+        if not property or "onnx-file" not in property:
+            return None
+        base_dir = os.path.dirname(os.path.abspath(config_path))
+        onnx_file = property["onnx-file"]
+        if not os.path.isabs(onnx_file):
+            onnx_file = os.path.join(base_dir, onnx_file)
+        if not os.path.exists(onnx_file):
+            logger.warning(f"ONNX file {onnx_file} of {config_path} doesn't exist, its engine isn't cached")
+            return None
+        return EngineSpec(
+            onnx_file=onnx_file,
+            onnx_digest=file_digest(onnx_file),
+            config_digest=config_digest(property, base_dir),
+            batch_size=batch_size,
+            precision=precision_of(property),
+            tensorrt=self._tensorrt if self._tensorrt is not None else tensorrt_version(),
+            gpu=self._gpu if self._gpu is not None else gpu_architecture(device_id),
+        )
+
+    def path(self, spec: EngineSpec) -> str:
+        stem = os.path.basename(spec.onnx_file)
+        return os.path.join(self._cache_dir, f"{stem}_b{spec.batch_size}_{spec.precision}_{spec.key}.engine")
+
+    def lookup(self, spec: EngineSpec) -> Optional[str]:
+        """The path of the cached engine of the spec, None on a miss, raises on a stale engine"""
+        engine_path = self.path(spec)
+        if not os.path.exists(engine_path):
+            return None
+        mismatches = self.validate(engine_path, spec)
+        if mismatches:
+            raise ValueError(
+                f"Refusing the stale engine {engine_path} with mismatched {', '.join(mismatches)}, "
+                f"remove it or prebuild the engines again"
+            )
+        return engine_path
+
+    def validate(self, engine_path: str, spec: EngineSpec) -> List[str]:
+        """The fields of the manifest of an engine which don't match the spec"""
+        try:
+            with open(engine_path + ".json", "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return ["manifest"]
+        expected = asdict(spec)
+        expected.pop("onnx_file")
+        mismatches = [k for k, v in expected.items() if manifest.get(k, None) != v]
+        if manifest.get("size", None) != os.path.getsize(engine_path):
+            mismatches.append("size")
+        return mismatches
+
+    def store(self, built_path: str, spec: EngineSpec) -> str:
+        """Move a built engine into the cache and write its manifest"""
+        os.makedirs(self._cache_dir, exist_ok=True)
+        engine_path = self.path(spec)
+        if os.path.abspath(built_path) != os.path.abspath(engine_path):
+            os.replace(built_path, engine_path)
+        manifest = asdict(spec)
+        manifest.pop("onnx_file")
+        manifest["size"] = os.path.getsize(engine_path)
+        temp_path = engine_path + ".json.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(temp_path, engine_path + ".json")
+        logger.info(f"Engine {engine_path} cached")
+        return engine_path
+
+    def stale(self, spec: EngineSpec) -> List[str]:
+        """Cached engines of the same model, batch size and precision built with another key"""
+        current = self.path(spec)
+        pattern = f"{os.path.basename(spec.onnx_file)}_b{spec.batch_size}_{spec.precision}_*.engine"
+        return [p for p in sorted(glob.glob(os.path.join(glob.escape(self._cache_dir), pattern))) if p != current]
+
+
+def build_engine(spec: EngineSpec, engine_path: str, plugin_libraries: Optional[List[str]] = None, workspace_size: Optional[int] = None):
+    """Build the engine of a spec with TensorRT the way nvinfer does for an explicit batch
+
+    The batch dimension of the inputs is optimized for 1 to the batch size, the other
+    dimensions must be static.
+    """
+    import ctypes
+    import tensorrt as trt
+    if spec.precision == "int8":
+        raise ValueError("int8 engines need the nvinfer calibration and are built when the service starts")
+    trt_logger = trt.Logger(trt.Logger.WARNING)
+    for library in plugin_libraries or []:
+        ctypes.CDLL(library)
+    trt.init_libnvinfer_plugins(trt_logger, "")
+    builder = trt.Builder(trt_logger)
+    flags = 0
+    if int(trt.__version__.split(".")[0]) < 10:
+        flags = 1 << int(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH)
+    network = builder.create_network(flags)
+    parser = trt.OnnxParser(network, trt_logger)
+    if not parser.parse_from_file(spec.onnx_file):
+        errors = [str(parser.get_error(i)) for i in range(parser.num_errors)]
+        raise Exception(f"Failed to parse {spec.onnx_file}: {errors}")
+    config = builder.create_builder_config()
+    if spec.precision == "fp16":
+        config.set_flag(trt.BuilderFlag.FP16)
+    if workspace_size:
+        # nvinfer takes the workspace size in MB
+        config.set_memory_pool_limit(trt.MemoryPoolType.WORKSPACE, workspace_size << 20)
+    profile = builder.create_optimization_profile()
+    for i in range(network.num_inputs):
+        tensor = network.get_input(i)
+        shape = list(tensor.shape)
+        if any(d < 0 for d in shape[1:]):
+            raise ValueError(f"Input {tensor.name} of {spec.onnx_file} has dynamic dimensions {shape} other than the batch")
+        profile.set_shape(tensor.name, [1] + shape[1:], [spec.batch_size] + shape[1:], [spec.batch_size] + shape[1:])
+    config.add_optimization_profile(profile)
+    serialized = builder.build_serialized_network(network, config)
+    if serialized is None:
+        raise Exception(f"Failed to build the engine of {spec.onnx_file}")
+    temp_path = engine_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(serialized)
+    os.replace(temp_path, engine_path)
+
+
+def prebuild_engines(cache: EngineCache, config_paths: List[str], batch_size: int, device_id: int = 0) -> List[str]:
+    """Build and cache the engines of the infer configs which aren't cached yet"""
+    engines = []
+    for config_path in config_paths:
+        spec = cache.spec(config_path, batch_size, device_id)
+        if spec is None:
+            logger.info(f"{config_path} has no onnx-file, skipped")
+            continue
+        engine_path = cache.lookup(spec)
+        if engine_path is None:
+            property = read_infer_property(config_path)
+            base_dir = os.path.dirname(os.path.abspath(config_path))
+            libraries = [property["custom-lib-path"]] if property.get("custom-lib-path", None) else []
+            libraries = [p if os.path.isabs(p) else os.path.join(base_dir, p) for p in libraries]
+            os.makedirs(cache.cache_dir, exist_ok=True)
+            built_path = cache.path(spec)
+            logger.info(f"Building the engine of {spec.onnx_file} for batch size {batch_size} in {spec.precision}")
+            build_engine(spec, built_path, libraries, property.get("workspace-size", None))
+            engine_path = cache.store(built_path, spec)
+        else:
+            logger.info(f"Engine {engine_path} is up to date")
+        engines.append(engine_path)
+    return engines
@@ -15,27 +15,31 @@
 
 
 import base64
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 import os
 import types
 import threading
 from queue import Queue, Empty
 from abc import ABC, abstractmethod
 from config import global_config
-from .utils import get_logger, split_tensor_in_dict
+from .utils import get_logger, split_tensor_in_dict, LazyTensorSummary, configure_logging
 from .codec import ImageDecoder
+from .cache import TensorCache, content_key
+from .warmup import WarmupPlan
+from .devices import DeviceScheduler, device_scope, model_device_ids
 import custom
 from omegaconf import OmegaConf
-from dataclasses import dataclass
-from typing import Dict, List, Tuple, Union
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple, Union
 import numpy as np
-from collections import namedtuple
+from collections import namedtuple, OrderedDict, deque
 import json
 from pyservicemaker import Pipeline, as_tensor
 from pyservicemaker.utils import MediaExtractor, MediaChunk
 import torch
 from .asset_manager import AssetManager
 import time
+import uuid
 
 logger = get_logger(__name__)
 
@@ -108,6 +112,8 @@ torch_datatype_mapping = {
 @dataclass
 class Error:
     message: str
+    # the request the error belongs to, if known
+    request_id: Optional[str] = None
 
     def __bool__(self):
         return False
@@ -115,10 +121,69 @@ class Error:
 @dataclass
 class Stop:
     reason: str
+    # the request the stop ends, if known
+    request_id: Optional[str] = None
 
     def __bool__(self):
         return False
 
+# reserved key for carrying the request context along with the tensors
+REQUEST_CONTEXT_KEY = "__request_context__"
+# reserved key for carrying the digests of the encoded inputs, e.g. base64 images or asset urls
+CONTENT_DIGEST_KEY = "__content_digest__"
+
+@dataclass
+class RequestContext:
+    """Per-request states carried with the data through the inference flow"""
+    request_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    # absolute deadline in time.monotonic() seconds, None for no deadline
+    deadline: Optional[float] = None
+    # external cancellation check, e.g. request.is_cancelled from triton
+    is_cancelled: Optional[Callable[[], bool]] = None
+    # priority class and tenant tags used by the request scheduler
+    priority: Optional[str] = None
+    tenant: Optional[str] = None
+    # whether the client consumes partial results as they are generated
+    streaming: bool = False
+    # device the request is placed on, see DeviceScheduler
+    device_id: Optional[int] = None
+    _cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @classmethod
+    def create(cls, timeout: Optional[float] = None, is_cancelled: Optional[Callable[[], bool]] = None, **kwargs):
+        deadline = time.monotonic() + timeout if timeout and timeout > 0 else None
+        return cls(deadline=deadline, is_cancelled=is_cancelled, **kwargs)
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._cancel_event.is_set():
+            return True
+        if self.is_cancelled is not None and self.is_cancelled():
+            self._cancel_event.set()
+            return True
+        return False
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    @property
+    def done(self) -> bool:
+        return self.cancelled or self.expired
+
+    @property
+    def reason(self) -> str:
+        return "cancelled" if self.cancelled else "deadline exceeded" if self.expired else ""
+
+_current = threading.local()
+
+def current_request_context() -> Optional[RequestContext]:
+    """The context of the request being processed by the model backend on this thread"""
+    return getattr(_current, "context", None)
+
 Path = namedtuple('Path', ['source', 'target'])
 Route = namedtuple('Route', ['model', 'data'])
 
@@ -138,21 +203,33 @@ class DataFlow:
         self._outbound = outbound
         self._timeout = timeout
         self._queue = Queue()
+        # callbacks notified whenever an item is deposited, see FlowSelector
+        self._listeners: List[Callable[["DataFlow"], None]] = []
+        # lookup tables compiled once from the configs, so that per-item
+        # processing doesn't need to traverse the config list again
+        self._config_map = {config["name"]: config for config in configs} if configs else {}
+        self._required_names = [
+            name for name, config in self._config_map.items() if not config.get("optional", False)
+        ]
+        self._custom_data_types = {}
+        if self._inbound or self._outbound:
+            for i_name, _ in self._tensor_names:
+                config = self._config_map.get(i_name, None)
+                if config and not config["data_type"] in np_datatype_mapping:
+                    self._custom_data_types[i_name] = config["data_type"]
         self._optional = False
         if self._inbound or self._outbound:
-            self._optional = all([
-                config["optional"] if "optional" in config else False
-                for config in self._configs
-            ])
+            self._optional = not self._required_names
+        self._digest_enabled = False
 
     def _process_custom_data(self, tensor: np.ndarray, data_type: str):
         processed = tensor
         if self._inbound:
             if data_type == "TYPE_CUSTOM_BINARY_URLS":
-                logger.debug(f"DataFlow _process_custom_data: {data_type}")
+                logger.debug("DataFlow _process_custom_data: %s", data_type)
                 processed = [input for input in tensor]
             elif data_type == "TYPE_CUSTOM_BINARY_BASE64":
-                logger.debug(f"DataFlow _process_custom_data: {data_type}")
+                logger.debug("DataFlow _process_custom_data: %s", data_type)
                 processed = []
                 for input in tensor:
                     if isinstance(input, np.bytes_) or isinstance(input, bytes):
@@ -165,15 +242,13 @@ class DataFlow:
 
     def _is_collected_valid(self, collected: Dict):
         if not collected:
-            logger.info(f"No data collected from the dataflow: {self.in_names}")
+            logger.info("No data collected from the dataflow: %s", self.in_names)
             return False
         # check output data integrity
         if self._outbound:
-            for config in self._configs:
-                name = config["name"]
-                optional = "optional" in config and config["optional"]
-                if name not in collected and not optional:
-                    logger.error(f"{name} is not optional and not found from the dataflow output configs!")
+            for name in self._required_names:
+                if name not in collected:
+                    logger.error("%s is not optional and not found from the dataflow output configs!", name)
                     return False
         return True
 
@@ -190,42 +265,51 @@ class DataFlow:
         return self._optional
 
     def get_config(self, name: str):
-        if not self._configs:
-            return None
-        return next((config for config in self._configs if config["name"] == name), None)
+        return self._config_map.get(name, None)
+
+    def enable_digest(self):
+        """Attach the digests of the encoded custom data to the collected items
+
+        The digest of an encoded image or an asset url with its frame range is much cheaper
+        than the one of the decoded tensors, and it is used to key the result cache.
+        """
+        self._digest_enabled = True
 
     def put(self, item: Union[Dict, Error, Stop]):
         if not item:
             # pass Error or Stop to the downstream
-            self._queue.put(item, timeout=self._timeout)
+            self._deposit(item, timeout=self._timeout)
             return
         # check input data integrity
         if self._inbound:
-            for config in self._configs:
-                name = config["name"]
-                optional = "optional" in config and config["optional"]
-                if name not in item and not optional:
-                    logger.error(f"{name} is not optional and not found from the dataflow input configs!")
+            for name in self._required_names:
+                if name not in item:
+                    logger.error("%s is not optional and not found from the dataflow input configs!", name)
                     return
         # collect data and deposit it to the queue
         collected = {}
+        digests = {}
         for i_name, o_name in self._tensor_names:
             if i_name not in item:
                 continue
             tensor = item[i_name]
             # handling custom data type
-            if self._inbound or self._outbound:
-                config = self.get_config(i_name)
-                if config and not config["data_type"] in np_datatype_mapping and isinstance(tensor, np.ndarray):
-                    collected[o_name] = self._process_custom_data(tensor, config["data_type"])
-                else:
-                    collected[o_name] = tensor
+            data_type = self._custom_data_types.get(i_name, None)
+            if data_type is not None and isinstance(tensor, np.ndarray):
+                if self._digest_enabled:
+                    digests[o_name] = content_key({o_name: tensor})
+                collected[o_name] = self._process_custom_data(tensor, data_type)
             else:
                 collected[o_name] = tensor
         # check output data integrity
         if not self._is_collected_valid(collected):
-            logger.warning(f"Invalid data collected from the dataflow: {self.in_names}, data: {collected}, ignored")
+            logger.warning("Invalid data collected from the dataflow: %s, data: %s, ignored", self.in_names, LazyTensorSummary(collected))
             return
+        # carry the request context along with the data
+        if REQUEST_CONTEXT_KEY in item:
+            collected[REQUEST_CONTEXT_KEY] = item[REQUEST_CONTEXT_KEY]
+        if digests:
+            collected[CONTENT_DIGEST_KEY] = digests
 
         #  deposit the collected data to the queue
         generators = {}
@@ -238,18 +322,38 @@ class DataFlow:
         if generators:
             keys = list(generators.keys())
             generators = list(generators.values())
+            if CONTENT_DIGEST_KEY in values:
+                # each generated item differs from the encoded input
+                values[CONTENT_DIGEST_KEY] = {
+                    k: v for k, v in values[CONTENT_DIGEST_KEY].items() if k not in keys
+                }
             for vs in zip(*generators):
                 result = dict(zip(keys, vs))
                 result.update(values)
-                self._queue.put(result, timeout=self._timeout)
+                self._deposit(result, timeout=self._timeout)
         else:
-            self._queue.put(values, timeout=self._timeout)
+            self._deposit(values, timeout=self._timeout)
 
     def get(self):
         return self._queue.get(timeout=self._timeout)
 
+    def get_nowait(self):
+        return self._queue.get_nowait()
+
+    def empty(self):
+        return self._queue.empty()
+
+    def add_listener(self, listener: Callable[["DataFlow"], None]):
+        """Register a callback invoked after each item is deposited to the flow"""
+        self._listeners.append(listener)
+
     def stop(self):
-        self._queue.put(Stop("Shutdown"))
+        self._deposit(Stop("Shutdown"))
+
+    def _deposit(self, item, timeout=None):
+        self._queue.put(item, timeout=timeout)
+        for listener in self._listeners:
+            listener(self)
 
     def parse_asset_string(self, asset: str):
         pieces = asset.split("?")
@@ -271,19 +375,19 @@ class VideoInputDataFlow(DataFlow):
         self._video_tensor_type = key_tensor_type
         self._video_tensor_names = []
         for tensor_name in tensor_names:
-            config = next((c for c in configs if c["name"] == tensor_name[0]), None)
+            config = self.get_config(tensor_name[0])
             if config and config["data_type"] == key_tensor_type:
                 self._video_tensor_names.append(tensor_name[1])
 
     def _process_custom_data(self, tensor: np.ndarray, data_type: str):
-        logger.debug(f"LiveStreamDataFlow._process_custom_data: {data_type}")
+        logger.debug("LiveStreamDataFlow._process_custom_data: %s", data_type)
         if data_type == self._video_tensor_type:
             return self._process_live_stream(tensor)
         else:
             return super()._process_custom_data(tensor, data_type)
 
     def _process_live_stream(self, assets: np.ndarray):
-        logger.debug(f"LiveStreamDataFlow._process_live_stream: {assets}")
+        logger.debug("LiveStreamDataFlow._process_live_stream: %s", LazyTensorSummary(assets))
         media_chunks = []
         results = []
         for asset in assets:
@@ -302,7 +406,7 @@ class VideoInputDataFlow(DataFlow):
                     interval=interval
                 ))
             else:
-                logger.error(f"Asset not found: {asset_id}")
+                logger.error("Asset not found: %s", asset_id)
                 return results
         with MediaExtractor(media_chunks, n_thread=1) as media_extractor:
             qs = media_extractor()
@@ -338,14 +442,14 @@ class VideoFrameSamplingDataFlow(DataFlow):
         self._video_tensor_type = key_tensor_type
         self._video_tensor_names = []
         for tensor_name in tensor_names:
-            config = next((c for c in configs if c["name"] == tensor_name[0]), None)
+            config = self.get_config(tensor_name[0])
             if config and config["data_type"] == key_tensor_type:
                 self._video_tensor_names.append(tensor_name[1])
         self._media_extractor()
         logger.info(f"VideoFrameSamplingDataFlow initialized")
 
     def _process_custom_data(self, tensor: np.ndarray, data_type: str):
-        logger.debug(f"VideoFrameSamplingDataFlow._process_custom_data: {data_type}")
+        logger.debug("VideoFrameSamplingDataFlow._process_custom_data: %s", data_type)
         if data_type == self._video_tensor_type:
             return self._do_video_frame_sampling(tensor)
         else:
@@ -373,7 +477,7 @@ class VideoFrameSamplingDataFlow(DataFlow):
                 qs.append(self._media_extractor.append(chunk))
                 expected_frames.append(int(n_frames) if n_frames else None)
             else:
-                logger.error(f"Asset not found: {asset_id}")
+                logger.error("Asset not found: %s", asset_id)
                 return results
 
         for q, expected in zip(qs, expected_frames):
@@ -382,17 +486,17 @@ class VideoFrameSamplingDataFlow(DataFlow):
                 try:
                     frame = q.get(timeout=10.0)
                 except Empty:
-                    logger.info(f"Decoder Queue is empty: {assets}")
+                    logger.info("Decoder Queue is empty: %s", LazyTensorSummary(assets))
                     break
                 if frame is None:
-                    logger.info(f"Duration reached: {assets}")
+                    logger.info("Duration reached: %s", LazyTensorSummary(assets))
                     break
                 frames.append(frame.tensor)
                 if expected is not None and len(frames) == expected:
-                    logger.info(f"Got all {len(frames)} frames, dropping the rest")
+                    logger.info("Got all %s frames, dropping the rest", len(frames))
                     break
             if expected is not None and len(frames) < expected:
-                logger.warning(f"Expected {expected} frames, but got {len(frames)}")
+                logger.warning("Expected %s frames, but got %s", expected, len(frames))
             results.append(frames)
         return results
 
@@ -410,19 +514,41 @@ class VideoFrameSamplingDataFlow(DataFlow):
 
 class ImageInputDataFlow(DataFlow):
     """A data flow for image data"""
-    def __init__(self, configs: List[Dict], tensor_names: List[Tuple[str, str]], key_tensor_type: str,timeout=None):
+    def __init__(
+        self,
+        configs: List[Dict],
+        tensor_names: List[Tuple[str, str]],
+        key_tensor_type: str,
+        timeout=None,
+        device_scheduler: Optional[DeviceScheduler] = None
+    ):
         super().__init__(configs, tensor_names, True, False, timeout)
-        self._image_decoder = ImageDecoder(["JPEG", "PNG"])
+        # the images are decoded on the device the request is placed on
+        self._device_scheduler = device_scheduler or DeviceScheduler([0])
+        self._image_decoders = {
+            d: ImageDecoder(["JPEG", "PNG"], d) for d in self._device_scheduler.device_ids
+        }
+        self._local = threading.local()
         self._image_tensor_names = []
         for tensor_name in tensor_names:
-            config = next((c for c in configs if c["name"] == tensor_name[0]), None)
+            config = self.get_config(tensor_name[0])
             if config and config["data_type"] == key_tensor_type:
                 self._image_tensor_names.append(tensor_name[1])
         if not self._image_tensor_names:
             raise Exception("Image tensor name not found in the ImageInputDataFlow")
 
+    @property
+    def _image_decoder(self):
+        device_id = getattr(self._local, "device_id", None)
+        return self._image_decoders.get(device_id, None) or next(iter(self._image_decoders.values()))
+
+    def put(self, item: Union[Dict, Error, Stop]):
+        if item:
+            self._local.device_id = self._device_scheduler.place(item.get(REQUEST_CONTEXT_KEY, None))
+        super().put(item)
+
     def _process_custom_data(self, images: np.ndarray, data_type: str):
-        logger.debug(f"ImageInputDataFlow._process_custom_data: {data_type}")
+        logger.debug("ImageInputDataFlow._process_custom_data: %s", data_type)
         if self._image_decoder is None:
             return Error("Image decoder is not sucessfully created")
         if data_type == "TYPE_CUSTOM_IMAGE_BASE64":
@@ -444,7 +570,7 @@ class ImageInputDataFlow(DataFlow):
             if isinstance(image, np.bytes_) or isinstance(image, bytes):
                 image = image.decode()
             elif not isinstance(image, np.str_):
-                logger.error(f"base64 image must be bytes or string: {type(image)}")
+                logger.error("base64 image must be bytes or string: %s", type(image))
                 continue
             data_prefix, data_payload = image.split(",")
             mime_type = data_prefix.split(";")[0].split(":")[1]
@@ -454,12 +580,12 @@ class ImageInputDataFlow(DataFlow):
             elif mime_type == "image/png":
                 format = "PNG"
             else:
-                logger.error(f"Unsupported image format: {mime_type}")
+                logger.error("Unsupported image format: %s", mime_type)
                 continue
             data_payload = base64.b64decode(data_payload)
             tensor = as_tensor(np.frombuffer(data_payload, dtype=np.uint8).copy(), format)
             result.append(self._image_decoder.decode(tensor, format))
-        logger.debug(f"ImageInputDataFlow._process_base64_image generates {len(result)} tensors")
+        logger.debug("ImageInputDataFlow._process_base64_image generates %d tensors", len(result))
         return result
 
     def _process_image_assets(self, assets: np.ndarray):
@@ -468,7 +594,7 @@ class ImageInputDataFlow(DataFlow):
             asset_manager = AssetManager()
             asset = asset_manager.get_asset(asset)
             if not asset:
-                logger.error(f"Asset not found: {asset}")
+                logger.error("Asset not found: %s", asset)
                 continue
             format = None
             if asset.mime_type == "image/jpeg" or asset.mime_type == "image/jpg":
@@ -476,7 +602,7 @@ class ImageInputDataFlow(DataFlow):
             elif asset.mime_type == "image/png":
                 format = "PNG"
             else:
-                logger.error(f"Unsupported image format: {asset.mime_type}")
+                logger.error("Unsupported image format: %s", asset.mime_type)
                 continue
             with open(asset.path, "rb") as f:
                 data = f.read()
@@ -505,6 +631,11 @@ class ModelBackend(ABC):
     def model_home(self):
         return self._model_home
 
+    @property
+    def max_concurrency(self):
+        """Number of requests the backend can serve at the same time from different threads"""
+        return 1
+
     @abstractmethod
     def __call__(self, *args, **kwargs):
         raise Exception("Not Implemented")
@@ -512,13 +643,51 @@ class ModelBackend(ABC):
     def stop(self):
         logger.info(f'Backend for {self._model_config["name"]} stopped')
 
+class MultiDeviceBackend(ModelBackend):
+    """The backends of a model on several devices, each request runs on the device it is placed on"""
+    def __init__(self, backends: List[ModelBackend], device_scheduler: DeviceScheduler):
+        super().__init__(backends[0]._model_config, backends[0].model_home, backends[0].device_id)
+        self._backends = {b.device_id: b for b in backends}
+        self._device_scheduler = device_scheduler
+        # each backend serves up to its own concurrency
+        self._slots = {b.device_id: threading.Semaphore(b.max_concurrency) for b in backends}
+        logger.info(f'Backend for {self._model_config["name"]} placed on devices {list(self._backends.keys())}')
+
+    @property
+    def backends(self) -> List[ModelBackend]:
+        return list(self._backends.values())
+
+    @property
+    def max_concurrency(self):
+        return sum(b.max_concurrency for b in self._backends.values())
+
+    def __call__(self, *args, **kwargs):
+        device_id = getattr(_current, "device_id", None)
+        if device_id not in self._backends:
+            device_id = self._device_scheduler.place(current_request_context())
+        with self._slots[device_id], self._device_scheduler.running(device_id), device_scope(device_id):
+            yield from self._backends[device_id](*args, **kwargs)
+
+    def stop(self):
+        for backend in self._backends.values():
+            backend.stop()
+
+
+def create_backend(backend_class: type, model_config: Dict, model_home: str, device_scheduler: DeviceScheduler) -> ModelBackend:
+    """A backend of the model on each of its devices, the requests are spread across them"""
+    backends = [
+        backend_class(model_config=model_config, model_home=model_home, device_id=device_id)
+        for device_id in device_scheduler.device_ids
+    ]
+    return backends[0] if len(backends) == 1 else MultiDeviceBackend(backends, device_scheduler)
+
 class Processor(ABC):
-    def __init__(self, config: Dict, model_home: str):
+    def __init__(self, config: Dict, model_home: str, device_id: int = 0):
         self._name = config['name']
         self._kind = config['kind'] if 'kind' in config else 'auto'
         self._input = config['input'] if 'input' in config else []
         self._output = config['output'] if 'output' in config else []
-        self._config = { 'device_id': 0, 'model_home': model_home }
+        self._config = { 'device_id': device_id, 'model_home': model_home }
         if 'config' in config:
             self._config.update(config['config'])
         self._name = config['name']
@@ -550,8 +719,8 @@ class Processor(ABC):
 
 class AutoProcessor(Processor):
     """AutoPrrocessor loads the preprocessor from pretrained"""
-    def __init__(self, config: Dict, model_home: str):
-        super().__init__(config, model_home)
+    def __init__(self, config: Dict, model_home: str, device_id: int = 0):
+        super().__init__(config, model_home, device_id)
         import transformers
         self._processor = transformers.AutoProcessor.from_pretrained(model_home)
         if self._processor is None:
@@ -563,8 +732,8 @@ class AutoProcessor(Processor):
 
 class CustomProcessor(Processor):
     """CustomProcessor loads the processor from custom module"""
-    def __init__(self, config: Dict, model_home: str):
-        super().__init__(config, model_home)
+    def __init__(self, config: Dict, model_home: str, device_id: int = 0):
+        super().__init__(config, model_home, device_id)
         if not hasattr(custom, "create_instance"):
             logger.error("Custom processor module not valid!!")
             raise ValueError("Custom processor module not valid!!")
@@ -582,62 +751,216 @@ class CustomProcessor(Processor):
 
 class Collector(ABC):
     """Collector is an interface for collecting data from the data flow"""
+    def __init__(self):
+        self._n_dropped = 0
+
+    @property
+    def n_dropped(self):
+        """Number of items dropped because the request expired or was cancelled"""
+        return self._n_dropped
+
     def collect(self):
         raise NotImplementedError("Not implemented")
 
     def stop(self):
         raise NotImplementedError("Not implemented")
 
+    def _screen(self, data):
+        """Replace the data of an expired or cancelled request with an Error"""
+        if not data:
+            return data
+        context = data.get(REQUEST_CONTEXT_KEY, None)
+        if context is None or not context.done:
+            return data
+        self._n_dropped += 1
+        logger.info("Request %s dropped by %s: %s", context.request_id, self.__class__.__name__, context.reason)
+        return Error(f"Request {context.request_id} dropped: {context.reason}", context.request_id)
+
 class SingleFlowCollector(Collector):
     """SingleFlowCollector is a collector for a single data flow"""
     def __init__(self, data_flow: DataFlow):
+        super().__init__()
         self._data_flow = data_flow
 
     def collect(self):
-        return self._data_flow.get()
+        return self._screen(self._data_flow.get())
 
     def stop(self):
         pass
 
-class AggregationFlowCollector(Collector):
-    """AggregationFlowCollector is a collector aggregating multiple data flows"""
+class FlowSelector:
+    """FlowSelector lets a single thread wait on multiple data flows without polling
+
+    The data flows notify the selector whenever an item is deposited, and the waiting
+    thread is woken up only when one of the flows it waits on has data or the selector
+    is closed. Each data flow must have no other consumers.
+    """
     def __init__(self, data_flows: List[DataFlow]):
         self._data_flows = data_flows
+        self._condition = threading.Condition()
+        self._closed = False
+        self._next = 0
+        for data_flow in data_flows:
+            data_flow.add_listener(self._notify)
+
+    def _notify(self, data_flow: DataFlow):
+        with self._condition:
+            self._condition.notify_all()
+
+    def select(self, indices: Optional[List[int]] = None, timeout: Optional[float] = None) -> Optional[int]:
+        """Wait until one of the given data flows has data and return its index
+
+        The flows are scanned round robin so that no flow starves the others.
+        None is returned if the selector is closed or the wait times out.
+        """
+        if indices is None:
+            indices = range(len(self._data_flows))
+        n = len(self._data_flows)
+        ready = None
+        def find_ready():
+            nonlocal ready
+            for offset in range(n):
+                i = (self._next + offset) % n
+                if i in indices and not self._data_flows[i].empty():
+                    ready = i
+                    return True
+            return self._closed
+        with self._condition:
+            if not self._condition.wait_for(find_ready, timeout) or self._closed:
+                return None
+            self._next = (ready + 1) % n
+            return ready
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+class _JoinEntry:
+    """Partial data of a request being joined from multiple data flows"""
+    def __init__(self, n_flows: int):
+        self.parts = [deque() for _ in range(n_flows)]
+        self.ends: List[Union[Stop, Error, None]] = [None] * n_flows
+        self.created = time.monotonic()
+
+class AggregationFlowCollector(Collector):
+    """AggregationFlowCollector is a collector aggregating multiple data flows
+
+    The data from the flows are joined by request id, so that the upstream branches
+    of a request can complete in any order. The k-th item of a request from each flow
+    are merged into the k-th result, and a single Stop, or an Error if any of the flows
+    ended in error, closes the request once all the flows ended it. A flow ending in error
+    is done with the request, and its Stop following the Error is ignored.
+    A request is evicted with an Error if it can't be joined within the timeout, or if
+    the join buffer is full when a new request arrives. A request closed with an Error is
+    always followed by its Stop, and whatever arrives late for a closed request is discarded.
+    """
+    def __init__(self, data_flows: List[DataFlow], timeout: Optional[float] = None, max_pending: int = 64):
+        super().__init__()
+        self._data_flows = data_flows
+        self._timeout = timeout
+        self._max_pending = max_pending
+        self._selector = FlowSelector(data_flows)
         self._executor = ThreadPoolExecutor(max_workers=1)
         self._queue = Queue()
         self._stop_event = threading.Event()
+        # request id -> partial data of the request, in arrival order
+        self._pending: "OrderedDict[Optional[str], _JoinEntry]" = OrderedDict()
+        # recently closed or evicted requests whose late arrivals must be discarded
+        self._closed: "OrderedDict[str, None]" = OrderedDict()
+        # the last request seen from each flow, the owner of an untagged Stop or Error
+        self._last_ids: List[Optional[str]] = [None] * len(data_flows)
         self._futures = self._executor.submit(self._collect)
 
     def collect(self):
-        return self._queue.get()
+        return self._screen(self._queue.get())
+
+    @property
+    def n_pending(self):
+        return len(self._pending)
 
     def _collect(self):
         logger.info(f"AggregationFlowCollector starts collecting data")
         while not self._stop_event.is_set():
+            index = self._selector.select(timeout=self._next_expiry())
+            self._expire()
+            if index is None:
+                continue
+            data = self._data_flows[index].get_nowait()
+            if isinstance(data, Error) or isinstance(data, Stop):
+                request_id = data.request_id if data.request_id is not None else self._last_ids[index]
+            else:
+                context = data.get(REQUEST_CONTEXT_KEY, None)
+                request_id = context.request_id if context is not None else None
+                self._last_ids[index] = request_id
+            if request_id is not None and request_id in self._closed:
+                logger.debug("Late data of closed request %s from %s discarded", request_id, self._data_flows[index].in_names)
+                continue
+            entry = self._pending.get(request_id, None)
+            if entry is None:
+                if len(self._pending) >= self._max_pending:
+                    oldest = next(iter(self._pending))
+                    self._evict(oldest, f"Join buffer is full, request {oldest} evicted")
+                entry = self._pending[request_id] = _JoinEntry(len(self._data_flows))
+            if isinstance(data, Error) or isinstance(data, Stop):
+                # the Stop following an Error doesn't overwrite it
+                if not isinstance(entry.ends[index], Error):
+                    entry.ends[index] = data
+            else:
+                entry.parts[index].append(data)
+            self._join(request_id, entry)
+
+    def _join(self, request_id: Optional[str], entry: _JoinEntry):
+        # emit the results that have data from all the flows
+        while all(entry.parts):
             result = {}
-            completed = []
-            for data_flow in self._data_flows:
-                # continue reading from each data flow until we get some data
-                while not self._stop_event.is_set():
-                    try:
-                        data = data_flow.get()
-                        if isinstance(data, Error) or isinstance(data, Stop):
-                            completed.append(data)
-                        else:
-                            result.update(data)
-                        break
-                    except Empty:
-                        continue
-            if result:
-                self._queue.put(result)
-            if all([isinstance(c, Stop) for c in completed]):
-                self._queue.put(Stop("All data flows completed"))
-            elif any([isinstance(c, Error) for c in completed]):
-                self._queue.put(Error("One or more data flows ended in error"))
+            for part in entry.parts:
+                result.update(part.popleft())
+            self._queue.put(result)
+        if not all(end is not None for end in entry.ends):
+            return
+        if any(entry.parts):
+            logger.warning("Request %s ended with unmatched data from %s, discarded", request_id,
+                [f.in_names for f, part in zip(self._data_flows, entry.parts) if part])
+        self._close(request_id)
+        if any(isinstance(end, Error) for end in entry.ends):
+            messages = "; ".join(end.message for end in entry.ends if isinstance(end, Error))
+            self._queue.put(Error(f"One or more data flows ended in error: {messages}", request_id))
+            self._queue.put(Stop("Request ended in error", request_id))
+        else:
+            self._queue.put(Stop("All data flows completed", request_id))
+
+    def _evict(self, request_id: Optional[str], message: str):
+        logger.error(message)
+        self._close(request_id)
+        self._queue.put(Error(message, request_id))
+        self._queue.put(Stop("Request evicted", request_id))
+
+    def _close(self, request_id: Optional[str]):
+        self._pending.pop(request_id, None)
+        if request_id is not None:
+            self._closed[request_id] = None
+            while len(self._closed) > self._max_pending * 4:
+                self._closed.popitem(last=False)
+
+    def _next_expiry(self):
+        if self._timeout is None or not self._pending:
+            return None
+        oldest = next(iter(self._pending.values()))
+        return max(0.0, oldest.created + self._timeout - time.monotonic())
+
+    def _expire(self):
+        if self._timeout is None:
+            return
+        now = time.monotonic()
+        expired = [k for k, e in self._pending.items() if now - e.created >= self._timeout]
+        for request_id in expired:
+            self._evict(request_id, f"Request {request_id} not joined within {self._timeout} seconds")
 
     def stop(self):
         logger.info(f"AggregationFlowCollector destructing...")
         self._stop_event.set()
+        self._selector.close()
         for data_flow in self._data_flows:
             data_flow.stop()
         self._executor.shutdown(wait=True)
@@ -645,53 +968,51 @@ class AggregationFlowCollector(Collector):
         logger.info(f"AggregationFlowCollector destructed")
 
 class MultiFlowCollector(Collector):
-    """MultiFlowCollector is a collector for multiple data flows"""
+    """MultiFlowCollector is a collector for multiple data flows
+
+    Once a data flow starts delivering data, it owns the output until it ends
+    with a Stop or an Error, and the other data flows wait for their turn.
+    """
     def __init__(self, data_flows: List[DataFlow]):
+        super().__init__()
         self._data_flows = data_flows
-        self._executor = ThreadPoolExecutor(max_workers=len(data_flows))
+        self._selector = FlowSelector(data_flows)
+        self._executor = ThreadPoolExecutor(max_workers=1)
         self._queue = Queue()
         self._stop_event = threading.Event()
-        self._futures = [self._executor.submit(self._poll, i) for i in range(len(self._data_flows))]
-        self._condition = threading.Condition()
-        self._active_flow = -1
+        self._futures = self._executor.submit(self._collect)
 
     def collect(self):
-        return self._queue.get()
+        return self._screen(self._queue.get())
 
-    def _poll(self, index: int):
-        logger.info(f"Start polling data flow {self._data_flows[index].in_names}")
-        data_flow = self._data_flows[index]
-        n_data = 0
+    def _collect(self):
+        logger.info(f"Start collecting data flows {[f.in_names for f in self._data_flows]}")
+        n_data = [0] * len(self._data_flows)
+        active_flow = -1
         while not self._stop_event.is_set():
-            try:
-                data = data_flow.get()
-                is_stop = isinstance(data, Error) or isinstance(data, Stop)
-                if is_stop and n_data == 0:
-                    # empty data flow, skip it
-                    logger.info(f"Empty data flow {data_flow.in_names}, skip it")
-                    continue
-                elif not is_stop:
-                    n_data += 1
-                # try grabbing the queue
-                with self._condition:
-                    while self._active_flow != index and self._active_flow != -1:
-                        self._condition.wait()
-                    if self._active_flow == -1:
-                        self._active_flow = index
-                self._queue.put(data)
-                with self._condition:
-                    if isinstance(data, Error) or isinstance(data, Stop):
-                        logger.info(f"Data flow {data_flow.in_names} ended in: {data}")
-                        self._active_flow = -1
-                        n_data = 0
-                        self._condition.notify_all()
-            except Empty:
+            index = self._selector.select(None if active_flow == -1 else [active_flow])
+            if index is None:
+                break
+            data_flow = self._data_flows[index]
+            data = data_flow.get_nowait()
+            is_stop = isinstance(data, Error) or isinstance(data, Stop)
+            if is_stop and n_data[index] == 0:
+                # empty data flow, skip it
+                logger.info(f"Empty data flow {data_flow.in_names}, skip it")
                 continue
-
+            elif not is_stop:
+                n_data[index] += 1
+                active_flow = index
+            self._queue.put(data)
+            if is_stop:
+                logger.info("Data flow %s ended in: %s", data_flow.in_names, data)
+                active_flow = -1
+                n_data[index] = 0
 
     def stop(self):
         logger.info(f"MultiFlowCollector destructing...")
         self._stop_event.set()
+        self._selector.close()
         for data_flow in self._data_flows:
             data_flow.stop()
         self._executor.shutdown(wait=True)
@@ -706,12 +1027,43 @@ class ModelOperator:
         self._in: List[DataFlow] = []
         self._out: List[DataFlow] = []
         self._running = False
-        self._preprocessors = []
-        self._postprocessors = []
+        # device id -> pre and post processors created on the device
+        self._preprocessors: Dict[int, List[Processor]] = {}
+        self._postprocessors: Dict[int, List[Processor]] = {}
+        self._processors_created = False
         self._model_config = model_config
         self._backend = None
         self._stop_event = threading.Event()
         self._collector = None
+        self._n_dropped = 0
+        # workers running the backend when it serves multiple requests at the same time
+        self._workers = None
+        self._slots = None
+        self._inflight: Dict[Optional[str], Future] = {}
+        self._inflight_lock = threading.Lock()
+        # cache of the results keyed by the content of the inputs, e.g. the embeddings of an image
+        self._cache = None
+        self._cache_key = None
+        if model_config.get("cache", None):
+            cache_config = model_config["cache"]
+            self._cache = TensorCache(
+                device_budget=int(cache_config.get("device_memory", 0) * 2**20),
+                host_budget=int(cache_config.get("host_memory", 1024) * 2**20)
+            )
+            self._cache_key = cache_config.get("key", None)
+            logger.info(f"Result cache enabled on model {self._model_name} with {cache_config}")
+        # requests are spread across the devices of the model
+        self._device_scheduler = DeviceScheduler(model_device_ids(model_config))
+        # input lookup tables: name -> config and name -> numpy/torch data type
+        self._input_configs = {i["name"]: i for i in model_config["input"]}
+        self._input_np_types = {
+            n: np_datatype_mapping[c["data_type"]]
+            for n, c in self._input_configs.items() if c["data_type"] in np_datatype_mapping
+        }
+        self._input_torch_types = {
+            n: torch_datatype_mapping[c["data_type"]]
+            for n, c in self._input_configs.items() if c["data_type"] in torch_datatype_mapping
+        }
 
     @property
     def model_name(self):
@@ -725,10 +1077,25 @@ class ModelOperator:
     def inputs(self):
         return self._in.copy()
 
+    @property
+    def device_scheduler(self) -> DeviceScheduler:
+        return self._device_scheduler
+
+    @property
+    def n_dropped(self):
+        """Number of items dropped because the request expired or was cancelled"""
+        collector = self._collector
+        return self._n_dropped + (collector.n_dropped if collector is not None else 0)
+
     @property
     def outputs(self):
         return self._out.copy()
 
+    @property
+    def cache_stats(self) -> Optional[Dict]:
+        """Statistics of the result cache, None if the cache is not enabled"""
+        return self._cache.stats() if self._cache is not None else None
+
     def bind_input(self, configs: List[Dict], targets: List[str]=[]):
         if not targets:
             targets = [i['name'] for i in configs]
@@ -744,7 +1111,11 @@ class ModelOperator:
             flow = DataFlow(configs, tensor_names, inbound=True)
         else:
             # customized inbound data flow
-            flow = inbound_dataflow_mapping[image_tensor_type](configs, tensor_names, image_tensor_type)
+            flow_class = inbound_dataflow_mapping[image_tensor_type]
+            if flow_class is ImageInputDataFlow:
+                flow = flow_class(configs, tensor_names, image_tensor_type, device_scheduler=self._device_scheduler)
+            else:
+                flow = flow_class(configs, tensor_names, image_tensor_type)
         self._in.append(flow)
         logger.info(f"Data flow < {flow.in_names} -> {flow.o_names} > connected to model {self._model_name}")
         return flow
@@ -764,41 +1135,86 @@ class ModelOperator:
     def import_output(self, output: DataFlow):
         self._out.append(output)
 
+    def warmup(self, model_backend: ModelBackend):
+        """Run the batches of the warmup section through the processors and the backend"""
+        warmup_config = self._model_config.get("warmup", None)
+        if not warmup_config:
+            return
+        self._create_processors()
+        plan = WarmupPlan(
+            warmup_config,
+            self._model_config["input"],
+            self._input_np_types,
+            self._model_home,
+            self._model_config.get("preprocessors", [])
+        )
+        logger.info(f"Warming up model {self._model_name} with {plan.n_batches} batches")
+        start = time.perf_counter()
+        # every device of the model is warmed up
+        backends = model_backend.backends if isinstance(model_backend, MultiDeviceBackend) else [model_backend]
+        for backend in backends:
+            for batch_size, dynamic_size, items in plan.batches():
+                batch_start = time.perf_counter()
+                with device_scope(backend.device_id):
+                    processed, passthrough_tensors = self._preprocess(items, backend.device_id)
+                    if not processed:
+                        raise ValueError(f"Warmup of model {self._model_name} failed: the preprocessors returned no input for batch size {batch_size}")
+                    # a single item takes the implicit batching path like a regular request
+                    results = backend(**processed[0]) if batch_size == 1 else backend(*processed)
+                    for r in results:
+                        if isinstance(r, Error):
+                            raise Exception(f"Warmup of model {self._model_name} failed: {r.message}")
+                        for i, result in enumerate(r if isinstance(r, list) else [r]):
+                            if not isinstance(result, dict):
+                                continue
+                            if passthrough_tensors:
+                                result.update(passthrough_tensors[min(i, len(passthrough_tensors) - 1)])
+                            self._postprocess(result, backend.device_id)
+                logger.info(
+                    f"Model {self._model_name} warmed up on device {backend.device_id} with batch size {batch_size} "
+                    f"and dynamic size {dynamic_size} in {(time.perf_counter() - batch_start) * 1e3:.1f} ms"
+                )
+        logger.info(f"Model {self._model_name} warmed up in {time.perf_counter() - start:.2f} s")
+
     def run(self, model_backend: ModelBackend):
         logger.debug(f"Model operator for {self._model_name} started")
 
-        # create preprocessors
-        for kind, processors in [("preprocessors", self._preprocessors), ("postprocessors", self._postprocessors)]:
-            if kind in self._model_config:
-                for config in self._model_config[kind]:
-                    ProcessorClass = None
-                    if config["kind"] == "auto":
-                        ProcessorClass = AutoProcessor
-                    elif config["kind"] == "custom":
-                        ProcessorClass = CustomProcessor
-                    if ProcessorClass is not None:
-                        processors.append(
-                            ProcessorClass(
-                                config=config,
-                                model_home=self._model_home
-                            )
-                        )
-                    else:
-                        raise Exception("Invalid Processor")
+        self._create_processors()
         # backend loop
         self._backend = model_backend
         self._collector = self._create_collector()
+        if self._cache is not None:
+            for flow in self._in:
+                flow.enable_digest()
+        concurrency = model_backend.max_concurrency
+        if concurrency > 1:
+            logger.info(f"Model {self._model_name} serves up to {concurrency} requests concurrently")
+            self._workers = ThreadPoolExecutor(max_workers=concurrency)
+            self._slots = threading.Semaphore(concurrency)
         while not self._stop_event.is_set():
+            context = None
             try:
                 # collect input data until Stop is received
                 data = self._collector.collect()
                 if isinstance(data, Stop) or isinstance(data, Error):
                     # pass the error or stop message downstream
-                    for out in self._out:
-                        logger.debug(f"Passing error or stop message to {out.in_names}")
-                        out.put(data)
+                    self._forward(data)
                     continue
-                logger.info(f"Input collected from {self._collector.__class__.__name__}: {data}")
+                logger.debug("Input collected from %s: %s", self._collector.__class__.__name__, LazyTensorSummary(data))
+                context = data.pop(REQUEST_CONTEXT_KEY, None)
+                _current.context = context
+                digests = data.pop(CONTENT_DIGEST_KEY, {})
+                key = self._lookup_key(data, digests)
+                if key is not None:
+                    cached = self._cache.get(key)
+                    if cached is not None:
+                        # same inputs seen before, skip the preprocessors and the backend
+                        logger.debug("Model %s hits the result cache with %s", self._model_name, key)
+                        if self._workers is None:
+                            self._replay(context, cached)
+                        else:
+                            self._submit_infer(context, self._replay, context, cached)
+                        continue
 
                 # convert data to args and kwargs based on if explicit batching is required
                 args = []
@@ -817,11 +1233,13 @@ class ModelOperator:
                     # construct multiple inference requests
                     args = split_tensor_in_dict(kwargs)
                     kwargs = {}
+                # the request keeps its device from the decode through the backend
+                device_id = self._device_scheduler.place(context)
                 # call preprocess() before passing args to the backend
-                processed, passthrough_tensors = self._preprocess(args if args else [kwargs])
-                in_names = [i["name"] for i in self._model_config["input"]]
+                with device_scope(device_id):
+                    processed, passthrough_tensors = self._preprocess(args if args else [kwargs], device_id)
                 if not processed:
-                    logger.error(f"Empty result from preprocess: {args} and {kwargs}")
+                    logger.error("Empty result from preprocess: %s and %s", LazyTensorSummary(args), LazyTensorSummary(kwargs))
                     continue
                 if args:
                     # explicitly batched data
@@ -830,54 +1248,23 @@ class ModelOperator:
                     # implicitly batched data
                     kwargs = processed[0]
                 else:
-                    logger.error(f"Invalid result from preprocess: {args} and {kwargs}")
+                    logger.error("Invalid result from preprocess: %s and %s", LazyTensorSummary(args), LazyTensorSummary(kwargs))
                     continue
-                # execute inference backend and collect result
-                logger.debug(f"Model {self._model_name} invokes backend {self._backend.__class__.__name__} with {args if args else kwargs}")
-                for r in self._backend(*args, **kwargs):
-                    logger.debug(f"Model {self._model_name} generated result from backend {self._backend.__class__.__name__}: {r}")
-                    if not self._out:
-                        logger.error(f"No output data flow is bound to model {self._model_name}, please check the route configuration")
-                        continue
-                    if isinstance(r, Error):
-                        logger.error(f"Error from model {self._model_name}: {r}")
-                        continue
-                    # iterate the result list and postprocess each of them
-                    for out in self._out:
-                        output_data = {n : [] for n in out.in_names}
-                        if isinstance(r, list):
-                            # we get a batch
-                            if len(passthrough_tensors) == 1:
-                                passthrough_tensors = passthrough_tensors*len(r)
-                            for i, result in enumerate(r):
-                                if passthrough_tensors:
-                                    result.update(passthrough_tensors[i])
-                                result = self._postprocess(result)
-                                if not all([n in result for n in out.in_names]):
-                                    logger.error(f"Data received from model {self._model_name} is incomplete, expected: {out.in_names}, received: {result.keys()}. Post-processor missing?")
-                                    continue
-                                # collect the result
-                                for n, v in output_data.items():
-                                    if n in result:
-                                        v.append(result[n])
-                                    else:
-                                        v.append(None)
-                        else:
-                            # implicit batching
-                            if passthrough_tensors:
-                                r.update(passthrough_tensors[0])
-                            output_data = self._postprocess(r)
-                            if not all([n in output_data for n in out.in_names]):
-                                logger.error(f"Data received from model {self._model_name} is incomplete, expected: {out.in_names}, received: {output_data.keys()}. Post-processor missing?")
-                                continue
-                        logger.debug(f"ModelOperator of {self._model_name} deposits result: {output_data}")
-                        out.put(output_data)
+                # the request might have expired during preprocessing
+                if context is not None and context.done:
+                    self._drop(context)
+                    continue
+                if self._workers is None:
+                    self._infer(context, args, kwargs, passthrough_tensors, key, device_id)
+                else:
+                    self._submit_infer(context, self._infer, context, args, kwargs, passthrough_tensors, key, device_id)
             except Empty:
                 continue
             except Exception as e:
                 logger.exception(e)
+                # tagged for the error to reach the request among others in flight
                 for out in self._out:
-                    out.put(Error(str(e)))
+                    out.put(Error(str(e), context.request_id if context is not None else None))
 
         logger.info(f"Model operator {self._model_name} stopped")
 
@@ -890,15 +1277,189 @@ class ModelOperator:
         self._out.clear()
         self._preprocessors.clear()
         self._postprocessors.clear()
+        if self._workers is not None:
+            self._workers.shutdown(wait=False)
         self._backend = None
         self._stop_event = None
         self._collector = None
         logger.info(f"Model operator {self._model_name} stopped")
 
-    def _preprocess(self, args: List):
+    def _infer(self, context: Optional[RequestContext], args: List, kwargs: Dict, passthrough_tensors: List, key: Optional[str] = None, device_id: Optional[int] = None):
+        """Invoke the backend and deposit the postprocessed results to the outputs
+
+        The results are recorded to the cache under the key if given, and the backend runs
+        on the device the request is placed on.
+        """
+        _current.context = context
+        _current.device_id = device_id
+        record = [] if key is not None else None
+        # execute inference backend and collect result
+        logger.debug("Model %s invokes backend %s with %s", self._model_name, self._backend.__class__.__name__, LazyTensorSummary(args if args else kwargs))
+        for r in self._call_backend(device_id, *args, **kwargs):
+            logger.debug("Model %s generated result from backend %s: %s", self._model_name, self._backend.__class__.__name__, LazyTensorSummary(r))
+            if context is not None and context.done:
+                # stop consuming the results nobody will read
+                self._drop(context)
+                return
+            if not self._out:
+                logger.error("No output data flow is bound to model %s, please check the route configuration", self._model_name)
+                continue
+            if isinstance(r, Error):
+                logger.error("Error from model %s: %s", self._model_name, r)
+                record = None
+                continue
+            # iterate the result list and postprocess each of them
+            for index, out in enumerate(self._out):
+                output_data = {n : [] for n in out.in_names}
+                if isinstance(r, list):
+                    # we get a batch
+                    if len(passthrough_tensors) == 1:
+                        passthrough_tensors = passthrough_tensors*len(r)
+                    for i, result in enumerate(r):
+                        if passthrough_tensors:
+                            result.update(passthrough_tensors[i])
+                        result = self._postprocess(result, device_id)
+                        if not all([n in result for n in out.in_names]):
+                            logger.error("Data received from model %s is incomplete, expected: %s, received: %s. Post-processor missing?", self._model_name, out.in_names, result.keys())
+                            continue
+                        # collect the result
+                        for n, v in output_data.items():
+                            if n in result:
+                                v.append(result[n])
+                            else:
+                                v.append(None)
+                else:
+                    # implicit batching
+                    if passthrough_tensors:
+                        r.update(passthrough_tensors[0])
+                    output_data = self._postprocess(r, device_id)
+                    if not all([n in output_data for n in out.in_names]):
+                        logger.error("Data received from model %s is incomplete, expected: %s, received: %s. Post-processor missing?", self._model_name, out.in_names, output_data.keys())
+                        continue
+                logger.debug("ModelOperator of %s deposits result: %s", self._model_name, LazyTensorSummary(output_data))
+                if record is not None:
+                    record.append((index, dict(output_data)))
+                if context is not None:
+                    output_data[REQUEST_CONTEXT_KEY] = context
+                out.put(output_data)
+        if record:
+            self._cache.put(key, record)
+
+    def _call_backend(self, device_id: Optional[int], *args, **kwargs):
+        """Generate the results of the backend with the device of the request current"""
+        with device_scope(device_id if device_id is not None else self._device_scheduler.device_ids[0]):
+            yield from self._backend(*args, **kwargs)
+
+    def _replay(self, context: Optional[RequestContext], cached: List):
+        """Deposit the cached results to the outputs"""
+        if context is not None and context.done:
+            self._drop(context)
+            return
+        for index, output_data in cached:
+            output_data = dict(output_data)
+            if context is not None:
+                output_data[REQUEST_CONTEXT_KEY] = context
+            self._out[index].put(output_data)
+
+    def _lookup_key(self, data: Dict, digests: Dict) -> Optional[str]:
+        """The cache key of the input data, None if the cache is not enabled or the key inputs are missing"""
+        if self._cache is None:
+            return None
+        names = self._cache_key or list(data.keys())
+        if not all(n in data for n in names):
+            return None
+        # the digest of the encoded input stands for the decoded tensors
+        return content_key({n: digests[n] if n in digests else data[n] for n in names})
+
+    def _submit_infer(self, context: Optional[RequestContext], fn: Callable, *fn_args):
+        """Run the backend on a worker, the work of the same request is chained to keep its results in order"""
+        request_id = context.request_id if context is not None else None
+        self._slots.acquire()
+        with self._inflight_lock:
+            previous = self._inflight.get(request_id, None)
+            future = self._workers.submit(self._run_infer, previous, context, fn, *fn_args)
+            self._inflight[request_id] = future
+        future.add_done_callback(lambda f: self._finish_infer(request_id, f))
+
+    def _run_infer(self, previous: Optional[Future], context, fn, *fn_args):
+        if previous is not None:
+            wait([previous])
+        try:
+            fn(*fn_args)
+        except Exception as e:
+            logger.exception(e)
+            for out in self._out:
+                out.put(Error(str(e), context.request_id if context is not None else None))
+
+    def _finish_infer(self, request_id: Optional[str], future: Future):
+        with self._inflight_lock:
+            if self._inflight.get(request_id, None) is future:
+                del self._inflight[request_id]
+        self._slots.release()
+
+    def _forward(self, message: Union[Stop, Error]):
+        """Pass a Stop or an Error downstream once the pending work of its request is done"""
+        def put(*_):
+            for out in self._out:
+                logger.debug("Passing error or stop message to %s", out.in_names)
+                out.put(message)
+        with self._inflight_lock:
+            if message.request_id is not None:
+                pending = self._inflight.get(message.request_id, None)
+                pending = [pending] if pending is not None else []
+            else:
+                pending = list(self._inflight.values())
+        if not pending:
+            put()
+        elif message.request_id is not None:
+            pending[0].add_done_callback(put)
+        else:
+            # the owner of the message is unknown, wait for all the pending work
+            wait(pending)
+            put()
+
+    def _drop(self, context: RequestContext):
+        self._n_dropped += 1
+        logger.info("Request %s dropped by model %s: %s", context.request_id, self._model_name, context.reason)
+        for out in self._out:
+            out.put(Error(f"Request {context.request_id} dropped: {context.reason}", context.request_id))
+
+    def _create_processors(self):
+        """Create the pre and post processors on each device once, before the warmup or the backend loop"""
+        if self._processors_created:
+            return
+        self._processors_created = True
+        for device_id in self._device_scheduler.device_ids:
+            for kind, processors in [("preprocessors", self._preprocessors), ("postprocessors", self._postprocessors)]:
+                processors[device_id] = []
+                if kind in self._model_config:
+                    for config in self._model_config[kind]:
+                        ProcessorClass = None
+                        if config["kind"] == "auto":
+                            ProcessorClass = AutoProcessor
+                        elif config["kind"] == "custom":
+                            ProcessorClass = CustomProcessor
+                        if ProcessorClass is not None:
+                            processors[device_id].append(
+                                ProcessorClass(
+                                    config=config,
+                                    model_home=self._model_home,
+                                    device_id=device_id
+                                )
+                            )
+                        else:
+                            raise Exception("Invalid Processor")
+
+    def _device_processors(self, processors: Dict[int, List[Processor]], device_id: Optional[int]) -> List[Processor]:
+        """The processors of the device, those of the first device of the model if it isn't given"""
+        if device_id not in processors:
+            device_id = self._device_scheduler.device_ids[0]
+        return processors.get(device_id, [])
+
+    def _preprocess(self, args: List, device_id: Optional[int] = None):
         # go through the preprocess chain
         outcome = args
-        for preprocessor in self._preprocessors:
+        for preprocessor in self._device_processors(self._preprocessors, device_id):
             result = []
             for data in outcome:
                 # initialize the processed as the original values
@@ -906,21 +1467,21 @@ class ModelOperator:
                 # trigger the preprocessor if all the input tensors are present
                 if all([i in data for i in preprocessor.input]):
                     input = [processed.pop(i) for i in preprocessor.input]
-                    logger.debug(f"{self._model_name} invokes preprocessor {preprocessor.name} with given input {input}")
+                    logger.debug("%s invokes preprocessor %s with given input %s", self._model_name, preprocessor.name, LazyTensorSummary(input))
                     output = preprocessor(*input)
-                    logger.debug(f"{self._model_name} preprocessor {preprocessor.name} generated output {output}")
+                    logger.debug("%s preprocessor %s generated output %s", self._model_name, preprocessor.name, LazyTensorSummary(output))
                     if not isinstance(output, tuple):
                         logger.error("Return value of a processor must be a tuple")
                         continue
                     if len(output) != len(preprocessor.output):
-                        logger.warning(f"Number of preprocessing output doesn't match the configuration, expecting {len(preprocessor.output)}, while getting {len(output)}")
+                        logger.warning("Number of preprocessing output doesn't match the configuration, expecting %s, while getting %s", len(preprocessor.output), len(output))
                         continue
                     # update as processed
                     for key, value in zip(preprocessor.output, output):
                         if value is not None:
                             processed[key] = value
                 else:
-                    logger.warning(f"Pre-processor {preprocessor.name} skipped because of missing input tensors")
+                    logger.warning("Pre-processor %s skipped because of missing input tensors", preprocessor.name)
                 result.append(processed)
             # update outcome
             outcome = result
@@ -930,37 +1491,34 @@ class ModelOperator:
             passthrough_tensor = {}
             for key in data:
                 value = data[key]
-                i_config = next((i for i in self._model_config['input'] if i["name"] == key), None)
-                if i_config is None:
-                    logger.info(f"{key} from preprocessed is not found in the model input config, adding it as a passthrough tensor")
+                if key not in self._input_configs:
+                    logger.debug("%s from preprocessed is not found in the model input config, adding it as a passthrough tensor", key)
                     passthrough_tensor[key] = value
-                else:
-                    data_type = i_config["data_type"]
-                    if isinstance(value, np.ndarray):
-                        data_type = np_datatype_mapping[data_type]
-                        if value.dtype != data_type:
-                            data[key] = value.astype(data_type)
-                    elif isinstance(value, torch.Tensor):
-                        data_type = torch_datatype_mapping[data_type]
-                        if value.dtype != data_type:
-                            data[key] = value.to(data_type)
+                elif isinstance(value, np.ndarray):
+                    data_type = self._input_np_types[key]
+                    if value.dtype != data_type:
+                        data[key] = value.astype(data_type)
+                elif isinstance(value, torch.Tensor):
+                    data_type = self._input_torch_types[key]
+                    if value.dtype != data_type:
+                        data[key] = value.to(data_type)
             for key in passthrough_tensor:
                 data.pop(key)
             passthrough_tensors.append(passthrough_tensor)
         return outcome, passthrough_tensors
 
-    def _postprocess(self, data: Dict):
+    def _postprocess(self, data: Dict, device_id: Optional[int] = None):
         processed = {k: v for k, v in data.items()}
-        for processor in self._postprocessors:
+        for processor in self._device_processors(self._postprocessors, device_id):
             if not all([i in data for i in processor.input]):
-                logger.warning(f"Post-processor {processor.name} skipped because of missing input tensors")
+                logger.warning("Post-processor %s skipped because of missing input tensors", processor.name)
                 continue
             input = [processed.pop(i) for i in processor.input]
-            logger.debug(f"Post-processor {processor.name} invoked with given input {input}")
+            logger.debug("Post-processor %s invoked with given input %s", processor.name, LazyTensorSummary(input))
             output = processor(*input)
-            logger.debug(f"Post-processor generated output {output}")
+            logger.debug("Post-processor generated output %s", LazyTensorSummary(output))
             if len(output) != len(processor.output):
-                logger.warning(f"Number of postprocessing output doesn't match the configuration, expecting {len(processor.output)}, while getting {len(output)}")
+                logger.warning("Number of postprocessing output doesn't match the configuration, expecting %s, while getting %s", len(processor.output), len(output))
                 continue
             # update as processed
             for key, value in zip(processor.output, output):
@@ -976,7 +1534,12 @@ class ModelOperator:
             intersection = set.intersection(*outputs)
             if len(intersection) == 0 and not any([d.optional for d in self._in]):
                 logger.info(f"Aggregation data flow input detected, using aggregation flow collector on model {self._model_name}")
-                return AggregationFlowCollector(self._in)
+                join = self._model_config.get("join", {})
+                return AggregationFlowCollector(
+                    self._in,
+                    timeout=join.get("timeout", None),
+                    max_pending=join.get("max_pending", 64)
+                )
             else:
                 logger.info(f"Multi data flow input detected, using multi flow collector on model {self._model_name}")
                 return MultiFlowCollector(self._in)
@@ -1011,13 +1574,29 @@ class InferenceBase:
 
             return Route(Path(m1, m2), Path(d1, d2))
 
+        # apply the logging settings before setting up the inference flow, the environment
+        # variables apply without a logging section as well
+        configure_logging(OmegaConf.to_container(global_config.logging) if hasattr(global_config, "logging") else None)
 
         self._operators: ModelOperator = []
         self._inputs: List[DataFlow] = []
         self._outputs: List[DataFlow] = []
         self._input_config = OmegaConf.to_container(global_config.input)
         self._output_config = OmegaConf.to_container(global_config.output)
+        # top level lookup tables: name -> config and name -> numpy/torch data type
+        self._input_config_map = {c["name"]: c for c in self._input_config}
+        self._output_config_map = {c["name"]: c for c in self._output_config}
+        self._output_np_types = {
+            n: np_datatype_mapping[c["data_type"]]
+            for n, c in self._output_config_map.items() if c["data_type"] in np_datatype_mapping
+        }
+        self._output_torch_types = {
+            n: torch_datatype_mapping[c["data_type"]]
+            for n, c in self._output_config_map.items() if c["data_type"] in torch_datatype_mapping
+        }
         self._model_repo = model_repo
+        # default timeout in seconds for a request when not given by the client
+        self._request_timeout = global_config.request_timeout if hasattr(global_config, "request_timeout") else None
 
         if not os.path.exists(self._model_repo):
             logger.error(f"Model repository {self._model_repo} does not exist")
@@ -1141,12 +1720,30 @@ class InferenceBase:
             raise Exception(error)
         self._executor = ThreadPoolExecutor(max_workers=len(self._operators))
         self._future = None
+        # set once all the models are warmed up and the operators started
+        self._ready = threading.Event()
         # sanity check on vision pipeline
         try:
             Pipeline("vision")
         except Exception as e:
             logger.exception(e)
 
+    @property
+    def ready(self) -> bool:
+        """Whether all the models are warmed up and serving"""
+        return self._ready.is_set()
+
+    @property
+    def dropped_requests(self) -> Dict[str, int]:
+        """Number of expired or cancelled items dropped by each model"""
+        return {op.model_name: op.n_dropped for op in self._operators}
+
+    def create_context(self, timeout: Optional[float] = None, is_cancelled: Optional[Callable[[], bool]] = None, **kwargs):
+        """Create the context of a request, the default timeout applies if not given"""
+        if timeout is None:
+            timeout = self._request_timeout
+        return RequestContext.create(timeout=timeout, is_cancelled=is_cancelled, **kwargs)
+
     def finalize(self):
         for operator in self._operators:
             operator.stop()
@@ -1154,4 +1751,20 @@ class InferenceBase:
         logger.info("Inference pipeline is finalized")
 
     def _submit(self, op: ModelOperator, backend: ModelBackend):
-        self._future = self._executor.submit(lambda: op.run(backend))
\ No newline at end of file
+        self._future = self._executor.submit(lambda: op.run(backend))
+
+    def _start(self, backends: List[Tuple[ModelOperator, Callable[[], ModelBackend]]]):
+        """Create the backends and warm the models up in parallel, start the operators once all of them are done"""
+        start = time.perf_counter()
+        def create(op: ModelOperator, create_backend: Callable[[], ModelBackend]) -> ModelBackend:
+            backend = create_backend()
+            op.warmup(backend)
+            return backend
+        with ThreadPoolExecutor(max_workers=max(1, len(backends))) as executor:
+            futures = [executor.submit(create, op, create_backend) for op, create_backend in backends]
+        # raises the error of a failed creation or warmup
+        created = [future.result() for future in futures]
+        for (op, _), backend in zip(backends, created):
+            self._submit(op, backend)
+        self._ready.set()
+        logger.info(f"Inference is ready, {len(backends)} models created and warmed up in {time.perf_counter() - start:.2f} s")
\ No newline at end of file
@@ -0,0 +1,176 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compact encodings of the segmentation and instance masks in the responses
+
+A mask is a 2D array of label values, and it is encoded as one of:
+    list: the flattened list of the values, the original format
+    rle: COCO run-length encoding {"size": [h, w], "counts": [...], "value": v} in column
+        major order, the counts alternating the background (0) and the value v. Masks with
+        several values are encoded as {"size", "counts", "values"}, with a value per run.
+    png: {"size": [h, w], "png": base64 PNG, "offset": o}, grayscale of 8 or 16 bits,
+        the values are shifted by the offset if they are negative
+    bits: {"size": [h, w], "bits": base64 bit-packed foreground, "value": v}, masks with
+        several values are encoded as png
+
+The module only depends on numpy so that the clients can decode the masks with it.
+"""
+
+import base64
+import struct
+import zlib
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+MASK_ENCODINGS = ("list", "rle", "png", "bits")
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def encode_mask(mask: np.ndarray, encoding: str = "list") -> Any:
+    """Encode a 2D mask to a JSON serializable value"""
+    mask = np.asarray(mask)
+    if encoding == "list":
+        return mask.flatten().tolist()
+    if mask.ndim != 2:
+        raise ValueError(f"Mask of shape {mask.shape} can't be encoded as {encoding}, a 2D mask is expected")
+    if encoding == "rle":
+        return _encode_rle(mask)
+    if encoding == "png":
+        return _encode_png(mask)
+    if encoding == "bits":
+        value = _single_value(mask)
+        if value is None:
+            return _encode_png(mask)
+        return {
+            "size": list(mask.shape),
+            "bits": base64.b64encode(np.packbits(mask.ravel() != 0).tobytes()).decode(),
+            "value": value,
+        }
+    raise ValueError(f"Unknown mask encoding {encoding}, expecting one of {MASK_ENCODINGS}")
+
+
+def decode_mask(mask: Any, shape: Optional[Sequence[int]] = None) -> np.ndarray:
+    """Decode a mask of any of the encodings, the shape is required by the flattened lists"""
+    if not isinstance(mask, dict):
+        return np.array(mask).reshape(shape)
+    size = tuple(mask["size"])
+    if "counts" in mask:
+        counts = np.asarray(mask["counts"], dtype=np.int64)
+        if "values" in mask:
+            values = np.asarray(mask["values"], dtype=np.int32)
+        else:
+            values = np.zeros(len(counts), dtype=np.uint8 if 0 <= mask.get("value", 1) <= 255 else np.int32)
+            values[1::2] = mask.get("value", 1)
+        return np.repeat(values, counts).reshape(size, order="F")
+    if "png" in mask:
+        decoded = _decode_png(base64.b64decode(mask["png"]))
+        offset = mask.get("offset", 0)
+        return decoded.astype(np.int32) + offset if offset else decoded
+    if "bits" in mask:
+        n_pixels = size[0] * size[1]
+        bits = np.unpackbits(np.frombuffer(base64.b64decode(mask["bits"]), dtype=np.uint8))[:n_pixels]
+        value = mask.get("value", 1)
+        return (bits * value).astype(np.uint8 if 0 <= value <= 255 else np.int32).reshape(size)
+    raise ValueError(f"Unknown mask encoding with keys {list(mask.keys())}")
+
+
+def _single_value(mask: np.ndarray) -> Optional[int]:
+    """The value of the foreground if the mask is binary, None if it has several values"""
+    values = np.unique(mask)
+    values = values[values != 0]
+    if len(values) > 1 or (len(values) == 1 and values[0] < 0):
+        return None
+    return int(values[0]) if len(values) else 1
+
+
+def _encode_rle(mask: np.ndarray) -> Dict:
+    flat = mask.ravel(order="F")
+    size = list(mask.shape)
+    if flat.size == 0:
+        return {"size": size, "counts": []}
+    starts = np.concatenate(([0], np.flatnonzero(flat[1:] != flat[:-1]) + 1))
+    counts = np.diff(np.append(starts, flat.size))
+    values = flat[starts]
+    value = _single_value(mask)
+    if value is None:
+        return {"size": size, "counts": counts.tolist(), "values": values.tolist()}
+    counts = counts.tolist()
+    if values[0] != 0:
+        # the counts start with the background
+        counts.insert(0, 0)
+    return {"size": size, "counts": counts, "value": value}
+
+
+def _encode_png(mask: np.ndarray) -> Dict:
+    offset = min(0, int(mask.min())) if mask.size else 0
+    shifted = mask.astype(np.int64) - offset if offset else mask
+    high = int(shifted.max()) if mask.size else 0
+    if high > 65535:
+        raise ValueError(f"Mask values in [{offset}, {high + offset}] can't be encoded as png")
+    bit_depth = 8 if high <= 255 else 16
+    pixels = np.ascontiguousarray(shifted, dtype=np.uint8 if bit_depth == 8 else ">u2")
+    encoded = {"size": list(mask.shape), "png": base64.b64encode(_png_bytes(pixels, bit_depth)).decode()}
+    if offset:
+        encoded["offset"] = offset
+    return encoded
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+
+def _png_bytes(pixels: np.ndarray, bit_depth: int) -> bytes:
+    """Grayscale PNG of the pixels, each scanline stored without filter"""
+    height, width = pixels.shape
+    scanlines = np.zeros((height, 1 + pixels.itemsize * width), dtype=np.uint8)
+    scanlines[:, 1:] = pixels.view(np.uint8).reshape(height, pixels.itemsize * width)
+    header = struct.pack(">IIBBBBB", width, height, bit_depth, 0, 0, 0, 0)
+    return (
+        _PNG_SIGNATURE +
+        _png_chunk(b"IHDR", header) +
+        _png_chunk(b"IDAT", zlib.compress(scanlines.tobytes(), 6)) +
+        _png_chunk(b"IEND", b"")
+    )
+
+
+def _decode_png(data: bytes) -> np.ndarray:
+    """Decode the grayscale PNGs written by _png_bytes"""
+    if data[:8] != _PNG_SIGNATURE:
+        raise ValueError("Invalid PNG data")
+    position = 8
+    idat: List[bytes] = []
+    width = height = bit_depth = 0
+    while position < len(data):
+        length, tag = struct.unpack(">I4s", data[position:position + 8])
+        chunk = data[position + 8:position + 8 + length]
+        if tag == b"IHDR":
+            width, height, bit_depth, color_type = struct.unpack(">IIBB", chunk[:10])
+            if color_type != 0 or bit_depth not in (8, 16):
+                raise ValueError(f"Unsupported PNG of color type {color_type} and bit depth {bit_depth}")
+        elif tag == b"IDAT":
+            idat.append(chunk)
+        elif tag == b"IEND":
+            break
+        position += 12 + length
+    dtype = np.uint8 if bit_depth == 8 else np.dtype(">u2")
+    row_bytes = 1 + bit_depth // 8 * width
+    scanlines = np.frombuffer(zlib.decompress(b"".join(idat)), dtype=np.uint8).reshape(height, row_bytes)
+    if np.any(scanlines[:, 0] != 0):
+        raise ValueError("Unsupported PNG scanline filter")
+    pixels = np.ascontiguousarray(scanlines[:, 1:]).view(dtype).reshape(height, width)
+    return pixels.astype(np.uint16) if bit_depth == 16 else pixels
@@ -15,17 +15,185 @@
 
 
 from lib.asset_manager import AssetManager
-from lib.utils import create_jinja2_env, stack_tensors_in_dict, convert_list, get_logger
+from lib.utils import create_jinja2_env, stack_tensors_in_dict, convert_list, get_logger, LazyTensorSummary
 from omegaconf.errors import ConfigKeyError
 from omegaconf import OmegaConf
 import base64
 from config import global_config
+import functools
 import json
 import re
+from jinja2 import nodes
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 
 jinja2_env = create_jinja2_env()
+logger = get_logger(__name__)
+
+
+def _walk(value, leaves: List) -> Any:
+    """The layout of a response, collecting the values that can be substituted in order
+
+    Strings, None and numbers are substituted, the other values are part of the layout so
+    that a change of them, e.g. a flag turning on, renders the envelope again.
+    """
+    if isinstance(value, dict):
+        return ("dict", tuple((k, _walk(v, leaves)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return ("list", tuple(_walk(v, leaves) for v in value))
+    if isinstance(value, bool):
+        return ("bool", value)
+    if value is None or isinstance(value, (str, int, float)):
+        leaves.append(value)
+        return type(value).__name__
+    return ("other", repr(value))
+
+
+def _probe(value, counter: List[int]) -> Any:
+    """The response with unique sentinels in place of the substituted values"""
+    if isinstance(value, dict):
+        return {k: _probe(v, counter) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_probe(v, counter) for v in value]
+    if isinstance(value, bool):
+        return value
+    if value is None or isinstance(value, str):
+        counter[0] += 1
+        return StreamEnvelope.SENTINEL.format(counter[0] - 1)
+    if isinstance(value, int):
+        counter[0] += 1
+        return StreamEnvelope.NUMBER_SENTINEL + counter[0] - 1
+    if isinstance(value, float):
+        counter[0] += 1
+        return StreamEnvelope.NUMBER_SENTINEL + counter[0] - 1 + 0.5
+    return value
+
+
+# filters passing the value through as it is substituted
+_SUBSTITUTABLE_FILTERS = {"tojson"}
+# the nodes whose output depends on the value of their operands, not only on its place
+_VALUE_NODES = (nodes.Test, nodes.Compare, nodes.BinExpr, nodes.UnaryExpr, nodes.Concat, nodes.Call, nodes.Slice)
+
+
+def _references(node, names) -> bool:
+    if isinstance(node, nodes.Name) and node.name in names:
+        return True
+    return any(n.name in names for n in node.find_all(nodes.Name))
+
+
+@functools.lru_cache(maxsize=64)
+def _substitutable(source: str) -> bool:
+    """Whether the template embeds the values of the response only where they stand
+
+    The names set from the response or looping over it are followed. A branch, a test, a
+    comparison, an operation or a filter other than tojson over any of them makes the output
+    depend on the values, and such a template is rendered for each response.
+    """
+    ast = jinja2_env.parse(source)
+    names = {"response"}
+    while True:
+        derived = set(names)
+        for node in ast.find_all((nodes.Assign, nodes.For)):
+            value = node.node if isinstance(node, nodes.Assign) else node.iter
+            if _references(value, names):
+                derived.update(n.name for n in node.target.find_all(nodes.Name))
+                if isinstance(node.target, nodes.Name):
+                    derived.add(node.target.name)
+        if derived == names:
+            break
+        names = derived
+    for node in ast.find_all(nodes.Node):
+        if isinstance(node, (nodes.If, nodes.CondExpr)):
+            operands = [node.test]
+        elif isinstance(node, nodes.For):
+            operands = [node.test] if node.test is not None else []
+        elif isinstance(node, nodes.Filter):
+            operands = [] if node.name in _SUBSTITUTABLE_FILTERS else [node]
+        elif isinstance(node, nodes.Getitem):
+            operands = [node.arg]
+        elif isinstance(node, _VALUE_NODES):
+            operands = [node]
+        else:
+            continue
+        if any(_references(operand, names) for operand in operands):
+            return False
+    return True
+
+
+class StreamEnvelope:
+    """The JSON envelope of the streamed responses of a request
+
+    Rendering the template and parsing the JSON on every generated token costs more than
+    the token itself, so the template is rendered once with sentinels in place of the values
+    of the response, and the compact JSON is split around them. Each streamed response only
+    substitutes its values between the segments. The envelope is checked against a regular
+    rendering whenever the layout of the response changes. A template whose output depends
+    on the values, e.g. through conditions or filters, is rendered for each response.
+    """
+    SENTINEL = "@@sTrEaM{}@@"
+    NUMBER_SENTINEL = 734_003_200_000
+
+    def __init__(self, template, request, source: str):
+        self._template = template
+        self._request = request
+        self._substitutable = _substitutable(source)
+        self._layout = None
+        # the segments of the JSON text between the values and the index of each value
+        self._segments: Optional[List[str]] = None
+        self._slots: List[int] = []
+
+    def format(self, response: Dict[str, Any]) -> str:
+        """The compact JSON of a streamed response"""
+        if not self._substitutable:
+            return self._render(response)
+        leaves = []
+        layout = _walk(response, leaves)
+        if layout != self._layout:
+            self._layout = layout
+            self._build(response, leaves)
+        if self._segments is None:
+            return self._render(response)
+        return self._substitute(leaves)
+
+    def _render(self, response) -> str:
+        rendered = self._template.render(request=self._request, response=response)
+        return json.dumps(json.loads(rendered), separators=(',', ':'))
+
+    def _substitute(self, leaves: List) -> str:
+        parts = [self._segments[0]]
+        for slot, segment in zip(self._slots, self._segments[1:]):
+            parts.append(json.dumps(leaves[slot]))
+            parts.append(segment)
+        return "".join(parts)
+
+    def _build(self, response, leaves: List):
+        self._segments = None
+        if any(isinstance(v, float) and v != v for v in leaves):
+            return
+        counter = [0]
+        try:
+            probed = self._render(_probe(response, counter))
+        except Exception:
+            # e.g. a sentinel string where the template expects a number
+            return
+        tokens = {json.dumps(self.SENTINEL.format(i)): i for i in range(counter[0])}
+        tokens.update({str(self.NUMBER_SENTINEL + i): i for i in range(counter[0])})
+        tokens.update({repr(self.NUMBER_SENTINEL + i + 0.5): i for i in range(counter[0])})
+        pattern = re.compile("|".join(
+            re.escape(t) if t.startswith('"') else r"(?<![\d.])" + re.escape(t) + r"(?![\d.eE])"
+            for t in sorted(tokens, key=len, reverse=True)
+        ))
+        segments, slots, position = [], [], 0
+        for match in pattern.finditer(probed):
+            segments.append(probed[position:match.start()])
+            slots.append(tokens[match.group(0)])
+            position = match.end()
+        segments.append(probed[position:])
+        self._segments, self._slots = segments, slots
+        # the values must come out as they are rendered
+        if json.loads(self._substitute(leaves)) != json.loads(self._render(response)):
+            logger.debug("Streamed response template doesn't embed the values as they are, rendering each response")
+            self._segments = None
 
 class ResponderBase:
     def __init__(self):
@@ -33,6 +201,8 @@ class ResponderBase:
         self._inference = None
         self._request_templates = {}
         self._response_templates = {}
+        # compiled jinja templates keyed by their source
+        self._compiled_templates = {}
         self._asset_manager = AssetManager()
         self.logger = get_logger(__name__)
 
@@ -65,8 +235,15 @@ class ResponderBase:
             raise ValueError(f"Unknown action: {action_name}")
         return await action(*args)
 
+    def _get_template(self, source: str):
+        """Compile the template once and reuse it for the following requests"""
+        template = self._compiled_templates.get(source, None)
+        if template is None:
+            template = self._compiled_templates[source] = jinja2_env.from_string(source)
+        return template
+
     def process_request(self, responder: str, request: BaseModel) -> Dict[str, Any]:
-        self.logger.debug(f"Processing request {request}")
+        self.logger.debug("Processing request %s", LazyTensorSummary(request))
 
         result = json.loads(request.model_dump_json())
 
@@ -78,7 +255,7 @@ class ResponderBase:
 
         request_class = next(iter(templates.keys()))
         template = templates[request_class]
-        json_string = jinja2_env.from_string(template).render(request=result)
+        json_string = self._get_template(template).render(request=result)
         try:
             result = json.loads(json_string)
         except Exception as e:
@@ -107,7 +284,7 @@ class ResponderBase:
         return result
 
     def process_response(self, responder: str, request, response: Dict[str, Any]) -> str:
-        self.logger.debug(f"Processing response {response}")
+        self.logger.debug("Processing response %s", LazyTensorSummary(response))
         # Load the response template for the endpoint
         templates = self._response_templates.get(responder, None)
         if not templates:
@@ -116,11 +293,19 @@ class ResponderBase:
 
         response_class = next(iter(templates.keys()))
         template = templates[response_class]
-        json_string = jinja2_env.from_string(template).render(request=request, response=response)
+        json_string = self._get_template(template).render(request=request, response=response)
         return json_string
 
+    def create_stream_envelope(self, responder: str, request) -> Optional[StreamEnvelope]:
+        """The envelope formatting the streamed responses of a request, None without a template"""
+        templates = self._response_templates.get(responder, None)
+        if not templates or len(templates) < 2:
+            return None
+        source = list(templates.values())[1]
+        return StreamEnvelope(self._get_template(source), request, source)
+
     def process_streamed_response(self, responder: str, request, response: Dict[str, Any]) -> str:
-        self.logger.debug(f"Processing streamed response {response}")
+        self.logger.debug("Processing streamed response %s", LazyTensorSummary(response))
         # Load the response template for the endpoint
         templates = self._response_templates.get(responder, None)
         if not templates:
@@ -130,5 +315,5 @@ class ResponderBase:
         if len(keys) < 2:
             return response
         template = templates[keys[1]]
-        json_string = jinja2_env.from_string(template).render(request=request, response=response)
+        json_string = self._get_template(template).render(request=request, response=response)
         return json_string
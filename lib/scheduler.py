@@ -0,0 +1,210 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_TENANT = "default"
+
+
+@dataclass
+class _Ticket:
+    """A request waiting for the inference flow"""
+    priority: str
+    tenant: str
+    start: float
+    finish: float
+    future: asyncio.Future
+    enqueued: float = field(default_factory=time.monotonic)
+
+
+class _ClassStats:
+    """Queue depth and latency samples of a priority class"""
+    def __init__(self, window: int):
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.dropped = 0
+        self.wait = deque(maxlen=window)
+        self.latency = deque(maxlen=window)
+
+    @staticmethod
+    def _percentile(samples, q):
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def as_dict(self):
+        return {
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "dropped": self.dropped,
+            "wait_p50": self._percentile(self.wait, 0.5),
+            "wait_p99": self._percentile(self.wait, 0.99),
+            "latency_p50": self._percentile(self.latency, 0.5),
+            "latency_p99": self._percentile(self.latency, 0.99),
+        }
+
+
+class RequestScheduler:
+    """Admission scheduler of the requests to the inference flow
+
+    The inference flow serves up to max_concurrency requests at a time. Waiting requests are granted
+    by strict priority between the priority classes, and within a class by weighted
+    fair queuing between the tenants, so that a tenant with bulk traffic can't starve
+    the others of the same class.
+
+    The config is the optional 'scheduling' section of the inference config:
+        priority_classes: class names from the highest priority to the lowest
+        default_class: the class of the requests without a valid priority tag
+        tenant_weights: share of each tenant within a class
+        default_weight: share of the tenants not listed in tenant_weights
+        metrics_window: number of latency samples kept per class
+        metrics_interval: seconds between the metrics logs, 0 to disable
+        max_concurrency: number of requests served at the same time, 1 by default
+    """
+    def __init__(self, config: Optional[Dict] = None):
+        config = config or {}
+        self._classes: List[str] = list(config.get("priority_classes", None) or ["default"])
+        self._default_class = config.get("default_class", self._classes[0])
+        if self._default_class not in self._classes:
+            raise ValueError(f"Default class {self._default_class} is not one of the priority classes {self._classes}")
+        self._weights: Dict[str, float] = {k: float(v) for k, v in config.get("tenant_weights", {}).items()}
+        self._default_weight = float(config.get("default_weight", 1.0))
+        if any(w <= 0 for w in self._weights.values()) or self._default_weight <= 0:
+            raise ValueError("Tenant weights must be positive")
+        window = config.get("metrics_window", 1024)
+        # per class: tenant -> FIFO of tickets
+        self._queues: Dict[str, Dict[str, deque]] = {c: {} for c in self._classes}
+        # per class virtual time and per (class, tenant) last finish tag for weighted fair queuing
+        self._vtime: Dict[str, float] = {c: 0.0 for c in self._classes}
+        self._last_finish: Dict[tuple, float] = {}
+        self._stats: Dict[str, _ClassStats] = {c: _ClassStats(window) for c in self._classes}
+        self._max_concurrency = int(config.get("max_concurrency", 1))
+        if self._max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self._running = 0
+        self._metrics_interval = float(config.get("metrics_interval", 60))
+        self._metrics_logged = time.monotonic()
+        logger.info(f"Request scheduler created with classes {self._classes}, tenant weights {self._weights}")
+
+    def classify(self, priority: Optional[str], tenant: Optional[str]):
+        """Map the tags of a request to a known priority class and a tenant"""
+        priority = priority if priority in self._queues else self._default_class
+        return priority, tenant or DEFAULT_TENANT
+
+    @asynccontextmanager
+    async def schedule(self, context):
+        """Wait until the request is granted the inference flow
+
+        Raise asyncio.TimeoutError if the deadline of the request expires in the queue.
+        """
+        priority, tenant = self.classify(getattr(context, "priority", None), getattr(context, "tenant", None))
+        ticket = self._enqueue(priority, tenant)
+        self._dispatch()
+        timeout = None
+        if context.deadline is not None:
+            timeout = max(0.0, context.deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(ticket.future, timeout)
+        except BaseException:
+            # timed out or cancelled while waiting, the grant may have raced with it
+            if ticket.future.done() and not ticket.future.cancelled():
+                self._release(ticket)
+            else:
+                self._remove(ticket)
+            raise
+        stats = self._stats[priority]
+        granted = time.monotonic()
+        stats.wait.append(granted - ticket.enqueued)
+        try:
+            yield
+        finally:
+            stats.latency.append(time.monotonic() - ticket.enqueued)
+            stats.completed += 1
+            self._release(ticket)
+            self._log_metrics()
+
+    def metrics(self) -> Dict[str, Dict]:
+        """Queue depth, in-flight count and latency percentiles in seconds per priority class"""
+        return {c: self._stats[c].as_dict() for c in self._classes}
+
+    def _log_metrics(self):
+        now = time.monotonic()
+        if self._metrics_interval > 0 and now - self._metrics_logged >= self._metrics_interval:
+            self._metrics_logged = now
+            logger.info(f"Request scheduler metrics: {self.metrics()}")
+
+    def _enqueue(self, priority: str, tenant: str) -> _Ticket:
+        key = (priority, tenant)
+        weight = self._weights.get(tenant, self._default_weight)
+        start = max(self._vtime[priority], self._last_finish.get(key, 0.0))
+        finish = start + 1.0 / weight
+        self._last_finish[key] = finish
+        ticket = _Ticket(priority, tenant, start, finish, asyncio.get_running_loop().create_future())
+        self._queues[priority].setdefault(tenant, deque()).append(ticket)
+        self._stats[priority].queued += 1
+        return ticket
+
+    def _remove(self, ticket: _Ticket):
+        queue = self._queues[ticket.priority].get(ticket.tenant, None)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.priority][ticket.tenant]
+            stats = self._stats[ticket.priority]
+            stats.queued -= 1
+            stats.dropped += 1
+        self._dispatch()
+
+    def _release(self, ticket: _Ticket):
+        self._stats[ticket.priority].running -= 1
+        self._running -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        if self._running >= self._max_concurrency:
+            return
+        for priority in self._classes:
+            tenants = self._queues[priority]
+            if not tenants:
+                continue
+            # the head with the smallest finish tag goes first within a class
+            tenant = min(tenants, key=lambda t: tenants[t][0].finish)
+            queue = tenants[tenant]
+            ticket = queue.popleft()
+            if not queue:
+                del tenants[tenant]
+            stats = self._stats[priority]
+            stats.queued -= 1
+            self._vtime[priority] = ticket.start
+            if ticket.future.done():
+                # abandoned by the waiter
+                stats.dropped += 1
+                return self._dispatch()
+            stats.running += 1
+            self._running += 1
+            ticket.future.set_result(True)
+            return self._dispatch()
@@ -0,0 +1,190 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+import numpy as np
+import torch
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+# smallest buffer handed out by the pool
+MIN_BUFFER_SIZE = 4096
+
+
+class HostBufferPool:
+    """Host buffers recycled by power of two size classes
+
+    Allocating, and even more pinning, memory is expensive, so the released buffers are
+    kept for the next copies, up to max_bytes in total.
+    """
+    def __init__(self, max_bytes: int, pin_memory: bool = True):
+        self._max_bytes = max_bytes
+        self._pin_memory = pin_memory
+        self._free = defaultdict(list)
+        self._free_bytes = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, nbytes: int) -> torch.Tensor:
+        size = max(MIN_BUFFER_SIZE, 1 << max(0, nbytes - 1).bit_length())
+        with self._lock:
+            buffers = self._free[size]
+            if buffers:
+                self._free_bytes -= size
+                return buffers.pop()
+        return torch.empty(size, dtype=torch.uint8, pin_memory=self._pin_memory)
+
+    def release(self, buffer: torch.Tensor):
+        size = buffer.numel()
+        with self._lock:
+            if self._free_bytes + size <= self._max_bytes:
+                self._free[size].append(buffer)
+                self._free_bytes += size
+
+
+class Transfer:
+    """A copy in flight, result() waits for its completion and returns the copied tensor"""
+    def __init__(
+        self,
+        value: Any,
+        event: Optional[torch.cuda.Event] = None,
+        finalize: Optional[Callable[[Any], Any]] = None,
+        release: Optional[Callable[[], None]] = None,
+        source: Any = None
+    ):
+        self._value = value
+        self._event = event
+        self._finalize = finalize
+        self._release = release
+        # the source must outlive the copy
+        self._source = source
+        self._done = event is None
+
+    def ready(self) -> bool:
+        return self._done or self._event.query()
+
+    def result(self):
+        if not self._done:
+            self._event.synchronize()
+            if self._finalize is not None:
+                self._value = self._finalize(self._value)
+            if self._release is not None:
+                self._release()
+            self._source = None
+            self._done = True
+        return self._value
+
+
+class TransferManager:
+    """Asynchronous host to device and device to host copies of a device
+
+    The copies are staged through pinned buffers and run on dedicated streams, so that
+    they neither block the caller nor serialize with the work on the default stream.
+    Each copy is returned as a Transfer whose completion is tracked by a CUDA event.
+    Without CUDA, the copies fall back to plain host tensors.
+    """
+    _managers: Dict[int, "TransferManager"] = {}
+    _managers_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, device_id: int = 0) -> "TransferManager":
+        """The manager shared by all the users of a device"""
+        with cls._managers_lock:
+            manager = cls._managers.get(device_id, None)
+            if manager is None:
+                manager = cls(device_id)
+                cls._managers[device_id] = manager
+            return manager
+
+    def __init__(self, device_id: int = 0, pool_bytes: int = 256 * 2**20):
+        self._enabled = torch.cuda.is_available()
+        self._device = torch.device("cuda", device_id) if self._enabled else torch.device("cpu")
+        if self._enabled:
+            self._h2d_stream = torch.cuda.Stream(self._device)
+            self._d2h_stream = torch.cuda.Stream(self._device)
+            self._pool = HostBufferPool(pool_bytes)
+        logger.info(f"Transfer manager created for {self._device}")
+
+    @property
+    def device(self):
+        return self._device
+
+    def to_device(self, value) -> Transfer:
+        """Start copying a numpy array or a host tensor to the device"""
+        if isinstance(value, np.ndarray):
+            value = torch.from_numpy(np.ascontiguousarray(value))
+        if not self._enabled or value.device.type == "cuda":
+            return Transfer(value)
+        staging, staged = self._stage(value)
+        staged.copy_(value)
+        # allocated on the stream of the caller who owns the result
+        result = torch.empty(value.shape, dtype=value.dtype, device=self._device)
+        with torch.cuda.stream(self._h2d_stream):
+            self._h2d_stream.wait_stream(torch.cuda.current_stream(self._device))
+            result.copy_(staged, non_blocking=True)
+            event = torch.cuda.Event()
+            event.record(self._h2d_stream)
+        return Transfer(result, event, release=lambda: self._pool.release(staging))
+
+    def to_host(self, tensor: torch.Tensor) -> Transfer:
+        """Start copying a device tensor to the host"""
+        if not self._enabled or tensor.device.type != "cuda":
+            return Transfer(tensor)
+        staging, staged = self._stage(tensor)
+        with torch.cuda.stream(self._d2h_stream):
+            # the copy starts after the pending work producing the tensor
+            self._d2h_stream.wait_stream(torch.cuda.current_stream(tensor.device))
+            staged.copy_(tensor, non_blocking=True)
+            event = torch.cuda.Event()
+            event.record(self._d2h_stream)
+        # the result is copied out of the staging buffer before the buffer is recycled
+        return Transfer(staged, event, finalize=lambda t: t.clone(), release=lambda: self._pool.release(staging), source=tensor)
+
+    def start_upload(self, data: Dict) -> Dict:
+        """Start copying the host tensors of a dict to the device, the other values are kept as is"""
+        return {
+            k: self.to_device(v) if isinstance(v, torch.Tensor) or (isinstance(v, np.ndarray) and v.dtype.kind in "biuf") else v
+            for k, v in data.items()
+        }
+
+    def upload(self, data: Dict) -> Dict:
+        """Copy the host tensors of a dict to the device, the copies overlap with each other only"""
+        return self._finish_upload(self.start_upload(data))
+
+    def prefetch(self, items: Iterable[Dict]) -> Iterator[Dict]:
+        """Upload a sequence of dicts, the copies of the next dict start before the current one is yielded
+
+        The copies of each dict thus overlap with the work the caller does on the previous one.
+        """
+        pending = None
+        for data in items:
+            transfers = self.start_upload(data)
+            if pending is not None:
+                yield self._finish_upload(pending)
+            pending = transfers
+        if pending is not None:
+            yield self._finish_upload(pending)
+
+    @staticmethod
+    def _finish_upload(transfers: Dict) -> Dict:
+        return {k: v.result() if isinstance(v, Transfer) else v for k, v in transfers.items()}
+
+    def _stage(self, tensor: torch.Tensor):
+        nbytes = tensor.numel() * tensor.element_size()
+        staging = self._pool.acquire(nbytes)
+        return staging, staging[:nbytes].view(tensor.dtype).view(tensor.shape)
@@ -19,7 +19,10 @@ import re
 import sys
 import logging
 import time
-from typing import Callable, Optional, List, Dict
+import threading
+import dataclasses
+from collections import OrderedDict
+from typing import Any, Callable, Optional, List, Dict
 import importlib
 import numpy as np
 import torch
@@ -93,6 +96,13 @@ def convert_list(i: List, f: Callable):
     else:
         return f(i)
 
+def serialize_dataclass(value) -> Dict:
+    """Convert a dataclass to a dict, through its own to_dict() if it defines one"""
+    to_dict = getattr(value, "to_dict", None)
+    if callable(to_dict):
+        return to_dict()
+    return dataclasses.asdict(value)
+
 def import_class(module_name, class_name):
     # Import the module using importlib
     module = importlib.import_module(module_name)
@@ -169,6 +179,110 @@ def get_logger(name: Optional[str] = None) -> logging.Logger:
     # logger.addHandler(stream_handler)
     return logger
 
+def summarize_tensors(value: Any, max_items: int = 8, max_chars: int = 128) -> str:
+    """ Summarize a value for logging without rendering the tensor data
+
+        numpy arrays and torch tensors are summarized with shape and dtype only,
+        dicts, lists and dataclasses are summarized recursively with at most
+        max_items entries and strings are truncated to max_chars.
+    """
+    def summarize(v, depth):
+        if isinstance(v, np.ndarray):
+            return f"ndarray(shape={v.shape}, dtype={v.dtype})"
+        if isinstance(v, torch.Tensor):
+            return f"Tensor(shape={tuple(v.shape)}, dtype={v.dtype}, device={v.device})"
+        if depth > 3:
+            return f"{type(v).__name__}(...)"
+        if isinstance(v, dict):
+            items = [f"{k!r}: {summarize(x, depth + 1)}" for k, x in list(v.items())[:max_items]]
+            if len(v) > max_items:
+                items.append(f"... {len(v) - max_items} more")
+            return "{" + ", ".join(items) + "}"
+        if isinstance(v, (list, tuple)):
+            items = [summarize(x, depth + 1) for x in v[:max_items]]
+            if len(v) > max_items:
+                items.append(f"... {len(v) - max_items} more")
+            return ("[" + ", ".join(items) + "]") if isinstance(v, list) else ("(" + ", ".join(items) + ")")
+        if dataclasses.is_dataclass(v) and not isinstance(v, type):
+            fields = [f"{f.name}={summarize(getattr(v, f.name), depth + 1)}" for f in dataclasses.fields(v)]
+            return f"{type(v).__name__}(" + ", ".join(fields) + ")"
+        text = repr(v)
+        return text if len(text) <= max_chars else f"{text[:max_chars]}...({len(text)} chars)"
+    return summarize(value, 0)
+
+class LazyTensorSummary:
+    """ A log argument summarizing tensors only when the record is emitted
+
+        Example:
+            logger.debug("Input collected: %s", LazyTensorSummary(data))
+    """
+    __slots__ = ("_value",)
+
+    def __init__(self, value: Any):
+        self._value = value
+
+    def __str__(self):
+        return summarize_tensors(self._value)
+
+    __repr__ = __str__
+
+class RateLimitFilter(logging.Filter):
+    """ Filter dropping repeated log messages within a time interval
+
+        Messages are identified by logger, level and the unformatted message,
+        so hot path messages using lazy %-style arguments are rate limited
+        regardless of their arguments. Errors are never dropped.
+    """
+    def __init__(self, interval: float, max_entries: int = 1024):
+        super().__init__()
+        self._interval = interval
+        self._max_entries = max_entries
+        self._history = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def interval(self):
+        return self._interval
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self._interval <= 0 or record.levelno >= logging.ERROR:
+            return True
+        key = (record.name, record.levelno, record.msg if isinstance(record.msg, str) else type(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            last, suppressed = self._history.get(key, (None, 0))
+            if last is not None and now - last < self._interval:
+                self._history[key] = (last, suppressed + 1)
+                return False
+            self._history[key] = (now, 0)
+            self._history.move_to_end(key)
+            while len(self._history) > self._max_entries:
+                self._history.popitem(last=False)
+        if suppressed and isinstance(record.msg, str):
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+def configure_logging(config: Optional[Dict] = None):
+    """ Apply the logging settings from the inference config
+
+        Parameters:
+        config: the 'logging' section of the config with optional keys:
+            level: log level of all the component loggers
+            levels: a map from module names to log levels, e.g. {"lib.inference": "WARNING"}
+            rate_limit: minimal interval in seconds between repeated messages, 0 to disable
+    """
+    config = config if config else {}
+    if "level" in config:
+        logging.getLogger(PACKAGE_NAME).setLevel(str(config["level"]).upper())
+    for module, level in config.get("levels", {}).items():
+        logging.getLogger(f"{PACKAGE_NAME}.{module}").setLevel(str(level).upper())
+    interval = float(config.get("rate_limit", os.getenv("LOG_RATE_LIMIT", "0")))
+    for handler in logging.getLogger().handlers:
+        for f in [f for f in handler.filters if isinstance(f, RateLimitFilter)]:
+            handler.removeFilter(f)
+        if interval > 0:
+            handler.addFilter(RateLimitFilter(interval))
+
 def flush(logger):
     for h in logger.handlers:
         h.flush()
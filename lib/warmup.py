@@ -0,0 +1,128 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+
+GENERATORS = ("random", "randint", "zeros", "ones")
+
+
+class WarmupPlan:
+    """The batches a model is warmed up with, from the warmup section of its config
+
+        warmup:
+          batch_sizes: [1, 4]       # batch sizes to cover, [1] by default
+          dynamic_sizes: [16, 64]   # sizes of the dynamic dimensions to cover, [16] by default
+          iterations: 2             # runs of each batch, 1 by default
+          inputs:
+            image: {sample: warmup.jpg}       # file relative to the model home, .npy or raw bytes
+            mime: {value: image/jpeg}         # literal value
+            input_ids: {generator: randint, low: 0, high: 1000, shape: [-1]}
+
+    The model inputs without an entry are generated from their data type and dims, unless
+    they are optional, produced by a preprocessor from the given inputs, or of a custom
+    type, which can't be synthesized.
+    """
+    def __init__(
+        self,
+        warmup_config: Dict,
+        input_configs: List[Dict],
+        np_types: Dict[str, Any],
+        model_home: str,
+        preprocessors: Optional[List[Dict]] = None,
+        seed: int = 0
+    ):
+        self._batch_sizes = [int(b) for b in warmup_config.get("batch_sizes", [1])]
+        self._dynamic_sizes = [int(d) for d in warmup_config.get("dynamic_sizes", [16])]
+        self._iterations = int(warmup_config.get("iterations", 1))
+        if not self._batch_sizes or min(self._batch_sizes) < 1:
+            raise ValueError(f"Invalid warmup batch sizes {self._batch_sizes}")
+        if not self._dynamic_sizes or min(self._dynamic_sizes) < 1:
+            raise ValueError(f"Invalid warmup dynamic sizes {self._dynamic_sizes}")
+        self._rng = np.random.default_rng(seed)
+        self._model_home = model_home
+        configs = {c["name"]: c for c in input_configs}
+        self._specs = {}
+        for name, spec in (warmup_config.get("inputs", None) or {}).items():
+            if not isinstance(spec, dict) or len({"sample", "value", "generator"} & spec.keys()) != 1:
+                raise ValueError(f"Warmup input {name} needs one of sample, value or generator")
+            if "generator" in spec and spec["generator"] not in GENERATORS:
+                raise ValueError(f"Unknown warmup generator {spec['generator']} of {name}, expecting one of {GENERATORS}")
+            if "generator" in spec and name not in np_types and "shape" not in spec:
+                raise ValueError(f"Warmup input {name} isn't a model input, its generator needs a shape")
+            self._specs[name] = self._load(spec) if "sample" in spec else spec
+        # the inputs produced by the preprocessors from the given ones aren't generated
+        produced = set()
+        for processor in preprocessors or []:
+            if all(i in self._specs or i in produced for i in processor.get("input", [])):
+                produced.update(processor.get("output", []))
+        for name, config in configs.items():
+            if name in self._specs or name in produced or config.get("optional", False):
+                continue
+            if config["data_type"].startswith("TYPE_CUSTOM") or np_types.get(name, None) is None:
+                raise ValueError(f"Warmup input {name} of {config['data_type']} can't be generated, it needs a sample or a value")
+            self._specs[name] = {"generator": "random"}
+        self._configs = configs
+        self._np_types = np_types
+
+    @property
+    def n_batches(self):
+        return len(self._batch_sizes) * len(self._dynamic_sizes) * self._iterations
+
+    def batches(self) -> Iterator[Tuple[int, int, List[Dict]]]:
+        """Batch size, dynamic size and items of each warmup batch"""
+        for dynamic_size in self._dynamic_sizes:
+            for batch_size in self._batch_sizes:
+                for _ in range(self._iterations):
+                    yield batch_size, dynamic_size, [self._item(dynamic_size) for _ in range(batch_size)]
+
+    def _load(self, spec: Dict) -> Dict:
+        path = spec["sample"]
+        if not os.path.isabs(path):
+            path = os.path.join(self._model_home, path)
+        if not os.path.exists(path):
+            raise ValueError(f"Warmup sample {path} doesn't exist")
+        if path.endswith(".npy"):
+            return {"value": np.load(path)}
+        with open(path, "rb") as f:
+            return {"value": np.frombuffer(f.read(), dtype=np.uint8)}
+
+    def _item(self, dynamic_size: int) -> Dict:
+        item = {}
+        for name, spec in self._specs.items():
+            if "value" in spec:
+                value = spec["value"]
+                item[name] = value.copy() if isinstance(value, np.ndarray) else np.array(value)
+            else:
+                item[name] = self._generate(name, spec, dynamic_size)
+        return item
+
+    def _generate(self, name: str, spec: Dict, dynamic_size: int) -> np.ndarray:
+        dims = spec.get("shape", None) or self._configs[name]["dims"]
+        shape = [dynamic_size if d < 0 else d for d in dims]
+        dtype = np.dtype(spec["dtype"]) if "dtype" in spec else np.dtype(self._np_types.get(name, np.float32))
+        generator = spec["generator"]
+        if dtype.kind in "SUO":
+            return np.full(shape, b"warmup")
+        if generator == "zeros":
+            return np.zeros(shape, dtype=dtype)
+        if generator == "ones":
+            return np.ones(shape, dtype=dtype)
+        if generator == "randint" or dtype.kind in "iub":
+            high = spec.get("high", 2 if dtype.kind == "b" else 100)
+            return self._rng.integers(spec.get("low", 0), high, size=shape).astype(dtype)
+        return self._rng.standard_normal(shape).astype(dtype)
@@ -20,8 +20,10 @@ import json
 from dataclasses import asdict
 from config import global_config
 from .model import GenericInference
-from lib.utils import create_jinja2_env, convert_list
+from lib.utils import create_jinja2_env, convert_list, LazyTensorSummary
 from lib.responder import ResponderBase
+from lib.scheduler import RequestScheduler
+from omegaconf import OmegaConf
 import re
 import numpy as np
 import torch
@@ -34,7 +36,10 @@ class Responder(ResponderBase):
         super().__init__()
         self._inference = GenericInference()
         self._inference.initialize()
-        self._lock = asyncio.Lock()
+        # requests are admitted to the inference flow one at a time by priority and tenant
+        scheduling = OmegaConf.to_container(global_config.scheduling) if hasattr(global_config, "scheduling") else None
+        self._scheduler = RequestScheduler(scheduling)
+        self._output_types = {i.name: i.data_type for i in global_config.output}
 
         # initialize the action map
         {% for responder in responders %}
@@ -49,33 +54,48 @@ class Responder(ResponderBase):
         # the helper function transforms the HTTP request to a dictionary that satisfies the inference input schema
         return super().process_request(responder, request)
 
+    def _convert_outputs(self, response: Dict[str, Any]):
+        # transform numpy ndarray or tensor to universal value types for inference
+        type_map = self._output_types
+        for name in response:
+            if not name in type_map:
+                self.logger.error("Unexpected output: %s", name)
+                continue
+            expected_type = type_map[name]
+            value = response[name]
+            if isinstance(value, np.ndarray) or isinstance(value, torch.Tensor):
+                l = value.tolist()
+                if expected_type == "TYPE_STRING" and value.dtype != np.string_:
+                    response[name] = convert_list(l, lambda i: i.decode("utf-8", "ignore"))
+                elif len(response[name].shape) == 1 and len(l) == 1:
+                    response[name] = l[0]
+                else:
+                    response[name] = l
+
     def process_response(self, responder: str, request, response: Dict[str, Any]):
         accept = request.headers.get("accept", "")
         streaming = "application/x-ndjson" in accept
-        # transform numpy ndarray or tensor to universal value types for inference
         if responder == "infer":
-            type_map = { i.name: i.data_type for i in global_config.output}
-            for name in response:
-                if not name in type_map:
-                    self.logger.error(f"Unexpected output: {name}")
-                    continue
-                expected_type = type_map[name]
-                value = response[name]
-                if isinstance(value, np.ndarray) or isinstance(value, torch.Tensor):
-                    l = value.tolist()
-                    if expected_type == "TYPE_STRING" and value.dtype != np.string_:
-                        response[name] = convert_list(l, lambda i: i.decode("utf-8", "ignore"))
-                    elif len(response[name].shape) == 1 and len(l) == 1:
-                        response[name] = l[0]
-                    else:
-                        response[name] = l
+            self._convert_outputs(response)
 
         # the helper function transforms the inference output to a json string
         json_string = super().process_response(responder, request, response)
-        self.logger.debug(f"Sending json payload: {json_string}")
+        self.logger.debug("Sending json payload: %s", LazyTensorSummary(json_string))
 
         return (json.dumps(json.loads(json_string), separators=(',', ':')) + "\n") if streaming else json.loads(json_string)
 
+    def process_streamed_response(self, responder: str, request, response: Dict[str, Any], envelope=None):
+        # fall back to the full response if no template is given for the partial ones
+        if len(self._response_templates.get(responder, {})) < 2:
+            return self.process_response(responder, request, response)
+        if responder == "infer":
+            self._convert_outputs(response)
+        if envelope is not None:
+            # the envelope is rendered once per request, only the values are substituted
+            return envelope.format(response) + "\n"
+        json_string = super().process_streamed_response(responder, request, response)
+        return json.dumps(json.loads(json_string), separators=(',', ':')) + "\n"
+
     async def take_action(self, action_name:str, **kwargs):
         action = self._action_map.get(action_name, None)
         if not action:
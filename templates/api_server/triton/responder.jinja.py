@@ -19,7 +19,7 @@
 import json
 from .data_model import {{ triton.request_class }}, {{ triton.response_class }}, {{ triton.streaming_response_class }}
 from config import global_config
-from lib.utils import create_jinja2_env, convert_list, get_logger
+from lib.utils import create_jinja2_env, convert_list, get_logger, LazyTensorSummary
 from typing import Dict, Any, Optional, List, Union
 import numpy as np
 import torch
@@ -63,14 +63,14 @@ class TritonInferenceHandlerBridge(TritonInferenceHandler):
         previous_responses: Optional[List[Dict[str, np.ndarray]]],
         headers
     ) -> Union[{{ triton.response_class }}, {{ triton.streaming_response_class }}]:
-        self.logger.debug(f"Processing response {response}")
+        self.logger.debug("Processing response %s", LazyTensorSummary(response))
         type_map = { i.name: i.data_type for i in global_config.output}
         # Formulating streaming response
         if hasattr(request, 'stream') and request.stream:
             streamed = dict()
             for name, value in response.items():
                 if value is None:
-                    self.logger.error(f"{name} in response is None")
+                    self.logger.error("%s in response is None", name)
                     continue
                 expected_type = type_map[name]
                 if isinstance(value, np.ndarray) or isinstance(value, torch.Tensor):
@@ -90,7 +90,7 @@ class TritonInferenceHandlerBridge(TritonInferenceHandler):
         for response in responses:
             for name, value in response.items():
                 if value is None:
-                    logger.error(f"{name} in response is None")
+                    logger.error("%s in response is None", name)
                     continue
                 if isinstance(value, np.ndarray):
                     if name in acc:
@@ -15,16 +15,26 @@
  limitations under the License.
 #}
 
-from pyservicemaker import Pipeline, Flow, BufferProvider, Buffer, RenderMode, BatchMetadataOperator, Probe, as_tensor, StateTransitionMessage
+from pyservicemaker import Pipeline, Flow, BufferProvider, Buffer, RenderMode, BatchMetadataOperator, Probe, as_tensor, StateTransitionMessage, DynamicSourceMessage
 from typing import Dict, List
 from queue import Queue, Empty, Full
+from collections import Counter, deque
 from dataclasses import dataclass, field
 import base64
+import itertools
 import numpy as np
 from abc import ABC, abstractmethod
 import yaml
 import tempfile
 import os
+import json
+import threading
+import urllib.request
+import time
+from lib.transfer import Transfer, TransferManager
+from lib.buffers import EncodedBufferPool
+from lib.masks import encode_mask, MASK_ENCODINGS
+from lib.engine_cache import EngineCache
 
 png_data = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAAEElEQVR4nGK6HcwNCAAA//8DTgE8HuxwEQAAAABJRU5ErkJggg==")
 jpg_data = base64.b64decode("/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDAAIBAQEBAQIBAQECAgICAgQDAgICAgUEBAMEBgUGBgYFBgYGBwkIBgcJBwYGCAsICQoKCgoKBggLDAsKDAkKCgr/2wBDAQICAgICAgUDAwUKBwYHCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgr/wAARCAAgACADASIAAhEBAxEB/8QAHwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUFBAQAAAF9AQIDAAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkKFhcYGRolJicoKSo0NTY3ODk6Q0RFRkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/8QAHwEAAwEBAQEBAQEBAQAAAAAAAAECAwQFBgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3AAECAxEEBSExBhJBUQdhcRMiMoEIFEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRomJygpKjU2Nzg5OkNERUZHSElKU1RVVldYWVpjZGVmZ2hpanN0dXZ3eHl6goOEhYaHiImKkpOUlZaXmJmaoqOkpaanqKmqsrO0tba3uLm6wsPExcbHyMnK0tPU1dbX2Nna4uPk5ebn6Onq8vP09fb3+Pn6/9oADAMBAAIRAxEAPwD+f+iiigAooooAKKKKACiiigD/2Q==")
@@ -117,7 +127,7 @@ class KittiConfig:
 
 class ImageTensorInput(BufferProvider):
 
-    def __init__(self, height, width, format):
+    def __init__(self, height, width, format, encoded_buffers: EncodedBufferPool):
         super().__init__()
         self.width = width
         self.height = height
@@ -125,25 +135,49 @@ class ImageTensorInput(BufferProvider):
         self.framerate = 1
         self.device = 'cpu'
         self.queue = Queue(maxsize=1)
+        self._encoded_buffers = encoded_buffers
+        # the encoded bytes in flight and their pooled storage, kept until the output is collected
+        self._sent = None
 
     def generate(self, size):
-        tensor = self.queue.get()
-        if isinstance(tensor, np.ndarray):
-            return Buffer(tensor.tolist())
-        elif isinstance(tensor, Stop):
+        item = self.queue.get()
+        if isinstance(item, tuple):
+            tensor, sequence_id = item
+            buffer = self._encoded_buffers.wrap(tensor)
+            # the PTS carries the sequence id of the submission through the pipeline
+            buffer.timestamp = sequence_id
+            return buffer
+        elif isinstance(item, Stop):
             # EOS
             return Buffer()
         else:
             logger.exception("Unexpected input tensor data")
             return Buffer()
 
-    def send(self, data):
+    def send(self, data, storage=None, sequence_id=0):
+        if isinstance(data, np.ndarray):
+            self._sent = (data, storage)
+            data = (data, sequence_id)
         self.queue.put(data)
 
+    def release(self):
+        if self._sent is not None:
+            _, storage = self._sent
+            if storage is not None:
+                self._encoded_buffers.release(storage)
+            self._sent = None
+
+def device_tensor(value, device_id):
+    """The pipeline tensor of an uploaded tensor, or of a value which wasn't uploaded"""
+    if isinstance(value, Transfer):
+        return as_tensor(value.result(), "")
+    return as_tensor(value, "").to_gpu(device_id)
+
 class GenericTensorInput():
     def __init__(self, device_id):
         self.queue = Queue(maxsize=1)
         self._device_id = device_id
+        self._transfer = TransferManager.get(device_id)
 
     def generate(self, n):
         try:
@@ -151,23 +185,28 @@ class GenericTensorInput():
         except Empty:
             logger.warning("No tensor data to generate")
             return dict()
-        result = {k: as_tensor(v, "").to_gpu(self._device_id) for k, v in tensors.items()}
+        # the copies were started when the tensors were sent and have mostly completed by now
+        result = {k: device_tensor(v, self._device_id) for k, v in tensors.items()}
         return result
 
     def send(self, data):
+        if isinstance(data, dict):
+            data = self._transfer.start_upload(data)
         self.queue.put(data)
 
 class StaticTensorInput():
     def __init__(self, device_id):
         self._tensors = {}
         self._device_id = device_id
+        self._transfer = TransferManager.get(device_id)
 
     def generate(self, n):
-        result = {k: as_tensor(v, "").to_gpu(self._device_id) for k, v in self._tensors.items()}
+        result = {k: device_tensor(v, self._device_id) for k, v in self._tensors.items()}
         return result
 
     def set(self, data):
-        self._tensors.update(data)
+        # the tensors are copied to the device once and reused by every batch
+        self._tensors.update(self._transfer.start_upload(data))
 
 class TensorInputPool(ABC):
     @abstractmethod
@@ -176,16 +215,30 @@ class TensorInputPool(ABC):
     @abstractmethod
     def stop(self, reason: str):
         pass
+    def release(self, indices: List):
+        """Release the slots of a submission whose results are collected"""
+        pass
 
 class ImageTensorInputPool(TensorInputPool):
 
-    def __init__(self, height, width, formats, batch_size, image_tensor_name, media_url_tensor_name, mime_tensor_name, device_id, require_extra_input):
-        self._image_inputs = [ImageTensorInput(width, height, format) for format in formats for _ in range(batch_size)]
+    def __init__(self, height, width, formats, batch_size, image_tensor_name, media_url_tensor_name, mime_tensor_name, device_id, require_extra_input, output):
+        self._encoded_buffers = EncodedBufferPool(Buffer)
+        self._image_inputs = [ImageTensorInput(width, height, format, self._encoded_buffers) for format in formats for _ in range(batch_size)]
         self._media_url_tensor_name = media_url_tensor_name
         self._mime_tensor_name = mime_tensor_name
         self._image_tensor_name = image_tensor_name
         self._generic_input = GenericTensorInput(device_id) if require_extra_input else None
         self._batch_size = batch_size
+        # indices of the free slots per format, a slot is in use until its output is collected
+        self._free_slots = {
+            format: deque(i for i, x in enumerate(self._image_inputs) if x.format == format)
+            for format in formats
+        }
+        self._slot_released = threading.Condition()
+        # the results are tagged with the sequence id of their submission
+        self._output = output
+        self._output.tag_sequences()
+        self._sequence_ids = itertools.count(1)
 
     @property
     def image_inputs(self):
@@ -196,37 +249,58 @@ class ImageTensorInputPool(TensorInputPool):
         return self._generic_input
 
     def submit(self, data: List):
+        # the slots of a submission are released after its results are collected, so it
+        # can't wait for more slots of a format than there are
+        n_images = Counter(
+            item[self._mime_tensor_name].split('/')[1].upper()
+            for item in data
+            if str(item.get(self._mime_tensor_name, "")).startswith("image/")
+        )
+        oversized = {format: n for format, n in n_images.items() if n > self._batch_size}
+        if oversized:
+            raise ValueError(f"Too many images {oversized} in a batch, no more than {self._batch_size} of each format are allowed")
         indices = []
-        for item in data:
-            mime_type = item.pop(self._mime_tensor_name, None)
-            if mime_type is None:
-                logger.error("MIME type is not specified")
-                continue
-            mime_type = mime_type.split('/');
-            if mime_type[0] == 'image':
-                format = mime_type[1].upper()
-                # try find the free slot for the specific format
-                i, image_tensor_input = next(((i, x) for i,x in enumerate(self._image_inputs) if x.format == format and x.queue.empty()), (-1, None))
-                if image_tensor_input is None:
-                    i, image_tensor_input = next(((i, x) for i,x in enumerate(self._image_inputs) if x.format == format), (-1, None))
-                if image_tensor_input is not None:
+        images = []
+        try:
+            for item in data:
+                mime_type = item.pop(self._mime_tensor_name, None)
+                if mime_type is None:
+                    logger.error("MIME type is not specified")
+                    continue
+                mime_type = mime_type.split('/');
+                if mime_type[0] == 'image':
+                    format = mime_type[1].upper()
+                    if format not in self._free_slots:
+                        logger.error("Unable to find free slot for format %s", format)
+                        continue
+                    storage = None
                     if self._image_tensor_name in item:
                         image_tensor = item.pop(self._image_tensor_name)
-                        image_tensor_input.send(image_tensor)
-                        indices.append(i)
                     elif self._media_url_tensor_name in item:
                         image_url = item.pop(self._media_url_tensor_name)
-                        with open(image_url, 'rb') as f:
-                            image_tensor = np.frombuffer(f.read(), dtype=np.uint8)
-                        image_tensor_input.send(image_tensor)
-                        indices.append(i)
+                        image_tensor, storage = self._encoded_buffers.read(str(image_url))
                     else:
-                        logger.error(f"image tensor or media url is missing: {item}")
+                        logger.error("image tensor or media url is missing: %s", LazyTensorSummary(item))
+                        continue
+                    i = self._acquire_slot(format)
+                    images.append((i, image_tensor, storage))
+                    indices.append(i)
                 else:
-                    logger.error(f"Unable to find free slot for format {format}")
-            else:
-                logger.error(f"Unsupported MIME type {mime_type}")
-                continue
+                    logger.error("Unsupported MIME type %s", mime_type)
+                    continue
+        except Exception:
+            # nothing is sent yet, give the slots and the encoded buffers back
+            for i, _, storage in images:
+                if storage is not None:
+                    self._encoded_buffers.release(storage)
+            self.release(indices)
+            raise
+        # the submission is expected by the output before any of its results can arrive
+        sequence_id = next(self._sequence_ids)
+        if indices:
+            self._output.expect(sequence_id, indices)
+        for i, image_tensor, storage in images:
+            self._image_inputs[i].send(image_tensor, storage, sequence_id)
         if self._generic_input:
             data = [data[i:i + self._batch_size] for i in range(0, len(data), self._batch_size)]
             for d in data:
@@ -234,6 +308,23 @@ class ImageTensorInputPool(TensorInputPool):
         # batched indices for each input
         return indices
 
+    def release(self, indices: List):
+        for i in indices:
+            self._image_inputs[i].release()
+            self._free_slots[self._image_inputs[i].format].append(i)
+        with self._slot_released:
+            self._slot_released.notify_all()
+
+    def _acquire_slot(self, format: str) -> int:
+        """Take a free slot of the format, waiting for one to be released if none is free"""
+        free_slots = self._free_slots[format]
+        while True:
+            try:
+                return free_slots.popleft()
+            except IndexError:
+                with self._slot_released:
+                    self._slot_released.wait_for(lambda: len(free_slots) > 0)
+
     def stop(self, reason: str):
         for input in self._image_inputs:
             input.send(Stop(reason))
@@ -298,7 +389,7 @@ class BulkVideoInputPool(TensorInputPool):
                     return []
                 break
             else:
-                logger.error(f"Invalid input data: {data}")
+                logger.error("Invalid input data: %s", LazyTensorSummary(data))
                 continue
 
         if len(url_list) > self._batch_size:
@@ -328,13 +419,24 @@ class BulkVideoInputPool(TensorInputPool):
                 height=self._dims[0],
                 batched_push_timeout=self._batch_timeout)
 
+        self._build_flow(flow, source_config_file)
+
+        if self._pipeline is not None:
+            self._pipeline.wait()
+
+        pipeline.start()
+        self._pipeline = pipeline
+        return list(range(len(url_list))) if url_list else list(range(self._batch_size))
+
+    def _build_flow(self, flow, source_config_file=None):
+        """Build the inference and the sinks of the pipeline downstream the batched sources"""
         for config in self._preprocess_config_paths:
             flow = flow.preprocess(config, None if not self._generic_input else self._generic_input.generate)
         for config_path, engine_file in zip(self._infer_config_paths, self._engine_file_names):
             if engine_file:
-                flow = flow.infer(config_path, batch_size=self._batch_size, model_engine_file=engine_file)
+                flow = flow.infer(config_path, batch_size=self._batch_size, gpu_id=self._device_id, model_engine_file=engine_file)
             else:
-                flow = flow.infer(config_path, batch_size=self._batch_size)
+                flow = flow.infer(config_path, batch_size=self._batch_size, gpu_id=self._device_id)
             if self._kitti_config.infer_kitti_output_dir:
                 flow = flow.attach(what="kitti_dump_probe", name="inference_kitti_dump", properties={"kitti-dir": self._kitti_config.infer_kitti_output_dir})
         if self._tracker_config:
@@ -392,30 +494,207 @@ class BulkVideoInputPool(TensorInputPool):
         flow.render(RenderMode.DISCARD if not self._render_config.enable_display else RenderMode.DISPLAY,
                     enable_osd=self._render_config.enable_osd, sync=False)
 
-        if self._pipeline is not None:
-            self._pipeline.wait()
-
-        pipeline.start()
-        self._pipeline = pipeline
-        return list(range(len(url_list))) if url_list else list(range(self._batch_size))
-
     def stop(self, reason: str):
         if self._pipeline:
             self._pipeline.stop()
             self._pipeline.wait()
 
 
+class DynamicVideoInputPool(BulkVideoInputPool):
+    """Video input pool of a long-lived pipeline whose sources are added and removed on the fly
+
+    The pipeline batches its sources with nvmultiurisrcbin and is started once, so the
+    engines and the elements are set up once for all the requests. The media urls of a
+    request are added as new sources through the REST API of nvmultiurisrcbin, one at a
+    time, and the pad index of each source is the source id nvmultiurisrcbin reports when
+    the source is added. The results are routed back to the request by the pad index, those
+    arriving before the request claims the pad are stashed and replayed to it.
+    Sources of concurrent requests share the batch, and a request ends once its sources
+    are removed, either at their end of stream or after their results are collected.
+    """
+    def __init__(self, rest_port: int, **kwargs):
+        super().__init__(**kwargs)
+        self._rest_port = rest_port
+        self._rest_url = f"http://localhost:{rest_port}/api/v1/stream"
+        # pad index -> camera id of the sources of the requests
+        self._camera_ids = {}
+        # camera id -> source id of the sources reported added by nvmultiurisrcbin
+        self._added = {}
+        self._n_free = self._batch_size
+        self._n_added = 0
+        self._add_timeout = 10
+        self._condition = threading.Condition()
+        self._add_lock = threading.Lock()
+        self._output.route_sources()
+        pipeline = Pipeline(f"deepstream-video-dynamic")
+        pipeline.add("nvmultiurisrcbin", "src", {
+            "port": str(rest_port),
+            "ip-address": "localhost",
+            "max-batch-size": self._batch_size,
+            "batched-push-timeout": self._batch_timeout,
+            "width": self._dims[1],
+            "height": self._dims[0],
+            "live-source": False,
+            "drop-pipeline-eos": True,
+            "async-handling": True,
+        })
+        self._build_flow(Flow(pipeline, ["src"]))
+        pipeline.start(self._on_message)
+        self._pipeline = pipeline
+        logger.info(f"Dynamic video pipeline started, sources are managed on port {rest_port}")
+
+    def submit(self, data: List):
+        url_list = []
+        for item in data:
+            if self._mime_tensor_name and self._mime_tensor_name in item:
+                item.pop(self._mime_tensor_name)
+            if self._media_url_tensor_name and self._media_url_tensor_name in item:
+                url_list.append(str(item.pop(self._media_url_tensor_name)))
+            else:
+                logger.error("Only media urls are supported by the dynamic video sources: %s", LazyTensorSummary(item))
+        if len(url_list) > self._batch_size:
+            logger.warning(
+                f"Number of media urls ({len(url_list)}) > "
+                f"batch size ({self._batch_size}), "
+                f"only the first {self._batch_size} will be used"
+            )
+            url_list = url_list[:self._batch_size]
+        if self._generic_input and data:
+            self._generic_input.set(stack_tensors_in_dict(data))
+        # wait for the sources of the other requests to leave room for all the urls
+        with self._condition:
+            self._condition.wait_for(lambda: self._n_free >= len(url_list))
+            self._n_free -= len(url_list)
+        indices = []
+        for url in url_list:
+            index = self._add_source(url)
+            if index is not None:
+                indices.append(index)
+        if len(indices) < len(url_list):
+            with self._condition:
+                self._n_free += len(url_list) - len(indices)
+                self._condition.notify_all()
+        return indices
+
+    def release(self, indices: List):
+        for index in indices:
+            with self._condition:
+                camera_id = self._camera_ids.get(index, None)
+            if camera_id is not None:
+                self._remove_source(camera_id)
+        self._output.close_sources(indices)
+        with self._condition:
+            for index in indices:
+                camera_id = self._camera_ids.pop(index, None)
+                if camera_id is not None:
+                    self._added.pop(camera_id, None)
+                    self._n_free += 1
+            self._condition.notify_all()
+
+    def _add_source(self, url: str) -> int | None:
+        """Add a source and return its pad index, None if it isn't added
+
+        The results of a pad are stashed until the source is reported added on it, then
+        the request claims the pad and the stashed results are replayed to it.
+        """
+        if "://" not in url:
+            url = "file://" + os.path.abspath(url)
+        # a single source is added at a time, so the pad reported added is the one of this source
+        with self._add_lock:
+            self._n_added += 1
+            camera_id = f"source-{self._n_added}"
+            # the sources added before have claimed their pads, the results left are of removed sources
+            self._output.discard_stashed_sources()
+            try:
+                self._request("add", camera_id, url, "camera_add")
+                with self._condition:
+                    if not self._condition.wait_for(lambda: camera_id in self._added, self._add_timeout):
+                        raise Exception(f"source not reported added in {self._add_timeout}s")
+                    index = self._added[camera_id]
+                    # the pad of an ended source is released by its request shortly
+                    self._condition.wait_for(lambda: index not in self._camera_ids, self._add_timeout)
+                    if index in self._camera_ids:
+                        raise Exception(f"pad index {index} is still used by source {self._camera_ids[index]}")
+                    self._camera_ids[index] = camera_id
+            except Exception as e:
+                logger.error("Failed to add video source %s: %s", url, e)
+                self._remove_source(camera_id)
+                with self._condition:
+                    self._added.pop(camera_id, None)
+                return None
+            self._output.open_sources([index])
+        return index
+
+    def _remove_source(self, camera_id: str):
+        try:
+            self._request("remove", camera_id, "", "camera_remove")
+        except Exception as e:
+            # a source reaching its end is removed by nvmultiurisrcbin already
+            logger.debug("Video source %s not removed: %s", camera_id, e)
+
+    def _on_message(self, message):
+        if not isinstance(message, DynamicSourceMessage):
+            return
+        with self._condition:
+            camera_id = self._camera_ids.get(message.source_id, None)
+            if message.source_added:
+                self._added[message.sensor_id] = message.source_id
+                self._condition.notify_all()
+                # a new source on the pad means the one of the request has been removed
+                ended = camera_id is not None and camera_id != message.sensor_id
+            else:
+                ended = camera_id == message.sensor_id
+        if ended:
+            # the request stops waiting for the results of the removed source,
+            # the next results of the pad are stashed for the new source
+            self._output.end_sources([message.source_id])
+
+    def _request(self, action: str, camera_id: str, url: str, change: str):
+        body = {
+            "key": "sensor",
+            "value": {
+                "camera_id": camera_id,
+                "camera_name": camera_id,
+                "camera_url": url,
+                "change": change,
+            },
+            "headers": {"source": "inference-builder"},
+        }
+        request = urllib.request.Request(
+            f"{self._rest_url}/{action}",
+            data=json.dumps(body).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=10) as response:
+            response.read()
+
+
 class BaseTensorOutput(BatchMetadataOperator):
     def __init__(self, n_outputs, name: str = None):
         super().__init__()
         self._queue = Queue(maxsize=n_outputs)
         self._stashed = None
         self._name = name
+        # pad index -> results of a source added on the fly, None if the sources are static
+        self._sources = None
+        self._ended_sources = set()
+        # pad index -> results stashed until a request claims the source of the pad
+        self._stashed_sources = {}
+        self._sources_lock = threading.Lock()
+        # sequence id -> results of a pending submission by pad index, None if not tagged
+        self._pending = None
+        self._pending_sequences = {}
+        self._pending_updated = threading.Condition()
+        # PTS of the last result which didn't match a pending submission
+        self._unmatched_pts = None
 
     def handle_metadata(self, batch_meta):
         pass
 
-    def collect(self, indices: List, timeout=None) -> List | None:
+    def collect(self, indices: List, timeout=None, check_sequence=False) -> List | None:
+        if self._pending is not None:
+            return self._collect_submission(indices, timeout, check_sequence)
         # expected results for a batch
         collected = [None] * (max(indices) + 1)
 
@@ -440,7 +719,7 @@ class BaseTensorOutput(BatchMetadataOperator):
             # signal the end of the inference run
             return None
         # rearrange the results to the required order
-        collected = [collected[i] for i in indices]
+        collected = [self._complete(collected[i]) for i in indices]
         return collected if self._name is None else [
             {self._name: r} for r in collected
         ]
@@ -449,10 +728,161 @@ class BaseTensorOutput(BatchMetadataOperator):
         self._queue = Queue(maxsize=self._queue.maxsize)
         self._stashed = None
 
-    def _deposit(self, index: int, data: dict):
+    def tag_sequences(self):
+        """Route the results by the sequence id of their submissions carried in the PTS"""
+        self._pending = {}
+
+    def expect(self, sequence_id: int, indices: List):
+        """Register a submission whose results will be collected from the pad indices"""
+        with self._pending_updated:
+            self._pending[sequence_id] = {}
+            self._unmatched_pts = None
+            for i in indices:
+                self._pending_sequences[i] = sequence_id
+
+    def _collect_submission(self, indices: List, timeout=None, check_sequence=False) -> List | None:
+        """Collect the results of a submission
+
+        With check_sequence, a result of another submission fails the collection. With a
+        single submission in flight, e.g. at startup, it means that the pipeline doesn't
+        keep the sequence ids carried in the PTS, and no result would ever be collected.
+        """
+        if not indices:
+            return None
+        with self._pending_updated:
+            # an input slot belongs to a single submission in flight
+            sequence_id = self._pending_sequences.get(indices[0], None)
+            results = self._pending.get(sequence_id, None)
+            if results is None:
+                return None
+            self._pending_updated.wait_for(
+                lambda: all(i in results for i in indices) or (check_sequence and self._unmatched_pts is not None),
+                timeout
+            )
+            unmatched_pts = self._unmatched_pts
+            # the submission is done, results arriving later are dropped
+            del self._pending[sequence_id]
+            for i in indices:
+                if self._pending_sequences.get(i, None) == sequence_id:
+                    del self._pending_sequences[i]
+        if check_sequence and unmatched_pts is not None:
+            raise Exception(
+                f"DeepstreamBackend: a result of submission {sequence_id} came with PTS {unmatched_pts}, "
+                f"the pipeline doesn't keep the sequence ids carried in the PTS"
+            )
+        if not results:
+            # signal the end of the inference run
+            return None
+        collected = [self._complete(results[i]) if i in results else None for i in indices]
+        return [
+            {} if r is None else r if self._name is None else {self._name: r}
+            for r in collected
+        ]
+
+    def route_sources(self):
+        """Route the results by the pad indices opened for the requests"""
+        self._sources = {}
+
+    def open_sources(self, indices: List):
+        """Route the results of the pads to a request, starting with those stashed before"""
+        with self._sources_lock:
+            for i in indices:
+                queue = Queue(maxsize=self._queue.maxsize)
+                for data in self._stashed_sources.pop(i, ()):
+                    queue.put_nowait(data)
+                self._sources[i] = queue
+                self._ended_sources.discard(i)
+
+    def discard_stashed_sources(self):
+        """Drop the results stashed for the pads no request has claimed"""
+        with self._sources_lock:
+            for i, stashed in self._stashed_sources.items():
+                logger.debug("DeepstreamBackend: Dropping %d unclaimed results from index %d", len(stashed), i)
+            self._stashed_sources.clear()
+
+    def close_sources(self, indices: List):
+        with self._sources_lock:
+            for i in indices:
+                self._sources.pop(i, None)
+                self._ended_sources.discard(i)
+
+    def end_sources(self, indices: List):
+        """Mark the sources as ended, their remaining results are collected without waiting"""
+        with self._sources_lock:
+            for i in indices:
+                queue = self._sources.get(i, None)
+                if queue is None:
+                    continue
+                self._ended_sources.add(i)
+                try:
+                    # wake up the collector waiting on the source
+                    queue.put_nowait(None)
+                except Full:
+                    pass
+
+    def collect_sources(self, indices: List, timeout=None) -> List | None:
+        """Collect the next result of each source, None once none of them produces any
+
+        The timeout only guards against a source which stalls without ending.
+        """
+        with self._sources_lock:
+            queues = [self._sources.get(i, None) for i in indices]
+        collected = [None] * len(indices)
+        for n, (index, queue) in enumerate(zip(indices, queues)):
+            if queue is None:
+                continue
+            with self._sources_lock:
+                ended = index in self._ended_sources
+            try:
+                collected[n] = queue.get(block=not ended, timeout=timeout)
+            except Empty:
+                pass
+        if all(c is None for c in collected):
+            return None
+        # a source which has ended yields no output
+        return [
+            {} if c is None else self._complete(c) if self._name is None else {self._name: self._complete(c)}
+            for c in collected
+        ]
+
+    def _timestamp(self, pts: int) -> int:
+        """Timestamp of a result, the PTS of the tagged submissions is their sequence id"""
+        return 0 if self._pending is not None else pts
+
+    @staticmethod
+    def _complete(data):
+        """Wait for the copies started by handle_metadata"""
+        if isinstance(data, dict):
+            return {k: v.result() if isinstance(v, Transfer) else v for k, v in data.items()}
+        return data
+
+    def _deposit(self, index: int, data: dict, pts: int = 0):
         logger.debug(
-            f"DeepstreamBackend: Depositing data to index {index}: {data}"
+            "DeepstreamBackend: Depositing data to index %d: %s", index, LazyTensorSummary(data)
         )
+        if self._pending is not None:
+            with self._pending_updated:
+                results = self._pending.get(pts, None)
+                if results is None:
+                    logger.warning("DeepstreamBackend: Dropping data of submission %s from index %s, which is no longer pending", pts, index)
+                    self._unmatched_pts = pts
+                    self._pending_updated.notify_all()
+                    return
+                results[index] = data
+                self._pending_updated.notify_all()
+            return
+        if self._sources is not None:
+            with self._sources_lock:
+                queue = self._sources.get(index, None)
+                if queue is None or index in self._ended_sources:
+                    # the source of the pad is not claimed yet, or the pad is already taken by a new one
+                    stashed = self._stashed_sources.setdefault(index, deque(maxlen=self._queue.maxsize))
+                    if len(stashed) == stashed.maxlen:
+                        logger.debug("DeepstreamBackend: Dropping the oldest unclaimed data from index %d", index)
+                    stashed.append(data)
+                    return
+            queue.put(data)
+            return
         try:
             self._queue.put((index, data))
         except Full:
@@ -463,11 +893,14 @@ class BaseTensorOutput(BatchMetadataOperator):
 
 
 class TensorOutput(BaseTensorOutput):
-    def __init__(self, n_outputs, preprocess_config_path):
+    def __init__(self, n_outputs, preprocess_config_path, device_id=0):
         super().__init__(n_outputs, None)
         self._preprocess_config_path = preprocess_config_path
+        self._transfer = TransferManager.get(device_id)
 
     def handle_metadata(self, batch_meta):
+        # the copies of all the frames of the batch are started first so that they overlap
+        copies = []
         if self._preprocess_config_path:
             for meta in batch_meta.preprocess_batch_items:
                 preprocess_batch = meta.as_preprocess_batch()
@@ -479,9 +912,9 @@ class TensorOutput(BaseTensorOutput):
                         tensor_output = user_meta.as_tensor_output()
                         if tensor_output :
                             for n, tensor in tensor_output.get_layers().items():
-                                torch_tensor = torch.utils.dlpack.from_dlpack(tensor).to('cpu')
-                                result[n] = torch_tensor
-                    self._deposit(roi.frame_meta.pad_index, result)
+                                torch_tensor = torch.utils.dlpack.from_dlpack(tensor)
+                                result[n] = self._transfer.to_host(torch_tensor)
+                    copies.append((roi.frame_meta.pad_index, result, roi.frame_meta.buffer_pts))
         else:
             for frame_meta in batch_meta.frame_items:
                 result = dict()
@@ -489,24 +922,73 @@ class TensorOutput(BaseTensorOutput):
                     tensor_output = user_meta.as_tensor_output()
                     if tensor_output :
                         for n, tensor in tensor_output.get_layers().items():
-                            torch_tensor = torch.utils.dlpack.from_dlpack(tensor).to('cpu')
-                            result[n] = torch_tensor
-                self._deposit(frame_meta.pad_index, result)
+                            torch_tensor = torch.utils.dlpack.from_dlpack(tensor)
+                            result[n] = self._transfer.to_host(torch_tensor)
+                copies.append((frame_meta.pad_index, result, frame_meta.buffer_pts))
+        # the tensors are views of the nvinfer output buffers, which are recycled once the
+        # probe returns the batch, so the copies must be done before the probe returns
+        for index, result, pts in copies:
+            self._deposit(index, self._complete(result), pts)
 
 @dataclass
 class DeepstreamMetadata:
+    """Metadata of a frame, the objects are held in columns, one row per object"""
     shape: list[int] = field(default_factory=lambda: [0, 0])
-    bboxes: list[list[int]] = field(default_factory=list)
-    probs: list[float] = field(default_factory=list)
-    labels: list[str] = field(default_factory=list)
+    bboxes: np.ndarray = field(default_factory=lambda: np.zeros((0, 4), dtype=np.int32))
+    probs: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.float64))
+    labels: list[list[str]] = field(default_factory=list)
     seg_maps: list[np.ndarray] = field(default_factory=list)
-    objects: list[int] = field(default_factory=list)
+    objects: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.uint64))
     timestamp: int = 0
+    mask_encoding: str = field(default="list", repr=False, compare=False)
+
+    def to_dict(self) -> Dict:
+        """Serialize the columns at once instead of copying the fields one by one"""
+        return {
+            "shape": list(self.shape),
+            "bboxes": self.bboxes.tolist(),
+            "probs": self.probs.tolist(),
+            "labels": self.labels,
+            "seg_maps": [encode_mask(seg_map, self.mask_encoding) for seg_map in self.seg_maps],
+            "objects": self.objects.tolist(),
+            "timestamp": self.timestamp,
+        }
+
+def fill_object_columns(metadata: DeepstreamMetadata, object_items, with_masks: bool):
+    """Fill the object columns of the metadata from the object metadata of a frame"""
+    object_items = list(object_items)
+    n_objects = len(object_items)
+    if n_objects == 0:
+        return
+    rects = np.empty((n_objects, 4), dtype=np.float32)
+    probs = np.empty(n_objects, dtype=np.float64)
+    objects = np.empty(n_objects, dtype=np.uint64)
+    for k, object_meta in enumerate(object_items):
+        rect_params = object_meta.rect_params
+        rects[k] = (rect_params.left, rect_params.top, rect_params.width, rect_params.height)
+        probs[k] = object_meta.confidence
+        objects[k] = object_meta.object_id
+        labels = [object_meta.label] if object_meta.label else []
+        for classifier in object_meta.classifier_items:
+            for i in range(classifier.n_labels):
+                labels.append(classifier.get_n_label(i))
+        metadata.labels.append(labels)
+        if with_masks:
+            instance_mask = object_meta.mask_params.mask_array
+            if instance_mask.size > 0:
+                metadata.seg_maps.append(instance_mask.astype(np.uint8))
+    # truncated to integers before adding the sizes to the corners
+    bboxes = rects.astype(np.int32)
+    bboxes[:, 2:] += bboxes[:, :2]
+    metadata.bboxes = bboxes
+    metadata.probs = probs
+    metadata.objects = objects
 
 class PreprocessMetadataOutput(BaseTensorOutput):
-    def __init__(self, n_outputs, output_name, dims):
+    def __init__(self, n_outputs, output_name, dims, mask_encoding="list"):
         super().__init__(n_outputs, name=output_name)
         self._shape = dims
+        self._mask_encoding = mask_encoding
 
     def handle_metadata(self, batch_meta):
         for meta in batch_meta.preprocess_batch_items:
@@ -514,7 +996,7 @@ class PreprocessMetadataOutput(BaseTensorOutput):
             if not preprocess_batch:
                 continue
             for roi in preprocess_batch.rois:
-                metadata = DeepstreamMetadata()
+                metadata = DeepstreamMetadata(mask_encoding=self._mask_encoding)
                 # segmentation metadata
                 for u_meta in roi.segmentation_items:
                     seg_meta = u_meta.as_segmentation()
@@ -522,60 +1004,36 @@ class PreprocessMetadataOutput(BaseTensorOutput):
                         metadata.shape = [seg_meta.height, seg_meta.width]
                         metadata.seg_maps.append(seg_meta.class_map.copy())
                 # object metadata
-                for object_meta in roi.frame_meta.object_items:
-                    labels = [object_meta.label] if object_meta.label else []
-                    left = int(object_meta.rect_params.left)
-                    top = int(object_meta.rect_params.top)
-                    width = int(object_meta.rect_params.width)
-                    height = int(object_meta.rect_params.height)
+                fill_object_columns(metadata, roi.frame_meta.object_items, with_masks=False)
+                if len(metadata.bboxes) > 0:
                     metadata.shape = [self._shape[0], self._shape[1]]
-                    metadata.bboxes.append([left, top, left + width, top + height])
-                    metadata.probs.append(object_meta.confidence)
-                    for classifier in object_meta.classifier_items:
-                        for i in range(classifier.n_labels):
-                            labels.append(classifier.get_n_label(i))
-                    metadata.labels.append(labels)
-                    metadata.objects.append(object_meta.object_id)
                 for classifier in roi.classifier_items:
                     labels = []
                     for i in range(classifier.n_labels):
                         labels.append(classifier.get_n_label(i))
                     metadata.labels.append(labels)
-                metadata.timestamp = roi.frame_meta.buffer_pts
-                self._deposit(roi.frame_meta.pad_index, metadata)
+                metadata.timestamp = self._timestamp(roi.frame_meta.buffer_pts)
+                self._deposit(roi.frame_meta.pad_index, metadata, roi.frame_meta.buffer_pts)
 
 class MetadataOutput(BaseTensorOutput):
-    def __init__(self, n_outputs, output_name, dims):
+    def __init__(self, n_outputs, output_name, dims, mask_encoding="list"):
         super().__init__(n_outputs, name=output_name)
         self._shape = dims
+        self._mask_encoding = mask_encoding
 
     def handle_metadata(self, batch_meta):
         for frame_meta in batch_meta.frame_items:
-            metadata = DeepstreamMetadata()
-            for object_meta in frame_meta.object_items:
-                labels = [object_meta.label] if object_meta.label else []
-                left = int(object_meta.rect_params.left)
-                top = int(object_meta.rect_params.top)
-                width = int(object_meta.rect_params.width)
-                height = int(object_meta.rect_params.height)
-                instance_mask = object_meta.mask_params.mask_array
+            metadata = DeepstreamMetadata(mask_encoding=self._mask_encoding)
+            fill_object_columns(metadata, frame_meta.object_items, with_masks=True)
+            if len(metadata.bboxes) > 0:
                 metadata.shape = [self._shape[0], self._shape[1]]
-                metadata.bboxes.append([left, top, left + width, top + height])
-                metadata.probs.append(object_meta.confidence)
-                for classifier in object_meta.classifier_items:
-                    for i in range(classifier.n_labels):
-                        labels.append(classifier.get_n_label(i))
-                metadata.labels.append(labels)
-                metadata.objects.append(object_meta.object_id)
-                if instance_mask.size > 0:
-                    metadata.seg_maps.append(instance_mask.astype(int))
             for user_meta in frame_meta.segmentation_items:
                 seg_meta = user_meta.as_segmentation()
                 if seg_meta:
                     metadata.shape = [seg_meta.height, seg_meta.width]
                     metadata.seg_maps.append(seg_meta.class_map.copy())
-            metadata.timestamp = frame_meta.buffer_pts
-            self._deposit(frame_meta.pad_index, metadata)
+            metadata.timestamp = self._timestamp(frame_meta.buffer_pts)
+            self._deposit(frame_meta.pad_index, metadata, frame_meta.buffer_pts)
 
 class DeepstreamBackend(ModelBackend):
     """Deepstream backend using pyservicemaker"""
@@ -590,6 +1048,7 @@ class DeepstreamBackend(ModelBackend):
         self._mime_tensor_name = None
         self._source_tensor_name = None
         self._inference_timeout = model_config["parameters"].get("inference_timeout", 3)
+        self._max_concurrency = 1
 
         if len(self._output_names) > 1 and self._output_types[0] == "TYPE_CUSTOM_DS_METADATA":
             raise Exception(f"No more than one output is allowed for DS metadata!")
@@ -600,7 +1059,16 @@ class DeepstreamBackend(ModelBackend):
         if "parameters" not in model_config or "infer_config_path" not in model_config["parameters"]:
             raise Exception("Deepstream pipeline requires infer_config_path")
 
+        # encoding of the segmentation and instance masks in the metadata
+        mask_encoding = model_config["parameters"].get("mask_encoding", "list")
+        if mask_encoding not in MASK_ENCODINGS:
+            raise ValueError(f"Invalid mask_encoding {mask_encoding}, expecting one of {MASK_ENCODINGS}")
+
         infer_config_paths = self._correct_config_paths(model_config["parameters"]['infer_config_path'])
+        # engines are cached by the content of their models and infer configs
+        self._engine_cache = EngineCache(model_config["parameters"].get("engine_cache_dir", self._model_home))
+        self._built_engines = {}
+        build_start = time.time()
         if not infer_config_paths:
             raise Exception("Deepstream pipeline requires infer_config_path")
 
@@ -761,14 +1229,14 @@ class DeepstreamBackend(ModelBackend):
             # image input support
             media = "image"
             formats = ["JPEG", "PNG"]
-            in_pool = ImageTensorInputPool(dims[0], dims[1], formats, self._max_batch_size, self._image_tensor_name, self._media_url_tensor_name, self._mime_tensor_name, device_id, require_extra_input)
             n_output = self._max_batch_size * len(formats)
             if tensor_output:
-                output = TensorOutput(n_output, preprocess_config_paths)
+                output = TensorOutput(n_output, preprocess_config_paths, device_id)
             elif preprocess_config_paths:
-                output = PreprocessMetadataOutput(n_output, self._output_names[0], dims)
+                output = PreprocessMetadataOutput(n_output, self._output_names[0], dims, mask_encoding)
             else:
-                output = MetadataOutput(n_output, self._output_names[0], dims)
+                output = MetadataOutput(n_output, self._output_names[0], dims, mask_encoding)
+            in_pool = ImageTensorInputPool(dims[0], dims[1], formats, self._max_batch_size, self._image_tensor_name, self._media_url_tensor_name, self._mime_tensor_name, device_id, require_extra_input, output)
             # create the pipeline
             pipeline = Pipeline(f"deepstream-{self._model_name}-{media}")
 
@@ -786,10 +1254,12 @@ class DeepstreamBackend(ModelBackend):
                 flow = flow.preprocess(config_file, None if not input else input.generate)
             for config_file in infer_config_paths:
                 engine_file = self._generate_engine_name(config_file, device_id, self._max_batch_size)
+                # nvinfer runs on the device of the backend, regardless of the gpu-id of the config
+                device_property = {} if with_triton else {"gpu_id": device_id}
                 if engine_file:
-                    flow = flow.infer(config_file, with_triton, batch_size=self._max_batch_size, model_engine_file=engine_file)
+                    flow = flow.infer(config_file, with_triton, batch_size=self._max_batch_size, model_engine_file=engine_file, **device_property)
                 else:
-                    flow = flow.infer(config_file, with_triton, batch_size=self._max_batch_size)
+                    flow = flow.infer(config_file, with_triton, batch_size=self._max_batch_size, **device_property)
             flow = flow.attach(probe).render(RenderMode.DISCARD, enable_osd=False)
             pipeline.start()
             # warm up
@@ -798,24 +1268,28 @@ class DeepstreamBackend(ModelBackend):
             warmup_data_1[self._image_tensor_name] = np.frombuffer(jpg_data, dtype=np.uint8)
             warmup_data_1[self._mime_tensor_name] = "image/jpeg"
             indices = in_pool.submit([warmup_data_0.copy() for _ in range(self._max_batch_size)])
-            results = output.collect(indices)
+            # the results are matched to their submissions by the PTS, which must be kept
+            results = output.collect(indices, check_sequence=True)
             output.reset()
-            logger.info(f"Warm up 0: {results}")
+            in_pool.release(indices)
+            logger.info("Warm up 0: %s", LazyTensorSummary(results))
             indices = in_pool.submit([warmup_data_1.copy() for _ in range(self._max_batch_size)])
             results = output.collect(indices)
             output.reset()
-            logger.info(f"Warm up 1: {results}")
+            in_pool.release(indices)
+            logger.info("Warm up 1: %s", LazyTensorSummary(results))
+            self._cache_built_engines(build_start)
 
         if (self._media_url_tensor_name is not None or
             self._source_tensor_name is not None):
             # video input support
             media = "video"
             if tensor_output:
-                output = TensorOutput(self._max_batch_size, preprocess_config_paths)
+                output = TensorOutput(self._max_batch_size, preprocess_config_paths, device_id)
             elif preprocess_config_paths:
-                output = PreprocessMetadataOutput(self._max_batch_size, self._output_names[0], dims)
+                output = PreprocessMetadataOutput(self._max_batch_size, self._output_names[0], dims, mask_encoding)
             else:
-                output = MetadataOutput(self._max_batch_size, self._output_names[0], dims)
+                output = MetadataOutput(self._max_batch_size, self._output_names[0], dims, mask_encoding)
             engine_files = [
                 self._generate_engine_name(
                     config_file,
@@ -824,7 +1298,11 @@ class DeepstreamBackend(ModelBackend):
                 )
                 for config_file in infer_config_paths
             ]
-            in_pool = BulkVideoInputPool(
+            dynamic_sources = model_config["parameters"].get("dynamic_sources", None)
+            video_pool_class = DynamicVideoInputPool if dynamic_sources else BulkVideoInputPool
+            extra_args = {"rest_port": dynamic_sources.get("rest_port", 9000)} if dynamic_sources else {}
+            in_pool = video_pool_class(
+                **extra_args,
                 max_batch_size=self._max_batch_size,
                 batch_timeout=model_config["parameters"].get("batch_timeout", 1000 * self._max_batch_size),
                 media_url_tensor_name=self._media_url_tensor_name,
@@ -844,7 +1322,7 @@ class DeepstreamBackend(ModelBackend):
                 dims=dims,
                 label_file_path=label_file_path
             )
-            if not all(os.path.exists(e) for e in engine_files):
+            if not dynamic_sources and any(e and not os.path.exists(e) for e in engine_files):
                 # generate the engine files
                 with tempfile.TemporaryDirectory() as temp_dir:
                     # Write test data to a temporary file
@@ -855,6 +1333,12 @@ class DeepstreamBackend(ModelBackend):
                     indices = in_pool.submit([warmup_data])
                     results = output.collect(indices)
                     output.reset()
+                self._cache_built_engines(build_start)
+            elif dynamic_sources and self._built_engines:
+                logger.warning("Engines built by the pipeline of dynamic sources aren't cached, prebuild them to skip the build")
+            if dynamic_sources:
+                # each request takes at least one of the sources batched together
+                self._max_concurrency = self._max_batch_size
 
         self._in_pools[media] = in_pool
         self._outputs[media] = output
@@ -865,6 +1349,10 @@ class DeepstreamBackend(ModelBackend):
         )
 
 
+    @property
+    def max_concurrency(self):
+        return self._max_concurrency
+
     def __call__(self, *args, **kwargs):
         in_data_list = args if args else [kwargs]
         media = None
@@ -875,7 +1363,7 @@ class DeepstreamBackend(ModelBackend):
             # get the media type
             if ((self._image_tensor_name in data or self._media_url_tensor_name in data) and
                 not self._mime_tensor_name in data):
-                logger.error(f"MIME type is not specified for input {data}")
+                logger.error("MIME type is not specified for input %s", LazyTensorSummary(data))
                 return
             if self._source_tensor_name and self._source_tensor_name in data:
                 media = "video"
@@ -893,27 +1381,34 @@ class DeepstreamBackend(ModelBackend):
                 return
 
         # submit the data to the pipeline which supports the media type
-        indices = self._in_pools[media].submit(in_data_list)
-        # collect the results
-        while True:
-            # TODO: timeout should be runtime configurable
-            results = self._outputs[media].collect(indices, timeout=self._inference_timeout)
-            if not results:
-                logger.info("DeepstreamBackend: No more data from this batch")
-                break
-            out_data_list = []
-            for result in results:
-                out_data = dict()
-                for o in self._output_names:
-                    if o in result:
-                        out_data[o] = result[o]
-                    else:
-                        out_data[o] = None
-                out_data_list.append(out_data)
-            yield out_data_list if explicit_batch else out_data_list[0]
-            # No consecutive inference results for image
-            if media == "image":
-                break
+        in_pool = self._in_pools[media]
+        indices = in_pool.submit(in_data_list)
+        # the results of the sources added on the fly are routed by their pad indices
+        output = self._outputs[media]
+        collect = output.collect_sources if isinstance(in_pool, DynamicVideoInputPool) else output.collect
+        try:
+            # collect the results
+            while True:
+                # TODO: timeout should be runtime configurable
+                results = collect(indices, timeout=self._inference_timeout)
+                if not results:
+                    logger.info("DeepstreamBackend: No more data from this batch")
+                    break
+                out_data_list = []
+                for result in results:
+                    out_data = dict()
+                    for o in self._output_names:
+                        if o in result:
+                            out_data[o] = result[o]
+                        else:
+                            out_data[o] = None
+                    out_data_list.append(out_data)
+                yield out_data_list if explicit_batch else out_data_list[0]
+                # No consecutive inference results for image
+                if media == "image":
+                    break
+        finally:
+            in_pool.release(indices)
 
     def __del__(self):
         for input in self._in_pools.values():
@@ -923,31 +1418,38 @@ class DeepstreamBackend(ModelBackend):
             pipeline.wait()
 
     def _generate_engine_name(self, config_path: str, device_id: int, batch_size: int):
-        def network_mode_to_string(network_mode: int):
-            if network_mode == 0:
-                return "fp32"
-            elif network_mode == 1:
-                return "int8"
-            elif network_mode == 2:
-                return "fp16"
+        """The cached engine of an infer config, nvinfer builds it if it isn't cached yet"""
+        spec = self._engine_cache.spec(config_path, batch_size, device_id)
+        if spec is None:
+            return None
+        engine_file = self._engine_cache.lookup(spec)
+        if engine_file is not None:
+            logger.info(f"Using the cached engine {engine_file}")
+            return engine_file
+        for stale_file in self._engine_cache.stale(spec):
+            logger.warning(f"Ignoring the stale engine {stale_file}")
+        # nvinfer fails to deserialize the missing engine, then builds it from the onnx file
+        # and saves it next to the onnx file
+        built_file = f"{spec.onnx_file}_b{batch_size}_gpu{device_id}_{spec.precision}.engine"
+        if os.path.exists(built_file):
+            logger.warning(f"Ignoring the engine {built_file} which can't be validated against {spec.onnx_file}")
+        self._built_engines[spec.key] = (spec, built_file)
+        return self._engine_cache.path(spec)
+
+    def _cache_built_engines(self, since: float):
+        """Move the engines nvinfer built since the given time into the cache"""
+        for key, (spec, built_file) in list(self._built_engines.items()):
+            for candidate in (self._engine_cache.path(spec), built_file):
+                # allow for the coarse mtime of some file systems
+                if os.path.exists(candidate) and os.path.getmtime(candidate) >= since - 1:
+                    self._engine_cache.store(candidate, spec)
+                    del self._built_engines[key]
+                    break
             else:
-                return ""
-        network_mode = "fp16"
-        onnx_file = "model.onnx"
-        with open(config_path, 'r') as f:
-            config = yaml.safe_load(f)
-            if not "property" in config:
-                return None
-            property = config["property"]
-            if not "onnx-file" in property:
-                return None
-            onnx_file = property["onnx-file"]
-            if "network-mode" in property:
-                mode = network_mode_to_string(property["network-mode"])
-                if mode:
-                    network_mode = mode
-        engine_file = f"{onnx_file}_b{batch_size}_gpu{device_id}_{network_mode}.engine"
-        return os.path.join(self._model_home, engine_file)
+                logger.warning(
+                    f"No engine built for {spec.onnx_file} yet, it will be built again on the next start "
+                    f"unless the engines are prebuilt"
+                )
 
     def _correct_config_paths(self, config_paths: List[str]) -> List[str]:
         if not config_paths:
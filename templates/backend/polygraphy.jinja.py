@@ -16,6 +16,8 @@
 #}
 from polygraphy.backend.common import BytesFromPath
 from polygraphy.backend.trt import EngineFromBytes, TrtRunner
+from lib.buffers import IOBufferPool, TrtIORunner
+from lib.transfer import TransferManager
 
 class PolygraphBackend(ModelBackend):
     """Python TensorRT Backend from polygraph"""
@@ -33,17 +35,29 @@ class PolygraphBackend(ModelBackend):
         engine = EngineFromBytes(BytesFromPath(engine_file))
         self._trt_runner = TrtRunner(engine)
         self._trt_runner.activate()
+        self._transfer = TransferManager.get(self._device_id)
+        # reuse pre-allocated IO buffers across the calls instead of the allocations of TrtRunner.infer
+        self._io_buffers = None
+        if model_config["parameters"].get("io_buffers", False):
+            context = self._trt_runner.context
+            self._io_buffers = IOBufferPool(
+                TrtIORunner(context.engine, context),
+                device=torch.device("cuda", self._device_id),
+                cuda_graph=model_config["parameters"].get("cuda_graph", False)
+            )
         logger.info(f"TensorRT runtime created from {engine_file}")
 
 
     def __call__(self, *args, **kwargs):
         in_data = stack_tensors_in_dict(args) if args else dict(kwargs)
-        for k, v in in_data.items():
-            if isinstance(v, np.ndarray):
-                in_data[k] = torch.from_numpy(v).to(self._device_id)
+        if self._io_buffers is not None:
+            result = self._io_buffers.run(in_data)
+            yield {o: result[o] for o in self._output_names}
+            return
+        in_data = self._transfer.upload(in_data)
         result = self._trt_runner.infer(in_data)
         if not all([key in result for key in self._output_names]):
-            logger.error(f"Not all the expected output in {self._output_names} are not found in the result")
+            logger.error("Not all the expected output in %s are not found in the result", self._output_names)
             return
         o_data = { o: result[o] for o in self._output_names}
         yield o_data
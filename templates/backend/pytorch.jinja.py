@@ -15,27 +15,231 @@
  limitations under the License.
 #}
 
+import bisect
+import contextlib
 import importlib
+from lib.transfer import TransferManager
 
 class PytorchBackend(ModelBackend):
-    """Pytorch Backend to run models from Huggingface"""
+    """Pytorch Backend to run models from Huggingface
+
+    Execution options from the parameters:
+        device: "cuda" or "cpu", falls back to "cpu" if CUDA is not available
+        inference_mode: run the model under torch.inference_mode(), true by default
+        channels_last: convert the model to the channels last memory format
+        compile_mode: torch.compile() the model with the mode, e.g. "default", "reduce-overhead" or "max-autotune"
+        compile_cache_dir: directory to keep the compiled artifacts between restarts
+        amp_dtype: autocast the model to the dtype, e.g. "bfloat16" or "float16"
+        warmup: run the model on synthetic inputs shaped after the input dims before serving, true if
+            compiled and the model has no warmup section
+        warmup_dynamic_size: size of the dynamic dimensions of the warmup inputs, 16 by default
+
+    Batching options from the parameters:
+        batch_generate: generate for the items of an explicit batch together in left padded batches
+        max_sub_batch: max number of items generated together, 8 by default
+        length_buckets: ascending prompt lengths delimiting the buckets, only the items
+            in the same bucket are padded together
+    """
+    TOKEN_INPUTS = ("input_ids", "attention_mask")
+
     def __init__(self, model_config:Dict, model_home: str, device_id: int=0):
         super().__init__(model_config, model_home, device_id)
         self._model_name = model_config["name"]
-        self._device = f"cuda:{device_id}"
+        params = model_config["parameters"]
+        device = params.get("device", "cuda")
+        if device == "cuda" and not torch.cuda.is_available():
+            logger.warning(f"CUDA is not available, model {self._model_name} runs on CPU")
+            device = "cpu"
+        self._device = f"cuda:{device_id}" if device == "cuda" else "cpu"
         self._output_names = [o["name"] for o in model_config["output"]]
-        self._model_class = model_config["parameters"].get("model_class", "AutoModelForCausalLM")
+        self._model_class = params.get("model_class", "AutoModelForCausalLM")
         self._module = importlib.import_module("transformers")
         model_class = getattr(self._module, self._model_class)
         logger.info(f"Loading pre-trained model {self._model_name} of type {self._model_class} from {self._model_home}")
-        self._model = model_class.from_pretrained(self._model_home, torch_dtype="auto", device_map="auto")
+        self._model = model_class.from_pretrained(
+            self._model_home,
+            torch_dtype="auto",
+            device_map="auto" if self._device != "cpu" else None
+        )
         self._model.to(self._device)
-        logger.info(f"Model {self._model_name} loaded from {self._model_home}")
+        self._model.eval()
+        if params.get("channels_last", False):
+            self._model.to(memory_format=torch.channels_last)
+        self._inference_mode = params.get("inference_mode", True)
+        amp_dtype = params.get("amp_dtype", None)
+        self._amp_dtype = getattr(torch, amp_dtype) if amp_dtype else None
+        compile_mode = params.get("compile_mode", None)
+        if compile_mode:
+            compile_cache_dir = params.get("compile_cache_dir", None)
+            if compile_cache_dir:
+                # the inductor reuses the compiled graphs and kernels found in the cache
+                os.makedirs(compile_cache_dir, exist_ok=True)
+                os.environ["TORCHINDUCTOR_CACHE_DIR"] = compile_cache_dir
+                os.environ["TORCHINDUCTOR_FX_GRAPH_CACHE"] = "1"
+            self._model.forward = torch.compile(self._model.forward, mode=compile_mode, dynamic=True)
+            logger.info(f"Model {self._model_name} compiled with mode {compile_mode}, cache: {compile_cache_dir}")
+        self._transfer = TransferManager.get(device_id)
+        self._batch_generate = params.get("batch_generate", False)
+        self._max_sub_batch = max(1, int(params.get("max_sub_batch", 8)))
+        self._length_buckets = sorted(int(b) for b in params.get("length_buckets", []))
+        generation_config = self._model.generation_config
+        eos_token_id = generation_config.eos_token_id
+        self._eos_token_ids = [] if eos_token_id is None else (list(eos_token_id) if isinstance(eos_token_id, (list, tuple)) else [eos_token_id])
+        pad_token_id = generation_config.pad_token_id
+        self._pad_token_id = pad_token_id if pad_token_id is not None else (self._eos_token_ids[0] if self._eos_token_ids else 0)
+        logger.info(f"Model {self._model_name} loaded from {self._model_home} on {self._device}")
+        # the warmup section of the model covers the compilation already
+        if params.get("warmup", bool(compile_mode) and not model_config.get("warmup", None)):
+            self._warmup(model_config["input"], params.get("warmup_dynamic_size", 16))
 
     def __call__(self, *args, **kwargs):
         in_data_list = args if args else [kwargs]
-        for in_data in in_data_list:
-            result = self._model.generate(**in_data)
+        if self._batch_generate and len(in_data_list) > 1:
+            yield from self._generate_batched(in_data_list)
+            return
+        yield from self._generate_each(in_data_list)
+
+    def _generate_each(self, in_data_list: List[Dict]):
+        """Generate for the items one by one, the copies of the next item overlap with the current one"""
+        # copy the host tensors to the device asynchronously through pinned memory
+        uploads = self._transfer.prefetch(
+            {k: v for k, v in in_data.items() if isinstance(v, torch.Tensor)} for in_data in in_data_list
+        )
+        for in_data, uploaded in zip(in_data_list, uploads):
+            with self._execution_context():
+                result = self._model.generate(**{**in_data, **uploaded})
             if len(self._output_names) != len(result):
                 raise ValueError(f"Number of output names ({len(self._output_names)}) does not match the number of output tensors ({len(result)})")
             yield {self._output_names[i]: tensor for i, tensor in enumerate(result)}
+
+    def _generate_batched(self, in_data_list: List[Dict]):
+        """Generate for the items in left padded sub-batches and yield the results in the order of the items"""
+        if len(self._output_names) != 1:
+            raise ValueError(f"Batched generation expects one output, got {len(self._output_names)}")
+        results = [None] * len(in_data_list)
+        # only the items with the same generation options can be generated together
+        groups = {}
+        for index, in_data in enumerate(in_data_list):
+            groups.setdefault(self._batch_key(in_data), []).append(index)
+        chunks = []
+        for key, indices in groups.items():
+            if key is None:
+                for index, result in zip(indices, self._generate_each([in_data_list[i] for i in indices])):
+                    results[index] = result
+                continue
+            lengths = {i: self._token_ids(in_data_list[i]["input_ids"]).numel() for i in indices}
+            # the items of similar lengths are padded together to limit the padding waste
+            buckets = {}
+            for i in sorted(indices, key=lambda i: lengths[i]):
+                buckets.setdefault(bisect.bisect_left(self._length_buckets, lengths[i]), []).append(i)
+            for bucket in buckets.values():
+                chunks.extend(bucket[start:start + self._max_sub_batch] for start in range(0, len(bucket), self._max_sub_batch))
+            logger.debug("Batching %d items in %d buckets", len(indices), len(buckets))
+        padded = [self._pad([in_data_list[i] for i in chunk]) for chunk in chunks]
+        # the copies of the next sub-batch overlap with the generation of the current one
+        uploads = self._transfer.prefetch(inputs for inputs, _, _ in padded)
+        for chunk, (_, options, prompt_lengths), inputs in zip(chunks, padded, uploads):
+            sequences = self._generate_padded(inputs, options, prompt_lengths)
+            for i, sequence in zip(chunk, sequences):
+                results[i] = {self._output_names[0]: sequence}
+        yield from results
+
+    def _batch_key(self, in_data: Dict):
+        """The generation options of an item, None if the item can't be batched"""
+        if "input_ids" not in in_data:
+            return None
+        options = []
+        for name, value in in_data.items():
+            if name in self.TOKEN_INPUTS:
+                if self._token_ids(value) is None:
+                    return None
+                continue
+            if isinstance(value, (torch.Tensor, np.ndarray)):
+                if np.prod(value.shape) != 1:
+                    return None
+                value = value.item()
+            elif isinstance(value, (list, dict)):
+                return None
+            options.append((name, repr(value)))
+        return tuple(sorted(options))
+
+    @staticmethod
+    def _token_ids(value):
+        value = torch.as_tensor(value)
+        if value.dim() == 2 and value.shape[0] == 1:
+            value = value[0]
+        return value if value.dim() == 1 else None
+
+    def _pad(self, items: List[Dict]) -> Tuple[Dict, Dict, List[int]]:
+        """The left padded host inputs of a sub-batch, its generation options and the prompt lengths"""
+        ids = [self._token_ids(item["input_ids"]) for item in items]
+        masks = [
+            self._token_ids(item["attention_mask"]) if "attention_mask" in item else torch.ones_like(t)
+            for item, t in zip(items, ids)
+        ]
+        width = max(t.numel() for t in ids)
+        input_ids = torch.full((len(ids), width), self._pad_token_id, dtype=ids[0].dtype)
+        attention_mask = torch.zeros((len(ids), width), dtype=masks[0].dtype)
+        for row, (t, m) in enumerate(zip(ids, masks)):
+            input_ids[row, width - t.numel():] = t
+            attention_mask[row, width - m.numel():] = m
+        options = {k: v.item() if isinstance(v, (torch.Tensor, np.ndarray)) else v for k, v in items[0].items() if k not in self.TOKEN_INPUTS}
+        options.setdefault("pad_token_id", self._pad_token_id)
+        return {"input_ids": input_ids, "attention_mask": attention_mask}, options, [t.numel() for t in ids]
+
+    def _generate_padded(self, in_data: Dict, options: Dict, prompt_lengths: List[int]) -> List[torch.Tensor]:
+        width = in_data["input_ids"].shape[1]
+        with self._execution_context():
+            output = self._model.generate(**in_data, **options)
+        sequences = []
+        for row, length in enumerate(prompt_lengths):
+            if self._model.config.is_encoder_decoder:
+                # the decoder outputs aren't padded on the left
+                sequence, prompt_length = output[row], 1
+            else:
+                sequence, prompt_length = output[row, width - length:], length
+            sequences.append(self._strip_padding(sequence, prompt_length))
+        return sequences
+
+    def _strip_padding(self, sequence: torch.Tensor, prompt_length: int) -> torch.Tensor:
+        """Cut the padding after the end of a sequence finished before the others of its batch"""
+        if not self._eos_token_ids:
+            return sequence
+        eos = torch.tensor(self._eos_token_ids, device=sequence.device, dtype=sequence.dtype)
+        ends = torch.isin(sequence[prompt_length:], eos).nonzero()
+        if len(ends) == 0:
+            return sequence
+        return sequence[:prompt_length + int(ends[0]) + 1]
+
+    def _execution_context(self):
+        stack = contextlib.ExitStack()
+        if self._inference_mode:
+            stack.enter_context(torch.inference_mode())
+        if self._amp_dtype is not None:
+            stack.enter_context(torch.autocast(device_type=self._device.split(":")[0], dtype=self._amp_dtype))
+        return stack
+
+    def _warmup(self, input_configs: List[Dict], dynamic_size: int):
+        """Run the model once on synthetic inputs, which triggers the compilation before the first request"""
+        in_data = {}
+        for config in input_configs:
+            if config.get("optional", False):
+                continue
+            dtype = torch_datatype_mapping.get(config["data_type"], None)
+            if dtype is None or dtype is str:
+                logger.warning(f"Model {self._model_name} can't be warmed up with input {config['name']} of {config['data_type']}")
+                return
+            dims = config["dims"]
+            if list(dims) == [1]:
+                # scalars, e.g. the generation options
+                in_data[config["name"]] = 1
+            else:
+                shape = [dynamic_size if d < 0 else d for d in dims]
+                if len(dims) > 1 and dims[0] < 0:
+                    # a batch of one item, whose single output row matches the output names
+                    shape[0] = 1
+                in_data[config["name"]] = torch.ones(shape, dtype=dtype, device=self._device)
+        start = time.perf_counter()
+        for _ in self(**in_data):
+            pass
+        logger.info(f"Model {self._model_name} warmed up in {time.perf_counter() - start:.2f}s")
@@ -2,10 +2,14 @@ from typing import List, Dict
 from lib.inference import ModelBackend
 import tensorrt_llm
 from tensorrt_llm.runtime import Session, TensorInfo
+from lib.buffers import IOBufferPool, TrtIORunner
 import tensorrt as trt
 import numpy
 import os
 import json
+import threading
+import time
+from types import SimpleNamespace
 def trt_dtype_to_torch(dtype):
     '''
     Convert TRT data type to PyTorch data type
@@ -30,7 +34,7 @@ def get_trt_dtype(dtype):
         raise TypeError("%s is not supported" % dtype)
 
 class TensorRTSession:
-    def __init__(self, stream, device, engine_file, input_dtype):
+    def __init__(self, stream, device, engine_file, input_dtype, io_buffers=False, cuda_graph=False):
         self._stream = stream
         self._device = device
         self._input_dtype = input_dtype
@@ -39,16 +43,24 @@ class TensorRTSession:
         with open(engine_file, 'rb') as f:
             engine_buffer = f.read()
             self._trt_session = Session.from_serialized_engine(engine_buffer)
+        # reuse pre-allocated IO buffers across the calls instead of allocating the outputs per call
+        self._io_buffers = IOBufferPool(
+            TrtIORunner(self._trt_session.engine, self._trt_session.context),
+            device=device,
+            cuda_graph=cuda_graph
+        ) if io_buffers else None
         logger.info("TensorRT Engine loaded")
 
     def infer(self, in_data: Dict):
+        if self._io_buffers is not None:
+            return self._io_buffers.run(in_data)
         tensor_infos = []
         for key in in_data:
             tensor = in_data[key]
             if isinstance(tensor, numpy.ndarray):
                 tensor = torch.from_numpy(tensor).to(self._device)
             if not isinstance(tensor, torch.Tensor):
-                logger.error(f"Input tensor must be a numpy array or a torch tensor, but got {type(tensor)}")
+                logger.error("Input tensor must be a numpy array or a torch tensor, but got %s", type(tensor))
                 return {}
             dtype = self._input_dtype[key]
             in_data[key] = tensor.to(dtype=dtype)
@@ -62,6 +74,58 @@ class TensorRTSession:
         return trt_out
 
 
+class KvCacheMonitor:
+    """Collect the KV cache block reuse stats from the iteration stats of the LLM"""
+    def __init__(self, llm, model_name: str, interval: float):
+        self._llm = llm
+        self._model_name = model_name
+        self._interval = interval
+        self._stats = {}
+        self._logged = (0, 0)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def stats(self) -> Dict:
+        """The latest KV cache stats, e.g. reusedBlocks, missedBlocks and cacheHitRate"""
+        return dict(self._stats)
+
+    def _run(self):
+        last_log = time.monotonic()
+        while not self._stop_event.wait(1.0):
+            try:
+                for stats in self._llm.get_stats(timeout=1):
+                    if isinstance(stats, str):
+                        stats = json.loads(stats)
+                    kv_cache_stats = stats.get("kvCacheStats", None)
+                    if kv_cache_stats:
+                        self._stats = kv_cache_stats
+            except Exception as e:
+                logger.debug("Failed to get the iteration stats of %s: %s", self._model_name, e)
+            now = time.monotonic()
+            if self._stats and now - last_log >= self._interval:
+                last_log = now
+                self._log()
+
+    def _log(self):
+        reused = self._stats.get("reusedBlocks", 0)
+        missed = self._stats.get("missedBlocks", 0)
+        # the block counters are cumulative, the differences give the recent hit rate
+        d_reused = reused - self._logged[0]
+        d_missed = missed - self._logged[1]
+        self._logged = (reused, missed)
+        recent = d_reused / (d_reused + d_missed) if d_reused + d_missed > 0 else 0.0
+        logger.info(
+            "KV cache of %s: reused blocks %s, missed blocks %s, hit rate %.3f, recent hit rate %.3f, used blocks %s/%s",
+            self._model_name, reused, missed, self._stats.get("cacheHitRate", 0.0), recent,
+            self._stats.get("usedNumBlocks", "-"), self._stats.get("maxNumBlocks", "-")
+        )
+
+    def stop(self):
+        self._stop_event.set()
+
+
 class TensorRTLLMBackend(ModelBackend):
     """Python TensorRT Backend"""
     def __init__(self, model_config:Dict, model_home: str, device_id: int=0):
@@ -125,6 +189,11 @@ class TensorRTLLMBackend(ModelBackend):
             else:
                 spec_config = None
 
+            # stream the partial outputs to the requests asking for it
+            self._streaming = self._params.pop("streaming", True)
+            # number of requests submitted to the LLM at the same time
+            self._max_concurrency = self._params.pop("max_concurrency", 8)
+
             use_torch_compile = self._params.pop("use_torch_compile", False)
             torch_compile_config = TorchCompileConfig(
                 enable_fullgraph=True,
@@ -132,6 +201,11 @@ class TensorRTLLMBackend(ModelBackend):
                 enable_piecewise_cuda_graph=self._params.pop("use_piecewise_cuda_graph", False)
             ) if use_torch_compile else None
 
+            # interval in seconds to report the KV cache block reuse, 0 to disable
+            kv_cache_stats_interval = self._params.pop("kv_cache_stats_interval", 0)
+            if kv_cache_stats_interval > 0:
+                self._params["enable_iter_perf_stats"] = True
+
             self._llm = LLM(
                 model=self._model_home,
                 backend="pytorch",
@@ -141,6 +215,8 @@ class TensorRTLLMBackend(ModelBackend):
                 **self._params
             )
             self._sample_params_cls = SamplingParams
+            self._kv_cache_monitor = KvCacheMonitor(self._llm, self._model_name, kv_cache_stats_interval) \
+                if kv_cache_stats_interval > 0 else None
             self._trtllm_input_name = next((i["name"] for i in self._inputs if i["data_type"] == "TYPE_CUSTOM_TRTLLM_INPUT"), None)
             if self._trtllm_input_name is None:
                 raise ValueError("TYPE_CUSTOM_TRTLLM_INPUT must be provided for tensorrtllm/pytorch backend")
@@ -148,44 +224,78 @@ class TensorRTLLMBackend(ModelBackend):
             logger.debug(f"TensorRTLLMBackend with pytorch created for {self._model_name} to generate {self._output_names}")
         else:
             self._llm = None
+            self._max_concurrency = 1
+            self._kv_cache_monitor = None
             if "tensorrt_engine" not in model_config:
                 raise("TensorRTLLM backend requires a path to tensorrt_engine")
             engine_file = model_config["parameters"]["tensorrt_engine"]
             if not os.path.isabs(engine_file):
                 engine_file = os.path.join(self._model_home, engine_file)
             input_dtype  = { i['name']: torch_datatype_mapping[i['data_type']] for i in model_config['input']}
-            self._trt_session = TensorRTSession(self._stream, self._device, engine_file, input_dtype)
+            self._trt_session = TensorRTSession(
+                self._stream, self._device, engine_file, input_dtype,
+                io_buffers=self._params.get("io_buffers", False),
+                cuda_graph=self._params.get("cuda_graph", False)
+            )
             logger.debug(f"TensorRTBackend created for {self._model_name} to generate {self._output_names}")
 
+    @property
+    def kv_cache_stats(self) -> Dict:
+        return self._kv_cache_monitor.stats if self._kv_cache_monitor is not None else {}
+
+    def stop(self):
+        if self._kv_cache_monitor is not None:
+            self._kv_cache_monitor.stop()
+        super().stop()
+
+    @property
+    def max_concurrency(self):
+        # the in-flight batching of the LLM merges the requests submitted concurrently
+        return self._max_concurrency
+
+    def _sampling_params(self, params: Dict):
+        def scalar(name, default):
+            value = params.get(name, None)
+            if value is None:
+                return default
+            if isinstance(value, numpy.ndarray) and value.size == 1:
+                return value.item()
+            if isinstance(value, torch.Tensor) and value.numel() == 1:
+                return value.item()
+            if isinstance(value, list) and len(value) == 1:
+                return value[0]
+            return value
+        return self._sample_params_cls(
+            max_tokens=scalar("max_tokens", 1024),
+            temperature=scalar("temperature", 0.7),
+            top_p=scalar("top_p", 0.95),
+            top_k=scalar("top_k", 0)
+        )
+
     def __call__(self, *args, **kwargs):
         if self._llm is not None:
-            params = args[0] if args else kwargs
-            sample_params = self._sample_params_cls(
-                max_tokens=params.get("max_tokens", 1024),
-                temperature=params.get("temperature", 0.7),
-                top_p=params.get("top_p", 0.95),
-                top_k=params.get("top_k", 0)
-            )
+            # each input is generated with the sampling params of its own request
             inputs = []
-            if args:
-                for i in args:
-                    if self._trtllm_input_name in i:
-                        input = i[self._trtllm_input_name]
-                        inputs.extend(input) if isinstance(input, list) else inputs.append(input)
-                    else:
-                        logger.warning(f"TensorRTLLMBackend: Input {self._trtllm_input_name} not found in {i}")
-            elif kwargs:
-                if self._trtllm_input_name in kwargs:
-                    inputs = kwargs[self._trtllm_input_name]
-                else:
-                    logger.warning(f"TensorRTLLMBackend: Input {self._trtllm_input_name} not found in {kwargs}")
-            else:
-                logger.warning("TensorRTLLMBackend: No inputs provided")
+            sample_params = []
+            for params in (args if args else [kwargs]):
+                if self._trtllm_input_name not in params:
+                    logger.warning("TensorRTLLMBackend: Input %s not found in %s", self._trtllm_input_name, LazyTensorSummary(params))
+                    continue
+                input = params[self._trtllm_input_name]
+                input = input if isinstance(input, list) else [input]
+                inputs.extend(input)
+                sample_params.extend([self._sampling_params(params)] * len(input))
             if not inputs:
+                logger.warning("TensorRTLLMBackend: No inputs provided")
                 return
 
-            results = self._llm.generate(inputs, sample_params)
-            yield [{"outputs": r} for r in results]
+            context = current_request_context()
+            if self._streaming and context is not None and context.streaming:
+                yield from self._generate_streaming(inputs, sample_params)
+                return
+            # submit all the inputs at once and let the runtime batch them in flight
+            results = [self._llm.generate_async(i, p) for i, p in zip(inputs, sample_params)]
+            yield [{"outputs": r.result()} for r in results]
         elif self._trt_session is not None:
             # TensorRT LLM uses implicit batching, so we need to stack the input tensors
             in_data = stack_tensors_in_dict(args) if args else dict(kwargs)
@@ -193,7 +303,45 @@ class TensorRTLLMBackend(ModelBackend):
         else:
             raise Exception("TensorRTLLM backend is not correctly initialized")
 
+    def _generate_streaming(self, inputs, sample_params):
+        """Submit the inputs and yield the partial outputs of all of them on every generation step"""
+        results = [self._llm.generate_async(i, p, streaming=True) for i, p in zip(inputs, sample_params)]
+        iterators = [iter(r) for r in results]
+        latest = [None] * len(results)
+        try:
+            while iterators.count(None) < len(iterators):
+                advanced = [False] * len(iterators)
+                for i, it in enumerate(iterators):
+                    if it is None:
+                        continue
+                    try:
+                        latest[i] = self._snapshot(next(it))
+                        advanced[i] = True
+                    except StopIteration:
+                        iterators[i] = None
+                if any(advanced) and all(latest):
+                    # the outputs not advanced in this step carry no new text
+                    latest = [r if a else self._snapshot(r, stale=True) for r, a in zip(latest, advanced)]
+                    yield [{"outputs": r} for r in latest]
+        finally:
+            # the consumer stopped early, no need to generate the rest
+            for result, it in zip(results, iterators):
+                if it is not None and not result.finished:
+                    result.abort()
 
-
-
-
+    @staticmethod
+    def _snapshot(result, stale: bool = False):
+        # the runtime updates the result in place, so the partial output is copied
+        # to keep the text delta consistent until it is consumed downstream
+        return SimpleNamespace(
+            request_id=result.request_id,
+            finished=result.finished,
+            outputs=[
+                SimpleNamespace(
+                    index=o.index,
+                    text=o.text,
+                    text_diff="" if stale else o.text_diff,
+                    finish_reason=o.finish_reason
+                ) for o in result.outputs
+            ]
+        )
@@ -19,16 +19,24 @@
 
 class TritonBackend(ModelBackend):
     """Triton Python Backend"""
-    def __init__(self, model_config: Dict, model_home: str):
+    def __init__(self, model_config: Dict, model_home: str, device_id: int=0):
         logger.debug(f"model_config: {model_config}, model_home: {model_home}")
-        super().__init__(model_config, model_home)
+        super().__init__(model_config, model_home, device_id)
         self._model_name = model_config["name"]
         self._input_names = [i['name'] for i in model_config['input']]
         self._output_names = [o['name'] for o in model_config['output']]
+        self._output_dims = {o['name']: o['dims'] for o in model_config['output']}
+        # batch the explicitly batched items into one request, only if the target model isn't decoupled
+        self._max_batch_size = model_config.get("max_batch_size", 0)
+        decoupled = model_config.get("model_transaction_policy", {}).get("decoupled", False)
+        self._bls_batching = model_config.get("bls_batching", False) and self._max_batch_size > 0 and not decoupled
         logger.debug(f"TritonBackend created for {self._model_name} with inputs {self._input_names} and outputs {self._output_names}")
 
     def __call__(self, *args, **kwargs):
         in_data_list = args if args else [kwargs]
+        if self._bls_batching and len(in_data_list) > 1:
+            yield from self._batched_call(in_data_list)
+            return
         input_config = self._model_config["input"]
         # to determine if we need to stack the input, TODO: below logic needs be more generic
         need_stack = False
@@ -36,7 +44,7 @@ class TritonBackend(ModelBackend):
             for key, value in in_data.items():
                 input_config = next((i for i in self._model_config["input"] if i['name'] == key), None)
                 if input_config is None:
-                    logger.error(f"Unexpected input: {key}")
+                    logger.error("Unexpected input: %s", key)
                     continue
                 expected_dims = len(input_config["dims"])
                 if expected_dims == len(value.shape) + 1:
@@ -88,26 +96,239 @@ class TritonBackend(ModelBackend):
                         tensor = torch.utils.dlpack.from_dlpack(output.to_dlpack())
                         if tensor.numel() != 0:
                             expected[name] = torch.squeeze(tensor, 0) if len(tensor.shape) == (len(dims)+1) else tensor
-                logger.debug(f"TritonBackend saved inference results to: {expected}")
+                logger.debug("TritonBackend saved inference results to: %s", LazyTensorSummary(expected))
                 if all([expected[k] is not None for k in expected]):
                     yield expected
-        logger.info(f"Infernece with TritonBackend {self._model_name} accomplished")
+        logger.info("Infernece with TritonBackend %s accomplished", self._model_name)
+
+    def _batched_call(self, in_data_list: List[Dict]):
+        """Batch the items of the same shapes up to max_batch_size and issue the requests concurrently"""
+        groups = OrderedDict()
+        for index, in_data in enumerate(in_data_list):
+            signature = tuple(
+                (k, tuple(v.shape), str(v.dtype), isinstance(v, np.ndarray)) for k, v in in_data.items()
+            )
+            groups.setdefault(signature, []).append(index)
+        chunks = [
+            indices[i:i + self._max_batch_size]
+            for indices in groups.values() for i in range(0, len(indices), self._max_batch_size)
+        ]
+        requests = []
+        for chunk in chunks:
+            tensors = []
+            for k in in_data_list[chunk[0]]:
+                values = [in_data_list[i][k] for i in chunk]
+                if isinstance(values[0], np.ndarray):
+                    tensor = pb_utils.Tensor(k, np.stack(values))
+                elif isinstance(values[0], torch.Tensor) or hasattr(values[0], "__dlpack__"):
+                    values = [v if isinstance(v, torch.Tensor) else torch.utils.dlpack.from_dlpack(v) for v in values]
+                    tensor = pb_utils.Tensor.from_dlpack(k, torch.utils.dlpack.to_dlpack(torch.stack(values)))
+                else:
+                    yield Error(message="Unsupported input tensor format")
+                    return
+                tensors.append(tensor)
+            requests.append(pb_utils.InferenceRequest(
+                model_name = self._model_name,
+                requested_output_names = self._output_names,
+                inputs = tensors
+            ))
+        logger.debug("TritonBackend batched %d items into requests of sizes %s", len(in_data_list), [len(c) for c in chunks])
+        async def exec_all():
+            return await asyncio.gather(*(r.async_exec() for r in requests))
+        responses = asyncio.run(exec_all())
+        # split the batched responses back to the items in their original order
+        results = [None] * len(in_data_list)
+        for chunk, response in zip(chunks, responses):
+            if response.has_error():
+                for i in chunk:
+                    results[i] = Error(message=response.error().message())
+                continue
+            outputs = {}
+            for name in self._output_names:
+                output = pb_utils.get_output_tensor_by_name(response, name)
+                if not output:
+                    continue
+                if pb_utils.Tensor.is_cpu(output):
+                    tensor = output.as_numpy()
+                else:
+                    tensor = torch.utils.dlpack.from_dlpack(output.to_dlpack())
+                outputs[name] = tensor
+            for j, i in enumerate(chunk):
+                results[i] = {
+                    n: t[j] if len(t.shape) == len(self._output_dims[n]) + 1 else t
+                    for n, t in outputs.items()
+                }
+        for result in results:
+            if isinstance(result, Error) or all([n in result for n in self._output_names]):
+                yield result
+        logger.info("Inference of %s items with TritonBackend %s accomplished in %s requests", len(in_data_list), self._model_name, len(chunks))
 
 {% else %}
 
 import tritonclient.http as httpclient
 from tritonclient.utils import *
 
+class TritonClientPool:
+    """A long-lived client of a remote Triton server with a bounded window of requests in flight
+
+    The HTTP client keeps a pool of max_concurrency keep-alive connections and the gRPC
+    client reuses a single channel. With system shared memory, each in-flight slot owns a
+    region for its inputs and outputs, so the tensors don't go through the socket.
+    """
+    def __init__(self, config: Dict):
+        self._url = config.get("url", "localhost:8000")
+        self._protocol = config.get("protocol", "http")
+        self._max_concurrency = int(config.get("max_concurrency", 4))
+        timeout = float(config.get("timeout", 60))
+        if self._protocol == "grpc":
+            import tritonclient.grpc as grpcclient
+            self._module = grpcclient
+            self._client = grpcclient.InferenceServerClient(self._url)
+        elif self._protocol == "http":
+            self._module = httpclient
+            self._client = httpclient.InferenceServerClient(
+                self._url,
+                concurrency=self._max_concurrency,
+                connection_timeout=timeout,
+                network_timeout=timeout
+            )
+        else:
+            raise ValueError(f"Unsupported triton client protocol: {self._protocol}")
+        # system shared memory regions, one per in-flight slot: (name, handle)
+        self._regions = []
+        self._region_size = int(config.get("shared_memory_size", 16) * 2**20)
+        if config.get("shared_memory", False):
+            import tritonclient.utils.shared_memory as shm
+            self._shm = shm
+            for i in range(self._max_concurrency):
+                name = f"nim_{os.getpid()}_{id(self)}_{i}"
+                handle = shm.create_shared_memory_region(name, f"/{name}", self._region_size)
+                self._client.register_system_shared_memory(name, f"/{name}", self._region_size)
+                self._regions.append((name, handle))
+        self._free_slots = deque(range(self._max_concurrency))
+        logger.info(f"Triton client connected to {self._url} over {self._protocol}, max concurrency {self._max_concurrency}, shared memory {bool(self._regions)}")
+
+    @property
+    def max_concurrency(self):
+        return self._max_concurrency
+
+    def infer_all(self, model_name: str, requests: List[Dict], output_names: List[str], request_id: str):
+        """Infer the list of input dicts with up to max_concurrency requests in flight, yield the outputs in order"""
+        pending = deque()
+        try:
+            for index, inputs in enumerate(requests):
+                if not self._free_slots:
+                    yield self._collect(pending.popleft())
+                slot = self._free_slots.popleft()
+                try:
+                    pending.append(self._submit(model_name, inputs, output_names, f"{request_id}-{index}", slot))
+                except Exception:
+                    self._free_slots.append(slot)
+                    raise
+            while pending:
+                yield self._collect(pending.popleft())
+        finally:
+            # the consumer is gone or failed, wait for the requests in flight to release their slots
+            while pending:
+                try:
+                    self._collect(pending.popleft())
+                except Exception as e:
+                    logger.warning("Discarded request to %s failed: %s", model_name, e)
+
+    def close(self):
+        for name, handle in self._regions:
+            self._client.unregister_system_shared_memory(name)
+            self._shm.destroy_shared_memory_region(handle)
+        self._regions.clear()
+        self._client.close()
+
+    def _submit(self, model_name, inputs: Dict, output_names: List[str], request_id: str, slot: int):
+        region = self._regions[slot] if self._regions else None
+        infer_inputs = []
+        offset = 0
+        for name, tensor in inputs.items():
+            infer_input = self._module.InferInput(name, tensor.shape, np_to_triton_dtype(tensor.dtype))
+            if region is not None:
+                tensor = np.ascontiguousarray(tensor)
+                if tensor.dtype == np.object_ or tensor.dtype.type == np.bytes_:
+                    # BYTES go to the region serialized, nbytes only counts their pointers
+                    tensor = serialize_byte_tensor(tensor)
+                    nbytes = serialized_byte_size(tensor)
+                else:
+                    nbytes = tensor.nbytes
+                if offset + nbytes > self._region_size:
+                    raise ValueError(f"Input {name} exceeds the shared memory region of {self._region_size} bytes")
+                self._shm.set_shared_memory_region(region[1], [tensor], offset=offset)
+                infer_input.set_shared_memory(region[0], nbytes, offset=offset)
+                offset += nbytes
+            else:
+                infer_input.set_data_from_numpy(tensor)
+            infer_inputs.append(infer_input)
+        outputs = []
+        # offsets of the outputs in the region
+        output_offsets = {}
+        if region is not None and output_names:
+            # the rest of the region is split evenly between the outputs
+            size = (self._region_size - offset) // len(output_names)
+        for name in output_names:
+            output = self._module.InferRequestedOutput(name)
+            if region is not None:
+                output.set_shared_memory(region[0], size, offset=offset)
+                output_offsets[name] = offset
+                offset += size
+            outputs.append(output)
+        if self._protocol == "grpc":
+            future = Future()
+            def callback(result, error):
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+            self._client.async_infer(model_name, infer_inputs, callback, outputs=outputs, request_id=request_id)
+            handle = future
+        else:
+            handle = self._client.async_infer(model_name, infer_inputs, request_id=request_id, outputs=outputs)
+        return handle, output_names, output_offsets, slot
+
+    def _collect(self, pending):
+        handle, output_names, output_offsets, slot = pending
+        try:
+            response = handle.result() if self._protocol == "grpc" else handle.get_result()
+            result = {}
+            for name in output_names:
+                if self._regions:
+                    output = response.get_output(name)
+                    if output is None:
+                        continue
+                    if isinstance(output, dict):
+                        datatype, shape = output["datatype"], output["shape"]
+                    else:
+                        datatype, shape = output.datatype, list(output.shape)
+                    # copy out of the region before it is reused by the next request
+                    result[name] = np.copy(self._shm.get_contents_as_numpy(
+                        self._regions[slot][1], triton_to_np_dtype(datatype), shape, offset=output_offsets[name]))
+                else:
+                    result[name] = response.as_numpy(name)
+            return result
+        finally:
+            self._free_slots.append(slot)
+
+
 class TritonBackend(ModelBackend):
     """Triton Python Backend"""
-    def __init__(self, model_config: Dict, model_home: str):
+    def __init__(self, model_config: Dict, model_home: str, device_id: int=0):
         logger.debug(f"model_config: {model_config}")
-        super().__init__(model_config, model_home)
+        super().__init__(model_config, model_home, device_id)
         self._model_name = model_config["name"]
         self._input_names = [i['name'] for i in model_config['input']]
         self._output_names = [o['name'] for o in model_config['output']]
+        self._client = TritonClientPool(model_config.get("triton_client", {}))
         logger.debug(f"TritonBackend created for {self._model_name} with inputs {self._input_names} and outputs {self._output_names}")
 
+    def stop(self):
+        self._client.close()
+        super().stop()
+
     def __call__(self, *args, **kwargs):
         in_data_list = args if args else [kwargs]
         input_config = self._model_config["input"]
@@ -117,7 +338,7 @@ class TritonBackend(ModelBackend):
             for key, value in in_data.items():
                 input_config = next((i for i in self._model_config["input"] if i['name'] == key), None)
                 if input_config is None:
-                    logger.error(f"Unexpected input: {key}")
+                    logger.error("Unexpected input: %s", key)
                     continue
                 expected_dims = len(input_config["dims"])
                 if expected_dims == len(value.shape) + 1:
@@ -125,8 +346,9 @@ class TritonBackend(ModelBackend):
                     break
         if need_stack:
             in_data_list = [stack_tensors_in_dict(in_data_list)]
+        requests = []
         for in_data in in_data_list:
-            inputs = []
+            inputs = {}
             for k in in_data:
                 tensor = in_data[k]
                 batched = "max_batch_size" in self._model_config and self._model_config["max_batch_size"] > 0
@@ -137,25 +359,26 @@ class TritonBackend(ModelBackend):
                 elif not isinstance(tensor, np.ndarray):
                     yield Error(message="Unsupported input tensor format")
                     return
-                input = httpclient.InferInput(k, tensor.shape, np_to_triton_dtype(tensor.dtype))
-                input.set_data_from_numpy(tensor)
-                inputs.append(input)
-            outputs = [httpclient.InferRequestedOutput(n) for n in self._output_names]
-            with httpclient.InferenceServerClient("localhost:8000") as client:
-                response = client.infer(self._model_name, inputs, request_id=str(1), outputs=outputs)
-
-            result = response.get_response()
-            expected = {n: None for n in self._output_names}
-#            if response.has_error():
-#                yield Error(message=f"{response.error().message()}, stream_id={idx}")
-            for name in expected:
-                config = next((c for c in self._model_config['output'] if c['name'] == name), None)
-                dims = config['dims']
-                output = response.as_numpy(name)
-                expected[name] = np.squeeze(output, 0) if len(output.shape) == (len(dims)+1) else output
-            logger.debug(f"TritonBackend saved inference results to: {expected}")
-            if all([expected[k] is not None for k in expected]):
-                yield expected
-        logger.info(f"Inference with TritonBackend {self._model_name} accomplished")
-
-{% endif %}
\ No newline at end of file
+                inputs[k] = tensor
+            requests.append(inputs)
+        context = current_request_context()
+        request_id = context.request_id if context is not None else uuid.uuid4().hex
+        try:
+            for response in self._client.infer_all(self._model_name, requests, self._output_names, request_id):
+                expected = {n: None for n in self._output_names}
+                for name in expected:
+                    config = next((c for c in self._model_config['output'] if c['name'] == name), None)
+                    dims = config['dims']
+                    output = response.get(name, None)
+                    if output is None:
+                        continue
+                    expected[name] = np.squeeze(output, 0) if len(output.shape) == (len(dims)+1) else output
+                logger.debug("TritonBackend saved inference results to: %s", LazyTensorSummary(expected))
+                if all([expected[k] is not None for k in expected]):
+                    yield expected
+        except InferenceServerException as e:
+            yield Error(message=f"Inference with {self._model_name} failed: {e}")
+            return
+        logger.info("Inference with TritonBackend %s accomplished", self._model_name)
+
+{% endif %}
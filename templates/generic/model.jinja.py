@@ -20,6 +20,7 @@ from config import global_config
 from lib.inference import *
 from lib.utils import *
 from omegaconf import OmegaConf
+import functools
 import json
 import os
 from typing import List, Dict
@@ -44,10 +45,10 @@ class GenericInference(InferenceBase):
         model_repo = global_config.model_repo
         logger.info(f"Model Repository: {model_repo}")
         super().initialize(model_repo)
+        backends = []
         for operator in self._operators:
             model_config = next((m for m in global_config.models if m.name == operator.model_name), None)
             backend_spec = model_config.backend.split('/')
-            backend_instance = None
             backend_class = None
             if backend_spec[0] == 'triton':
                 backend_class = TritonBackend
@@ -63,11 +64,16 @@ class GenericInference(InferenceBase):
                 backend_class = PytorchBackend
             else:
                 raise Exception(f"Backend {model_config.backend} not supported")
-            backend_instance = backend_class(
-                model_config=OmegaConf.to_container(model_config),
-                model_home=os.path.join(model_repo, operator.model_name)
-            )
-            self._submit(operator, backend_instance)
+            # a backend per device, created along with the others when the models start
+            backends.append((operator, functools.partial(
+                create_backend,
+                backend_class,
+                OmegaConf.to_container(model_config),
+                os.path.join(model_repo, operator.model_name),
+                operator.device_scheduler
+            )))
+        # the backends are created and the models warmed up in parallel before serving
+        self._start(backends)
         # post processing:
         self._processors = []
         if hasattr(global_config, "postprocessors"):
@@ -80,76 +86,107 @@ class GenericInference(InferenceBase):
 
         # thread executor for async bridge
         self._async_executor = ThreadPoolExecutor(max_workers=len(self._outputs))
-        # async queues
-        self._async_outputs = [asyncio.Queue() for o in self._outputs]
+        # async queues of the requests in flight: request id -> one queue per output
+        self._async_outputs: Dict[str, List[asyncio.Queue]] = {}
+        self._bridge_loop = None
         self._stop_event = threading.Event()
         logger.info(f"GenericInference {global_config.name} initialized:")
         logger.info(f"Inputs: {[f.o_names for f in self._inputs]}, Outputs:  {[f.o_names for f in self._outputs]}")
 
-    async def execute(self, request):
-        """ execute a list of requests"""
-        async def async_put(queue, item):
-            await queue.put(item)
-        def thread_to_async_bridge(thread_queue, async_queue, loop):
+    async def execute(self, request, context: RequestContext = None):
+        """ execute a list of requests
+
+            The context carries the deadline and the cancellation state of the request,
+            a default one is created if not given.
+        """
+        logger.debug("Received request %s", LazyTensorSummary(request))
+        if context is None:
+            context = self.create_context()
+        # start the async bridges to fetch the results and route them to the requests
+        if self._bridge_loop is None:
+            self._bridge_loop = asyncio.get_event_loop()
+            for index, output in enumerate(self._outputs):
+                self._async_executor.submit(self._thread_to_async_bridge, index, output, self._bridge_loop)
+        async_outputs = [asyncio.Queue() for _ in self._outputs]
+        self._async_outputs[context.request_id] = async_outputs
+        try:
+            matched = [[n for n in input.in_names if n in request] for input in self._inputs]
+            reshuffled = sorted(range(len(matched)), key=lambda x: len(matched[x]), reverse=True)
+            for i in reshuffled:
+                input = self._inputs[i]
+                # select the tensors for the input
+                tensors = { n: request[n] for n in input.in_names if n in request and request[n]}
+
+                # the tensors need to be transformed to generic type
+                for name in tensors:
+                    tensor = tensors[name]
+                    if name not in self._input_config_map:
+                        logger.warning("Invalid input parsed: %s", name)
+                        continue
+                    tensors[name] = np.array(tensor)
+                if tensors:
+                    logger.debug("Injecting tensors %s", LazyTensorSummary(tensors))
+                    tensors[REQUEST_CONTEXT_KEY] = context
+                    input.put(tensors)
+                    input.put(Stop(reason="end", request_id=context.request_id))
+
+            # Wait for all the results from one inference request
             while not self._stop_event.is_set():
                 try:
-                    item = thread_queue.get()
-                    asyncio.run_coroutine_threadsafe(async_put(async_queue, item), loop)
-                except Empty:
-                    continue
-            logger.info(f"thread_to_async_bridge {thread_queue} stopped")
-
-        logger.debug(f"Received request {request}")
-        matched = [[n for n in input.in_names if n in request] for input in self._inputs]
-        reshuffled = sorted(range(len(matched)), key=lambda x: len(matched[x]), reverse=True)
-        for i in reshuffled:
-            input = self._inputs[i]
-            # select the tensors for the input
-            tensors = { n: request[n] for n in input.in_names if n in request and request[n]}
-
-            # the tensors need to be transformed to generic type
-            for name in tensors:
-                tensor = tensors[name]
-                config = next((c for c in self._input_config if c['name'] == name), None)
-                if config is None:
-                    logger.warning(f"Invalid input parsed: {name}")
-                    continue
-                tensors[name] = np.array(tensor)
-            if tensors:
-                logger.debug(f"Injecting tensors {tensors}")
-                input.put(tensors)
-                input.put(Stop(reason="end"))
-
-        # start the async bridges to fetch the results and deposit them to the async queues
-        loop = asyncio.get_event_loop()
-        for a_output, output in zip(self._async_outputs, self._outputs):
-            self._async_executor.submit(thread_to_async_bridge, output, a_output, loop)
-
-        # Wait for all the results from one inference request
+                    logger.debug("Waiting for tensors from async queue")
+                    response_data = dict()
+                    results = await asyncio.gather(*(ao.get() for ao in async_outputs))
+                    error = False
+                    for data in results:
+                        logger.debug("Got output data: %s", LazyTensorSummary(data))
+                        if isinstance(data, Error):
+                            logger.warning("Got Error: %s", data.message)
+                            error = True
+                            break
+                        elif isinstance(data, Stop):
+                            logger.info("Got Stop: %s", data.reason)
+                            return
+                        # collect the output
+                        for k, v in data.items():
+                            if k != REQUEST_CONTEXT_KEY:
+                                response_data[k] = v
+                    if not error:
+                        # post-process the data from all the outputs
+                        response_data = self._post_process(response_data)
+                        yield response_data
+                except (GeneratorExit, asyncio.CancelledError):
+                    # the consumer is gone, stop the pending work of the request
+                    context.cancel()
+                    raise
+                except Exception as e:
+                    logger.exception(e)
+        finally:
+            self._async_outputs.pop(context.request_id, None)
+
+    def _thread_to_async_bridge(self, index: int, thread_queue, loop):
         while not self._stop_event.is_set():
             try:
-                logger.debug("Waiting for tensors from async queue")
-                response_data = dict()
-                results = await asyncio.gather(*(ao.get() for ao in self._async_outputs))
-                error = False
-                for data in results:
-                    logger.debug(f"Got output data: {data}")
-                    if isinstance(data, Error):
-                        logger.warning(f"Got Error: {data.message}")
-                        error = True
-                        break
-                    elif isinstance(data, Stop):
-                        logger.info(f"Got Stop: {data.reason}")
-                        return
-                    # collect the output
-                    for k, v in data.items():
-                        response_data[k] = v
-                if not error:
-                    # post-process the data from all the outputs
-                    response_data = self._post_process(response_data)
-                    yield response_data
-            except Exception as e:
-                logger.exception(e)
+                item = thread_queue.get()
+                loop.call_soon_threadsafe(self._route, index, item)
+            except Empty:
+                continue
+        logger.info(f"thread_to_async_bridge {thread_queue} stopped")
+
+    def _route(self, index: int, item):
+        """Deposit an output item to the queue of the request it belongs to"""
+        if isinstance(item, Error) or isinstance(item, Stop):
+            request_id = item.request_id
+        else:
+            context = item.get(REQUEST_CONTEXT_KEY, None)
+            request_id = context.request_id if context is not None else None
+        if request_id is None and len(self._async_outputs) == 1:
+            # the only request in flight owns the untagged item
+            request_id = next(iter(self._async_outputs))
+        async_outputs = self._async_outputs.get(request_id, None)
+        if async_outputs is None:
+            logger.debug("Discarding output of request %s which is no longer waiting", request_id)
+            return
+        async_outputs[index].put_nowait(item)
 
 
     def finalize(self):
@@ -160,30 +197,28 @@ class GenericInference(InferenceBase):
         processed = {k: v for k, v in data.items()}
         for processor in self._processors:
             if not all([i in data for i in processor.input]):
-                logger.warning(f"Input settings invalid for the processor: {processor}")
+                logger.warning("Input settings invalid for the processor: %s", processor)
                 continue
             input = [processed.pop(i) for i in processor.input]
-            logger.debug(f"Post-processor invoked with given input {input}")
+            logger.debug("Post-processor invoked with given input %s", LazyTensorSummary(input))
             output = processor(*input)
-            logger.debug(f"Post-processor generated output {output}")
+            logger.debug("Post-processor generated output %s", LazyTensorSummary(output))
             if len(output) != len(processor.output):
-                logger.warning(f"Number of postprocessing output doesn't match the configuration, expecting {len(processor.output)}, while getting {len(output)}")
+                logger.warning("Number of postprocessing output doesn't match the configuration, expecting %s, while getting %s", len(processor.output), len(output))
                 continue
             # update as processed
             for key, value in zip(processor.output, output):
                 processed[key] = value
                 # correct data type
-                output_config = next((c for c in self._output_config if c['name'] == key), None)
-                if output_config is None:
-                    logger.warning(f"Invalid output parsed: {key}")
+                if key not in self._output_config_map:
+                    logger.warning("Invalid output parsed: %s", key)
                     continue
-                data_type = output_config["data_type"]
                 if isinstance(value, np.ndarray):
-                    data_type = np_datatype_mapping[data_type]
+                    data_type = self._output_np_types[key]
                     if value.dtype != data_type:
                         processed[key]  = value.astype(data_type)
                 elif isinstance(value, torch.Tensor):
-                    data_type = torch_datatype_mapping[data_type]
+                    data_type = self._output_torch_types[key]
                     if value.dtype != data_type:
                         processed[key]  = value.to(data_type)
                 else:
@@ -199,7 +234,7 @@ class GenericInference(InferenceBase):
                     elif isinstance(v, torch.Tensor):
                         value_list.append(v.tolist())
                     elif dataclasses.is_dataclass(v):
-                        value_list.append(dataclasses.asdict(v))
+                        value_list.append(serialize_dataclass(v))
                     else:
                         value_list.append(v)
                 processed[key] = value_list
@@ -209,5 +244,5 @@ class GenericInference(InferenceBase):
                 elif isinstance(value, torch.Tensor):
                     processed[key] = value.tolist()
                 elif dataclasses.is_dataclass(value):
-                    processed[key] = dataclasses.asdict(value)
+                    processed[key] = serialize_dataclass(value)
         return processed
\ No newline at end of file
@@ -20,7 +20,15 @@
         streaming = "application/x-ndjson" in accept
         try:
             in_data = self.process_request("{{ name }}", body)
-            self.logger.debug(f"request processed as {in_data}")
+            self.logger.debug("request processed as %s", LazyTensorSummary(in_data))
+            # per-request timeout in seconds from the client, or the default from the config
+            timeout = request.headers.get("x-request-timeout", None)
+            context = self._inference.create_context(
+                float(timeout) if timeout else None,
+                priority=request.headers.get("x-request-priority", None),
+                tenant=request.headers.get("x-tenant-id", None),
+                streaming=streaming
+            )
         except Exception as e:
             self.logger.error(f"Request processing failed: {type(e).__name__}: {e}")
             return 400, str(e)
@@ -29,20 +37,44 @@
             if streaming:
                 # If streaming, yield results as they are processed
                 async def generate_stream():
-                    async with self._lock:
-                        async for result in self._inference.execute(in_data):
-                            response = self.process_response("infer", request, result)
-                            yield response
+                    try:
+                        async with self._scheduler.schedule(context):
+                            if context.done:
+                                return
+                            envelope = self.create_stream_envelope("infer", request)
+                            async for result in self._inference.execute(in_data, context):
+                                yield self.process_streamed_response("infer", request, result, envelope)
+                    except asyncio.TimeoutError:
+                        self.logger.warning("Request %s expired in the queue", context.request_id)
 
                 # Wrap the generator with StreamingResponse
                 return 200, StreamingResponse(generate_stream(), media_type="application/x-ndjson")
             else:
                 # If not streaming, process and return the last result
+                async def watch_disconnect():
+                    while not await request.is_disconnected():
+                        await asyncio.sleep(0.1)
+                    context.cancel()
+
                 response = None
-                async with self._lock:
-                    async for result in self._inference.execute(in_data):
-                        response = self.process_response("infer", request, result)
-                    return (200, response) if response else (500, "No results generated from inference")
+                result = None
+                watcher = asyncio.create_task(watch_disconnect())
+                try:
+                    async with self._scheduler.schedule(context):
+                        if context.done:
+                            return 504, "Request deadline exceeded"
+                        # only the last result is returned, so the others needn't be formatted
+                        async for result in self._inference.execute(in_data, context):
+                            pass
+                        if result is not None:
+                            response = self.process_response("infer", request, result)
+                except asyncio.TimeoutError:
+                    return 504, "Request deadline exceeded"
+                finally:
+                    watcher.cancel()
+                if response is None and context.expired:
+                    return 504, "Request deadline exceeded"
+                return (200, response) if response else (500, "No results generated from inference")
         except Exception as e:
             self.logger.error(f"Inference failed: {type(e).__name__}: {e}")
             return 500, str(e)
@@ -20,7 +20,9 @@ import triton_python_backend_utils as pb_utils
 from lib.inference import *
 from lib.utils import *
 from omegaconf import OmegaConf
+import functools
 import json
+import threading
 import os
 from typing import List, Dict
 import asyncio
@@ -72,18 +74,19 @@ class TritonPythonModel(InferenceBase):
         model_repo = global_config.model_repo
         logger.info(f"Model Repository: {model_repo}")
         super().initialize(model_repo)
+        backends = []
         for operator in self._operators:
             model_config = next((m for m in global_config.models if m.name == operator.model_name), None)
             backend_spec = model_config.backend.split('/')
-            backend_instance = None
-            if backend_spec[0] == 'triton':
-                backend_instance = TritonBackend(
-                    model_config=OmegaConf.to_container(model_config),
-                    model_home=os.path.join(model_repo, operator.model_name, "1")
-                )
-            if backend_instance is None:
+            if backend_spec[0] != 'triton':
                 raise Exception(f"Unable to create backend {model_config.backend}")
-            self._submit(operator, backend_instance)
+            backends.append((operator, functools.partial(
+                TritonBackend,
+                model_config=OmegaConf.to_container(model_config),
+                model_home=os.path.join(model_repo, operator.model_name, "1")
+            )))
+        # the backends are created and the models warmed up in parallel before serving
+        self._start(backends)
         # post processing:
         self._processors = []
         if hasattr(global_config, "postprocessors"):
@@ -96,27 +99,21 @@ class TritonPythonModel(InferenceBase):
 
         # thread executor for async bridge
         self._async_executor = ThreadPoolExecutor(max_workers=len(self._outputs))
-        # async queues
-        self._async_outputs = [asyncio.Queue() for o in self._outputs]
+        # async queues of the requests in flight: request id -> one queue per output
+        self._async_outputs: Dict[str, List[asyncio.Queue]] = {}
+        self._bridge_loop = None
+        self._stop_event = threading.Event()
+        # one long-lived bridge per output routes the results to the requests
+        for index, output in enumerate(self._outputs):
+            self._async_executor.submit(self._thread_to_async_bridge, index, output)
         logger.info(f"Model {global_config.name} initialized:")
         logger.info(f"Inputs: {[f.o_names for f in self._inputs]}, Outputs:  {[f.o_names for f in self._outputs]}")
 
     async def execute(self, requests):
         """ execute a list of requests"""
-        async def async_put(queue, item):
-            await queue.put(item)
-        def thread_to_async_bridge(thread_queue, async_queue, loop):
-            while True:
-                try:
-                    item = thread_queue.get()
-                    asyncio.run_coroutine_threadsafe(async_put(async_queue, item), loop)
-                    if isinstance(item, Stop) or isinstance(item, Error):
-                        break
-                except Empty:
-                    continue
-
-
-        logger.info(f"Received {len(requests)} request(s)")
+        if self._bridge_loop is None:
+            self._bridge_loop = asyncio.get_running_loop()
+        logger.info("Received %s request(s)", len(requests))
         for request in requests:
             response_sender = request.get_response_sender()
             if request.is_cancelled():
@@ -124,87 +121,148 @@ class TritonPythonModel(InferenceBase):
                     error=pb_utils.TritonError("request is cancelled", pb_utils.TritonError.CANCELLED)),
                     flags=pb_utils.TRITONSERVER_RESPONSE_COMPLETE_FINAL)
                 continue
-            for input in self._inputs:
-                # select the tensors for the input
-                tensors = {n: pb_utils.get_input_tensor_by_name(request, n) for n in input.in_names}
-                # the tensors need to be transformed to generic type
-                for name in tensors:
-                    tensor = tensors[name]
-                    config = next((c for c in self._input_config if c['name'] == name), None)
-                    if config is None:
-                        logger.warning(f"Invalid input parsed: {name}")
-                        continue
-                    dims = config['dims']
-                    if pb_utils.Tensor.is_cpu(tensor):
-                        tensor = tensor.as_numpy()
-                        # auto reshape
-                        if len(tensor.shape) == (len(dims)+1):
-                            tensor = np.squeeze(tensor, 0)
-                    else:
-                        tensor = torch.utils.dlpack.from_dlpack(tensor.to_dlpack())
-                        # auto reshape
-                        if len(tensor.shape) == (len(dims)+1):
-                            tensor = torch.squeeze(tensor, 0)
-                    tensors[name] = tensor
-                if tensors:
-                    logger.debug(f"Injecting tensors {tensors}")
-                    input.put(tensors)
-                    input.put(Stop(reason="end"))
-            # fetch result
-            loop = asyncio.get_event_loop()
-            for a_output, output in zip(self._async_outputs, self._outputs):
-                logger.error(f"Submitting {output._timeout} to async executor")
-                self._async_executor.submit(thread_to_async_bridge, output, a_output, loop)
-            stop = False
-            while not stop:
-                try:
-                    logger.debug("Waiting for tensors from async queue")
-                    response_data = dict()
-                    results = await asyncio.gather(*(ao.get() for ao in self._async_outputs))
-                    for data in results:
-                        logger.debug(f"Got output data: {data}")
-                        if isinstance(data, Error):
-                            error = pb_utils.TritonError(f"steam llm_response, error received: {data.message}")
+            # request timeout from triton is in microseconds, 0 means no timeout
+            timeout = request.timeout() / 1e6 if request.timeout() else None
+            context = self.create_context(timeout, is_cancelled=request.is_cancelled)
+            # the queues are registered before the inputs are injected for no result to be missed
+            async_outputs = [asyncio.Queue() for _ in self._outputs]
+            self._async_outputs[context.request_id] = async_outputs
+            try:
+                for input in self._inputs:
+                    # select the tensors for the input
+                    tensors = {n: pb_utils.get_input_tensor_by_name(request, n) for n in input.in_names}
+                    # the tensors need to be transformed to generic type
+                    for name in tensors:
+                        tensor = tensors[name]
+                        config = self._input_config_map.get(name, None)
+                        if config is None:
+                            logger.warning("Invalid input parsed: %s", name)
+                            continue
+                        dims = config['dims']
+                        if pb_utils.Tensor.is_cpu(tensor):
+                            tensor = tensor.as_numpy()
+                            # auto reshape
+                            if len(tensor.shape) == (len(dims)+1):
+                                tensor = np.squeeze(tensor, 0)
+                        else:
+                            tensor = torch.utils.dlpack.from_dlpack(tensor.to_dlpack())
+                            # auto reshape
+                            if len(tensor.shape) == (len(dims)+1):
+                                tensor = torch.squeeze(tensor, 0)
+                        tensors[name] = tensor
+                    if tensors:
+                        logger.debug("Injecting tensors %s", LazyTensorSummary(tensors))
+                        tensors[REQUEST_CONTEXT_KEY] = context
+                        input.put(tensors)
+                        input.put(Stop(reason="end", request_id=context.request_id))
+                # fetch result
+                await self._respond(response_sender, async_outputs, context)
+            except asyncio.CancelledError:
+                # the request is abandoned, stop its pending work
+                context.cancel()
+                raise
+            finally:
+                self._async_outputs.pop(context.request_id, None)
+            logger.debug("Finalizing the response for requests: %s", request)
+        logger.debug("All request done")
+
+    async def _respond(self, response_sender, async_outputs: List[asyncio.Queue], context: RequestContext):
+        """Send the results routed to the request up to its Stop, an Error is followed by a Stop
+
+        The Error of an expired or cancelled request ends its response, the results
+        still in the flow are drained up to the Stop.
+        """
+        stop = False
+        failed = False
+        while not stop:
+            try:
+                logger.debug("Waiting for tensors from async queue")
+                response_data = dict()
+                results = await asyncio.gather(*(ao.get() for ao in async_outputs))
+                for data in results:
+                    logger.debug("Got output data: %s", LazyTensorSummary(data))
+                    if isinstance(data, Error):
+                        if not failed:
+                            if context.cancelled:
+                                error = pb_utils.TritonError(data.message, pb_utils.TritonError.CANCELLED)
+                            else:
+                                error = pb_utils.TritonError(f"steam llm_response, error received: {data.message}")
                             response_sender.send(
                                 pb_utils.InferenceResponse(error=error),
                                 flags=pb_utils.TRITONSERVER_RESPONSE_COMPLETE_FINAL
                             )
-                            return
-                        elif isinstance(data, Stop):
-                            stop = True
-                            continue
-                        # collect the output
-                        for k, v in data.items():
+                        # keep draining up to the Stop of the request
+                        failed = True
+                        continue
+                    elif isinstance(data, Stop):
+                        stop = True
+                        continue
+                    # collect the output
+                    for k, v in data.items():
+                        if k != REQUEST_CONTEXT_KEY:
                             response_data[k] = v
-                    response_data = self._post_process(response_data)
-                    # response with partial data
-                    response_sender.send(pb_utils.InferenceResponse(
-                        output_tensors=[
-                            pb_utils.Tensor(name, tensor) for name, tensor in response_data.items()
-                        ]
-                    ))
-                except Exception as e:
-                    logger.exception(e)
-
+                if failed:
+                    continue
+                response_data = self._post_process(response_data)
+                # response with partial data
+                response_sender.send(pb_utils.InferenceResponse(
+                    output_tensors=[
+                        pb_utils.Tensor(name, tensor) for name, tensor in response_data.items()
+                    ]
+                ))
+            except Exception as e:
+                logger.exception(e)
+        if not failed:
             response_sender.send(flags=pb_utils.TRITONSERVER_RESPONSE_COMPLETE_FINAL)
-            logger.debug(f"Finalizing the response for requests: {request}")
-        logger.debug(f"All request done")
+
+    def _thread_to_async_bridge(self, index: int, thread_queue):
+        while not self._stop_event.is_set():
+            try:
+                item = thread_queue.get()
+            except Empty:
+                continue
+            if self._bridge_loop is None:
+                logger.debug("Discarding output received before any request")
+                continue
+            self._bridge_loop.call_soon_threadsafe(self._route, index, item)
+        logger.info(f"thread_to_async_bridge {thread_queue} stopped")
+
+    def _route(self, index: int, item):
+        """Deposit an output item to the queue of the request it belongs to
+
+        The items of expired or cancelled requests carry their request id as well, those of
+        a request no longer waiting are discarded here.
+        """
+        if isinstance(item, Error) or isinstance(item, Stop):
+            request_id = item.request_id
+        else:
+            context = item.get(REQUEST_CONTEXT_KEY, None)
+            request_id = context.request_id if context is not None else None
+        if request_id is None and len(self._async_outputs) == 1:
+            # the only request in flight owns the untagged item
+            request_id = next(iter(self._async_outputs))
+        async_outputs = self._async_outputs.get(request_id, None)
+        if async_outputs is None:
+            logger.debug("Discarding output of request %s which is no longer waiting", request_id)
+            return
+        async_outputs[index].put_nowait(item)
 
     def finalize(self):
+        self._stop_event.set()
         super().finalize()
 
     def _post_process(self, data: Dict):
         processed = {k: v for k, v in data.items()}
         for processor in self._processors:
             if not all([i in data for i in processor.input]):
-                logger.warning(f"Input settings invalid for the processor: {processor}")
+                logger.warning("Input settings invalid for the processor: %s", processor)
                 continue
             input = [processed.pop(i) for i in processor.input]
-            logger.debug(f"Post-processor invoked with given input {input}")
+            logger.debug("Post-processor invoked with given input %s", LazyTensorSummary(input))
             output = processor(*input)
-            logger.debug(f"Post-processor generated output {output}")
+            logger.debug("Post-processor generated output %s", LazyTensorSummary(output))
             if len(output) != len(processor.output):
-                logger.warning(f"Number of postprocessing output doesn't match the configuration, expecting {len(processor.output)}, while getting {len(output)}")
+                logger.warning("Number of postprocessing output doesn't match the configuration, expecting %s, while getting %s", len(processor.output), len(output))
                 continue
             # update as processed
             for key, value in zip(processor.output, output):
@@ -219,6 +277,8 @@ class TritonPythonModel:
         the model to initialize any state associated with this model.
         """
         model_name = args["model_name"]
+        # the environment variables apply without a logging section
+        configure_logging(OmegaConf.to_container(global_config.logging) if hasattr(global_config, "logging") else None)
         model_home = os.path.join(global_config.model_repo, model_name, "1")
         model_config = next((m for m in global_config.models if m.name == model_name), None)
         if model_config is None:
@@ -254,7 +314,7 @@ class TritonPythonModel:
         """
         execute each request
         """
-        logger.info(f"Model {self._model_config['name']} received {len(requests)} requests")
+        logger.info("Model %s received %s requests", self._model_config['name'], len(requests))
 
         r_list = []
         responses = []
@@ -278,7 +338,7 @@ class TritonPythonModel:
             for output in self._model_backend(**inputs):
                 r_list.append(output)
         for r in r_list:
-            logger.info(f"Model {self._model_config['name']} generating responses {r}")
+            logger.debug("Model %s generating responses %s", self._model_config['name'], LazyTensorSummary(r))
             for k in r:
                 v = r[k]
                 force_cpu = True if "force_cpu" in self._out_config[k] and self._out_config[k]["force_cpu"] else False
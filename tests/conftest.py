@@ -0,0 +1,38 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests of the common lib, run from the repository root with
+
+    python -m pytest tests
+
+The lib is copied into the generated services next to their config and custom modules,
+minimal ones are provided here for the modules importing them.
+"""
+
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+if "config" not in sys.modules:
+    from omegaconf import OmegaConf
+    config = types.ModuleType("config")
+    config.global_config = OmegaConf.create({"name": "test", "model_repo": "/tmp", "input": [], "output": [], "models": []})
+    sys.modules["config"] = config
+
+if "custom" not in sys.modules:
+    sys.modules["custom"] = types.ModuleType("custom")
@@ -0,0 +1,105 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+from queue import Queue
+import pytest
+
+pytest.importorskip("pyservicemaker")
+
+from lib.inference import (
+    AggregationFlowCollector, DataFlow, Error, RequestContext, Stop, REQUEST_CONTEXT_KEY
+)
+
+
+def make_flows():
+    configs = [{"name": "a", "data_type": "TYPE_FP32", "dims": [1]}, {"name": "b", "data_type": "TYPE_FP32", "dims": [1]}]
+    return [DataFlow([c], [(c["name"], c["name"])]) for c in configs]
+
+
+def drain(collector, n, timeout=5.0):
+    """Collect n items, failing instead of hanging if they don't come"""
+    items = Queue()
+    threading.Thread(target=lambda: [items.put(collector.collect()) for _ in range(n)], daemon=True).start()
+    return [items.get(timeout=timeout) for _ in range(n)]
+
+
+def ends_of(items):
+    return [type(item).__name__ for item in items]
+
+
+@pytest.fixture
+def flows():
+    flows = make_flows()
+    collector = AggregationFlowCollector(flows)
+    yield flows, collector
+    collector.stop()
+
+
+def test_joined_request_ends_with_stop(flows):
+    (a, b), collector = flows
+    context = RequestContext()
+    a.put({"a": 1, REQUEST_CONTEXT_KEY: context})
+    b.put({"b": 2, REQUEST_CONTEXT_KEY: context})
+    a.put(Stop("end", context.request_id))
+    b.put(Stop("end", context.request_id))
+    result, end = drain(collector, 2)
+    assert result["a"] == 1 and result["b"] == 2
+    assert isinstance(end, Stop) and end.request_id == context.request_id
+
+
+def test_error_then_stop_before_other_branch_ends(flows):
+    (a, b), collector = flows
+    context = RequestContext()
+    # the dropping branch ends with an Error and a Stop before the other branch is done
+    a.put(Error("dropped", context.request_id))
+    a.put(Stop("end", context.request_id))
+    b.put({"b": 2, REQUEST_CONTEXT_KEY: context})
+    b.put(Stop("end", context.request_id))
+    items = drain(collector, 2)
+    assert ends_of(items) == ["Error", "Stop"]
+    assert all(item.request_id == context.request_id for item in items)
+    assert collector.n_pending == 0
+
+
+def test_error_then_stop_after_other_branch_ends(flows):
+    (a, b), collector = flows
+    context = RequestContext()
+    b.put({"b": 2, REQUEST_CONTEXT_KEY: context})
+    b.put(Stop("end", context.request_id))
+    a.put(Error("dropped", context.request_id))
+    items = drain(collector, 2)
+    assert ends_of(items) == ["Error", "Stop"]
+    # the late Stop of the failed branch doesn't open the request again
+    a.put(Stop("end", context.request_id))
+    following = RequestContext()
+    a.put({"a": 1, REQUEST_CONTEXT_KEY: following})
+    b.put({"b": 2, REQUEST_CONTEXT_KEY: following})
+    result, = drain(collector, 1)
+    assert result[REQUEST_CONTEXT_KEY] is following
+    assert collector.n_pending == 1
+
+
+def test_evicted_request_ends_with_stop():
+    flows = make_flows()
+    collector = AggregationFlowCollector(flows, timeout=0.05)
+    try:
+        context = RequestContext()
+        flows[0].put({"a": 1, REQUEST_CONTEXT_KEY: context})
+        items = drain(collector, 2)
+        assert ends_of(items) == ["Error", "Stop"]
+        assert collector.n_pending == 0
+    finally:
+        collector.stop()
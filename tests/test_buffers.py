@@ -0,0 +1,152 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import types
+import numpy as np
+import pytest
+import torch
+
+from lib.buffers import IOBufferPool, IORunner, TrtIORunner
+
+
+class FakeRunner(IORunner):
+    """Doubles its input on the CPU, with a profile for short and one for long inputs"""
+    def __init__(self):
+        self.calls = []
+        self._profile = None
+
+    @property
+    def input_dtypes(self):
+        return {"x": torch.float32}
+
+    @property
+    def output_dtypes(self):
+        return {"y": torch.float32}
+
+    @property
+    def profiles(self):
+        return [{"x": ((1, 1), (4, 8))}, {"x": ((1, 9), (4, 64))}]
+
+    def set_profile(self, index, stream):
+        self.calls.append(("set_profile", index))
+        self._profile = index
+
+    def set_input_shapes(self, shapes):
+        return {"y": shapes["x"]}
+
+    def execute(self, inputs, outputs, stream):
+        self.calls.append(("execute", self._profile, tuple(inputs["x"].shape)))
+        torch.mul(inputs["x"], 2, out=outputs["y"])
+
+
+def test_profile_selection():
+    runner = FakeRunner()
+    pool = IOBufferPool(runner, device="cpu")
+    pool.run({"x": np.ones((2, 4), dtype=np.float32)})
+    pool.run({"x": np.ones((2, 32), dtype=np.float32)})
+    assert [c for c in runner.calls if c[0] == "execute"] == [("execute", 0, (2, 4)), ("execute", 1, (2, 32))]
+    with pytest.raises(ValueError):
+        pool.run({"x": np.ones((8, 4), dtype=np.float32)})
+    with pytest.raises(ValueError):
+        pool.run({"x": np.ones((2, 4, 1), dtype=np.float32)})
+
+
+def test_buffer_reuse_and_regrowth():
+    runner = FakeRunner()
+    pool = IOBufferPool(runner, device="cpu")
+    first = pool.run({"x": np.full((4, 8), 1, dtype=np.float32)})
+    # smaller shapes of the same profile run on views of its buffers
+    second = pool.run({"x": torch.full((1, 3), 2.0)})
+    assert pool.n_allocations == 1
+    # the outputs are copies, the next calls don't overwrite them
+    assert torch.equal(first["y"], torch.full((4, 8), 2.0))
+    assert torch.equal(second["y"], torch.full((1, 3), 4.0))
+    # shapes beyond the profile allocate the buffers of the next one, once
+    third = pool.run({"x": np.full((3, 40), 3, dtype=np.float32)})
+    pool.run({"x": np.full((3, 20), 3, dtype=np.float32)})
+    assert pool.n_allocations == 2
+    assert third["y"].shape == (3, 40) and torch.all(third["y"] == 6.0)
+    # switching back selects the profile again without allocating
+    pool.run({"x": np.ones((2, 2), dtype=np.float32)})
+    assert pool.n_allocations == 2
+    assert runner.calls[-2] == ("set_profile", 0)
+
+
+def test_cuda_graph_falls_back_without_cuda():
+    runner = FakeRunner()
+    pool = IOBufferPool(runner, device="cpu", cuda_graph=True)
+    for _ in range(3):
+        result = pool.run({"x": np.ones((2, 4), dtype=np.float32)})
+    assert pool.n_graphs == 0
+    assert len([c for c in runner.calls if c[0] == "execute"]) == 3
+    assert torch.all(result["y"] == 2.0)
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="CUDA graphs need a GPU")
+def test_cuda_graph_replay():
+    runner = FakeRunner()
+    pool = IOBufferPool(runner, device="cuda", cuda_graph=True)
+    for value in range(3):
+        result = pool.run({"x": np.full((2, 4), value, dtype=np.float32)})
+    assert pool.n_graphs == 1
+    # the warm up run and the capture, the replays don't call the runner
+    assert len([c for c in runner.calls if c[0] == "execute"]) == 2
+    assert torch.all(result["y"].cpu() == 4.0)
+
+
+def _fake_tensorrt(monkeypatch):
+    trt = types.ModuleType("tensorrt")
+    for name in ("float32", "float16", "int32", "int64", "int8", "uint8", "bool"):
+        setattr(trt, name, name)
+    trt.TensorIOMode = types.SimpleNamespace(INPUT="input", OUTPUT="output")
+    monkeypatch.setitem(sys.modules, "tensorrt", trt)
+
+
+class FakeEngine:
+    num_io_tensors = 2
+    num_optimization_profiles = 2
+
+    def get_tensor_name(self, i):
+        return ["x", "y"][i]
+
+    def get_tensor_mode(self, name):
+        return "input" if name == "x" else "output"
+
+    def get_tensor_dtype(self, name):
+        return "float16" if name == "x" else "int32"
+
+    def get_tensor_profile_shape(self, name, index):
+        return [(1, 1), (2, 4), (4, 8)] if index == 0 else [(1, 9), (2, 16), (4, 64)]
+
+
+class FakeContext:
+    def __init__(self):
+        self.shapes = {}
+
+    def set_input_shape(self, name, shape):
+        self.shapes[name] = tuple(shape)
+
+    def get_tensor_shape(self, name):
+        return (self.shapes["x"][0], 1)
+
+
+def test_trt_runner(monkeypatch):
+    _fake_tensorrt(monkeypatch)
+    runner = TrtIORunner(FakeEngine(), FakeContext())
+    assert runner.input_dtypes == {"x": torch.float16}
+    assert runner.output_dtypes == {"y": torch.int32}
+    assert runner.profiles == [{"x": ((1, 1), (4, 8))}, {"x": ((1, 9), (4, 64))}]
+    assert runner.set_input_shapes({"x": (3, 20)}) == {"y": (3, 1)}
@@ -0,0 +1,99 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import types
+import numpy as np
+import pytest
+import torch
+
+from lib.devices import DeviceScheduler, model_device_ids
+
+
+def test_model_device_ids():
+    assert model_device_ids({"name": "m"}, 4) == [0]
+    assert model_device_ids({"name": "m", "device_ids": 2}, 4) == [2]
+    assert model_device_ids({"name": "m", "device_ids": [3, 1]}, 4) == [3, 1]
+    for device_ids in ([], [0, 0], [-1], ["0"], [0, 4]):
+        with pytest.raises(ValueError):
+            model_device_ids({"name": "m", "device_ids": device_ids}, 4)
+
+
+def test_place_spreads_the_requests():
+    scheduler = DeviceScheduler([0, 1, 2])
+    # ties go round robin
+    assert [scheduler.place() for _ in range(6)] == [0, 1, 2, 0, 1, 2]
+    # the device with the fewest requests in flight is preferred
+    with scheduler.running(0), scheduler.running(1), scheduler.running(1):
+        assert scheduler.load == {0: 1, 1: 2, 2: 0}
+        assert scheduler.place() == 2
+        with scheduler.running(2), scheduler.running(2):
+            assert scheduler.place() == 0
+    assert scheduler.load == {0: 0, 1: 0, 2: 0}
+
+
+def test_place_keeps_the_device_of_the_context():
+    scheduler = DeviceScheduler([0, 1])
+    context = types.SimpleNamespace(device_id=None)
+    device_id = scheduler.place(context)
+    assert context.device_id == device_id
+    with scheduler.running(device_id), scheduler.running(device_id):
+        assert scheduler.place(context) == device_id
+    # a device the scheduler doesn't have is replaced
+    assert DeviceScheduler([3]).place(context) == 3
+    assert context.device_id == 3
+
+
+def test_running_counts_failed_requests_out():
+    scheduler = DeviceScheduler([0, 1])
+    with pytest.raises(RuntimeError):
+        with scheduler.running(1):
+            raise RuntimeError("backend failed")
+    assert scheduler.load == {0: 0, 1: 0}
+
+
+@pytest.mark.skipif(torch.cuda.is_available() and torch.cuda.device_count() < 2, reason="needs 2 devices or none")
+def test_processors_per_device(monkeypatch):
+    pytest.importorskip("pyservicemaker")
+    import lib.inference
+    from lib.inference import ModelOperator
+
+    class Scale:
+        name = "scale"
+
+        def __init__(self, config):
+            self.device_id = config["device_id"]
+
+        def __call__(self, x):
+            return x * (self.device_id + 1)
+
+    monkeypatch.setattr(lib.inference.custom, "create_instance", lambda name, config: Scale(config), raising=False)
+    config = {
+        "name": "m",
+        "device_ids": [0, 1],
+        "input": [{"name": "x", "data_type": "TYPE_FP32", "dims": [3]}],
+        "output": [{"name": "y", "data_type": "TYPE_FP32", "dims": [3]}],
+        "preprocessors": [{"kind": "custom", "name": "scale", "input": ["x"], "output": ["x"]}],
+        "postprocessors": [{"kind": "custom", "name": "scale", "input": ["y"], "output": ["y"]}],
+    }
+    operator = ModelOperator(config, "/tmp")
+    operator._create_processors()
+    x = np.ones(3, dtype=np.float32)
+    for device_id in (0, 1):
+        processed, _ = operator._preprocess([{"x": x}], device_id)
+        assert np.all(processed[0]["x"] == device_id + 1)
+        assert np.all(operator._postprocess({"y": x}, device_id)["y"] == device_id + 1)
+    # without a device, the processors of the first device are used
+    processed, _ = operator._preprocess([{"x": x}])
+    assert np.all(processed[0]["x"] == 1)
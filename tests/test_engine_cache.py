@@ -0,0 +1,96 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import dataclasses
+import json
+import os
+import pytest
+import yaml
+
+from lib.engine_cache import EngineCache, EngineSpec, RUNTIME_PROPERTIES, config_digest
+
+
+PROPERTY = {
+    "onnx-file": "model.onnx",
+    "network-mode": 2,
+    "infer-dims": "3;544;960",
+    "net-scale-factor": 0.0039215697,
+}
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    with open(tmp_path / "model.onnx", "wb") as f:
+        f.write(b"onnx model")
+    with open(tmp_path / "config.yml", "w") as f:
+        yaml.safe_dump({"property": PROPERTY}, f)
+    return tmp_path
+
+
+def make_cache(path):
+    return EngineCache(str(path / "cache"), tensorrt="10.3.0", gpu="sm89")
+
+
+def test_key_is_stable(model_dir):
+    cache = make_cache(model_dir)
+    spec = cache.spec(str(model_dir / "config.yml"), 4)
+    assert spec.key == cache.spec(str(model_dir / "config.yml"), 4).key
+    # the same model at another path has the same key
+    assert dataclasses.replace(spec, onnx_file="/elsewhere/model.onnx").key == spec.key
+    for change in ({"batch_size": 8}, {"precision": "fp32"}, {"tensorrt": "10.4.0"}, {"gpu": "sm90"}, {"onnx_digest": "0" * 64}):
+        assert dataclasses.replace(spec, **change).key != spec.key
+
+
+def test_config_digest_ignores_runtime_properties(tmp_path):
+    digest = config_digest(PROPERTY, str(tmp_path))
+    runtime = {name: "any" for name in RUNTIME_PROPERTIES}
+    assert config_digest({**PROPERTY, **runtime}, str(tmp_path)) == digest
+    assert config_digest({**PROPERTY, "onnx-file": "other.onnx"}, str(tmp_path)) == digest
+    assert config_digest({**PROPERTY, "infer-dims": "3;480;640"}, str(tmp_path)) != digest
+
+
+def test_lookup(model_dir):
+    cache = make_cache(model_dir)
+    spec = cache.spec(str(model_dir / "config.yml"), 4)
+    assert cache.lookup(spec) is None
+    built = model_dir / "built.engine"
+    with open(built, "wb") as f:
+        f.write(b"engine")
+    engine_path = cache.store(str(built), spec)
+    assert cache.lookup(spec) == engine_path
+    # an engine cached under the key of the spec but built from another one is refused
+    with open(engine_path + ".json", "r") as f:
+        manifest = json.load(f)
+    with open(engine_path + ".json", "w") as f:
+        json.dump({**manifest, "tensorrt": "8.6.1"}, f)
+    with pytest.raises(ValueError, match="tensorrt"):
+        cache.lookup(spec)
+    # as well as an engine without its manifest
+    os.remove(engine_path + ".json")
+    with pytest.raises(ValueError, match="manifest"):
+        cache.lookup(spec)
+
+
+def test_lookup_refuses_a_truncated_engine(model_dir):
+    cache = make_cache(model_dir)
+    spec = cache.spec(str(model_dir / "config.yml"), 4)
+    built = model_dir / "built.engine"
+    with open(built, "wb") as f:
+        f.write(b"engine")
+    engine_path = cache.store(str(built), spec)
+    with open(engine_path, "wb") as f:
+        f.write(b"eng")
+    with pytest.raises(ValueError, match="size"):
+        cache.lookup(spec)
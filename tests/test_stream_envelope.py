@@ -0,0 +1,116 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import pytest
+
+pytest.importorskip("pyservicemaker")
+
+from lib.responder import StreamEnvelope, jinja2_env
+
+CHUNK_TEMPLATE = """
+{
+  {% set result = response.outputs[0] %}
+  "id": "{{ result.request_id }}",
+  "object": "chat.completion.chunk",
+  "choices": [
+    {% for output in result.outputs %}
+    {
+      "index": {{ output.index }},
+      "delta": { "role": "assistant", "content": {{ output.text_diff|tojson }} },
+      "finish_reason": {{ output.finish_reason|tojson }},
+      "logprob": {{ output.logprob }}
+    }{% if not loop.last %},{% endif %}
+    {% endfor %}
+  ],
+  "usage": {"completion_tokens": {{ result.n_tokens }}}
+}
+"""
+
+
+class CountingTemplate:
+    """A template counting its renderings"""
+    def __init__(self, source):
+        self._template = jinja2_env.from_string(source)
+        self.n_renders = 0
+
+    def render(self, **kwargs):
+        self.n_renders += 1
+        return self._template.render(**kwargs)
+
+
+def chunk(text, n_tokens, finish_reason=None):
+    return {"outputs": [{
+        "request_id": "abc",
+        "n_tokens": n_tokens,
+        "outputs": [{"index": 0, "text_diff": text, "finish_reason": finish_reason, "logprob": -0.25 * n_tokens}]
+    }]}
+
+
+def expected(template, response):
+    return json.loads(jinja2_env.from_string(template).render(request=None, response=response))
+
+
+def test_values_substituted_without_rendering():
+    template = CountingTemplate(CHUNK_TEMPLATE)
+    envelope = StreamEnvelope(template, None, CHUNK_TEMPLATE)
+    responses = [chunk(t, i + 1) for i, t in enumerate(["Hel", 'lo "quoted"', " wörld\n"])]
+    for response in responses:
+        assert json.loads(envelope.format(response)) == expected(CHUNK_TEMPLATE, response)
+    # the sentinel and the check renderings of the first response only
+    assert template.n_renders == 2
+
+
+def test_layout_change_builds_the_envelope_again():
+    template = CountingTemplate(CHUNK_TEMPLATE)
+    envelope = StreamEnvelope(template, None, CHUNK_TEMPLATE)
+    envelope.format(chunk("a", 1))
+    last = chunk("b", 2, finish_reason="stop")
+    assert json.loads(envelope.format(last)) == expected(CHUNK_TEMPLATE, last)
+    assert template.n_renders == 4
+
+
+def test_filtered_values_are_rendered():
+    source = '{"content": {{ response.text|upper|tojson }}, "n": {{ response.n }}}'
+    template = CountingTemplate(source)
+    envelope = StreamEnvelope(template, None, source)
+    for i, text in enumerate(["ab", "cd"]):
+        response = {"text": text, "n": i}
+        assert json.loads(envelope.format(response)) == expected(source, response)
+    # once for each response, without the sentinel renderings
+    assert template.n_renders == 2
+
+
+@pytest.mark.parametrize("source, responses", [
+    (
+        '{"text": {{ response.text|tojson }}, '
+        '"finish_reason": {% if response.done == "yes" %}"stop"{% else %}null{% endif %}}',
+        [{"text": "a", "done": "no"}, {"text": "b", "done": "yes"}],
+    ),
+    (
+        '{"n": {{ response.n }}{% if response.n > 3 %},"big":true{% endif %}}',
+        [{"n": 5}, {"n": 1}],
+    ),
+    (
+        '{% set result = response.outputs[0] %}{"text": {{ (result.text if result.final else "")|tojson }}}',
+        [{"outputs": [{"text": "a", "final": False}]}, {"outputs": [{"text": "b", "final": True}]}],
+    ),
+])
+def test_value_dependent_templates_are_rendered(source, responses):
+    template = CountingTemplate(source)
+    envelope = StreamEnvelope(template, None, source)
+    for response in responses:
+        assert json.loads(envelope.format(response)) == expected(source, response)
+    assert template.n_renders == len(responses)
@@ -0,0 +1,44 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import torch
+
+from lib.transfer import TransferManager
+
+
+def test_upload_keeps_the_other_values():
+    manager = TransferManager(pool_bytes=2**20)
+    data = {"x": np.ones((2, 3), dtype=np.float32), "y": torch.arange(4), "s": np.array(["a"]), "n": 3}
+    uploaded = manager.upload(data)
+    assert uploaded["x"].device == manager.device and torch.equal(uploaded["x"], torch.ones((2, 3)))
+    assert torch.equal(uploaded["y"].cpu(), torch.arange(4))
+    assert uploaded["s"] is data["s"] and uploaded["n"] == 3
+
+
+def test_prefetch_starts_the_next_upload_first(monkeypatch):
+    manager = TransferManager(pool_bytes=2**20)
+    events = []
+    start_upload = manager.start_upload
+
+    def record(data):
+        events.append(("start", int(data["x"][0])))
+        return start_upload(data)
+
+    monkeypatch.setattr(manager, "start_upload", record)
+    for uploaded in manager.prefetch({"x": torch.full((2,), i)} for i in range(3)):
+        events.append(("use", int(uploaded["x"][0])))
+    assert events == [("start", 0), ("start", 1), ("use", 0), ("start", 2), ("use", 1), ("use", 2)]
+    assert list(manager.prefetch([])) == []
@@ -0,0 +1,219 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import os
+import queue
+import sys
+import threading
+import types
+from concurrent.futures import ThreadPoolExecutor
+import jinja2
+import numpy as np
+import pytest
+
+FINAL = 1
+
+
+def _fake_pb_utils():
+    pb_utils = types.ModuleType("triton_python_backend_utils")
+
+    class Tensor:
+        def __init__(self, name, value):
+            self.name = name
+            self.value = value
+
+        @staticmethod
+        def is_cpu(tensor):
+            return True
+
+    class TritonError:
+        CANCELLED = "cancelled"
+
+        def __init__(self, message, code=None):
+            self.message = message
+            self.code = code
+
+    pb_utils.Tensor = Tensor
+    pb_utils.TritonError = TritonError
+    pb_utils.InferenceResponse = lambda output_tensors=None, error=None: types.SimpleNamespace(
+        output_tensors=output_tensors, error=error)
+    pb_utils.TRITONSERVER_RESPONSE_COMPLETE_FINAL = FINAL
+    pb_utils.get_input_tensor_by_name = lambda request, name: types.SimpleNamespace(
+        as_numpy=lambda: request.inputs[name])
+    return pb_utils
+
+
+class FakeSender:
+    def __init__(self):
+        self.responses = []
+        self.done = threading.Event()
+
+    def send(self, response=None, flags=0):
+        if response is not None:
+            self.responses.append(response)
+        if flags == FINAL:
+            self.done.set()
+
+
+class FakeRequest:
+    def __init__(self, x):
+        self.inputs = {"x": np.array([x], dtype=np.float32)}
+        self.sender = FakeSender()
+        self.cancelled = False
+
+    def get_response_sender(self):
+        return self.sender
+
+    def is_cancelled(self):
+        return self.cancelled
+
+    def timeout(self):
+        return 0
+
+
+class FakeFlow:
+    """Stands in for the input and output data flows of the inference flow"""
+    def __init__(self, names):
+        self.in_names = names
+        self.o_names = names
+        self.queue = queue.Queue()
+
+    def put(self, item):
+        self.queue.put(item)
+
+    def get(self):
+        return self.queue.get(timeout=0.1)
+
+
+@pytest.fixture
+def model(monkeypatch):
+    pytest.importorskip("pyservicemaker")
+    monkeypatch.setitem(sys.modules, "triton_python_backend_utils", _fake_pb_utils())
+    path = os.path.join(os.path.dirname(__file__), "..", "templates", "triton")
+    source = jinja2.Environment(loader=jinja2.FileSystemLoader(path)).get_template("model.jinja.py").render(
+        backends=[], top_level=True)
+    namespace = {"__name__": "triton_model", "__file__": os.path.join(path, "model.py")}
+    exec(compile(source, "model.py", "exec"), namespace)
+    # the states initialize would set up for a flow with one input and one output
+    model = namespace["TritonPythonModel"].__new__(namespace["TritonPythonModel"])
+    model._inputs = [FakeFlow(["x"])]
+    model._outputs = [FakeFlow(["y"])]
+    model._input_config_map = {"x": {"dims": [1]}}
+    model._request_timeout = None
+    model._processors = []
+    model._async_executor = ThreadPoolExecutor(max_workers=1)
+    model._async_outputs = {}
+    model._bridge_loop = None
+    model._stop_event = threading.Event()
+    model._async_executor.submit(model._thread_to_async_bridge, 0, model._outputs[0])
+    yield model
+    model._stop_event.set()
+    model._async_executor.shutdown()
+
+
+async def _start(model, requests):
+    """Start the requests and return their tasks and contexts once their inputs are injected"""
+    from lib.inference import REQUEST_CONTEXT_KEY
+    tasks = [asyncio.ensure_future(model.execute([r])) for r in requests]
+    items = []
+    while len(items) < 2 * len(requests):
+        await asyncio.sleep(0.01)
+        while not model._inputs[0].queue.empty():
+            items.append(model._inputs[0].queue.get())
+    contexts = [item[REQUEST_CONTEXT_KEY] for item in items if isinstance(item, dict)]
+    assert len(model._async_outputs) == len(requests)
+    return tasks, contexts
+
+
+def _values(sender):
+    return [[t.value[0] for t in r.output_tensors] for r in sender.responses if r.output_tensors]
+
+
+def test_overlapping_requests(model):
+    from lib.inference import REQUEST_CONTEXT_KEY, Stop
+
+    async def main():
+        first, second = FakeRequest(1), FakeRequest(2)
+        tasks, contexts = await _start(model, [first, second])
+        output = model._outputs[0]
+        # the results of the two requests interleave, the second one finishes first
+        output.put({"y": np.array([1.0]), REQUEST_CONTEXT_KEY: contexts[0]})
+        output.put({"y": np.array([2.0]), REQUEST_CONTEXT_KEY: contexts[1]})
+        output.put(Stop(reason="end", request_id=contexts[1].request_id))
+        output.put({"y": np.array([1.5]), REQUEST_CONTEXT_KEY: contexts[0]})
+        output.put(Stop(reason="end", request_id=contexts[0].request_id))
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=5)
+        return first.sender, second.sender
+
+    first, second = asyncio.run(main())
+    assert first.done.is_set() and second.done.is_set()
+    assert _values(first) == [[1.0], [1.5]]
+    assert _values(second) == [[2.0]]
+    assert not model._async_outputs
+
+
+def test_dropped_requests_among_others(model):
+    from lib.inference import REQUEST_CONTEXT_KEY, Error, Stop
+
+    async def main():
+        expired, cancelled, live = FakeRequest(1), FakeRequest(2), FakeRequest(3)
+        tasks, contexts = await _start(model, [expired, cancelled, live])
+        contexts[0].deadline = 0
+        cancelled.cancelled = True
+        output = model._outputs[0]
+        # the flow replaces the data of the dropped requests with their Error, then their Stop follows
+        for context in contexts[:2]:
+            output.put(Error(f"Request {context.request_id} dropped: {context.reason}", context.request_id))
+        output.put({"y": np.array([3.0]), REQUEST_CONTEXT_KEY: contexts[2]})
+        for context in contexts[:2]:
+            output.put(Stop(reason="end", request_id=context.request_id))
+        await asyncio.wait_for(asyncio.gather(*tasks[:2]), timeout=5)
+        # late results of the finished requests are discarded
+        output.put({"y": np.array([1.0]), REQUEST_CONTEXT_KEY: contexts[0]})
+        output.put(Stop(reason="end", request_id=contexts[2].request_id))
+        await asyncio.wait_for(tasks[2], timeout=5)
+        return expired.sender, cancelled.sender, live.sender
+
+    expired, cancelled, live = asyncio.run(main())
+    assert all(sender.done.is_set() for sender in (expired, cancelled, live))
+    assert [r.error.code for r in expired.responses] == [None]
+    assert [r.error.code for r in cancelled.responses] == ["cancelled"]
+    assert _values(live) == [[3.0]]
+    assert not model._async_outputs
+
+
+def test_abandoned_request(model):
+    from lib.inference import REQUEST_CONTEXT_KEY, Stop
+
+    async def main():
+        abandoned, live = FakeRequest(1), FakeRequest(2)
+        tasks, contexts = await _start(model, [abandoned, live])
+        tasks[0].cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tasks[0]
+        # the pending work of the abandoned request is cancelled and its results discarded
+        assert contexts[0].cancelled and len(model._async_outputs) == 1
+        output = model._outputs[0]
+        output.put({"y": np.array([1.0]), REQUEST_CONTEXT_KEY: contexts[0]})
+        output.put(Stop(reason="end", request_id=contexts[0].request_id))
+        output.put({"y": np.array([2.0]), REQUEST_CONTEXT_KEY: contexts[1]})
+        output.put(Stop(reason="end", request_id=contexts[1].request_id))
+        await asyncio.wait_for(tasks[1], timeout=5)
+        return live.sender
+
+    live = asyncio.run(main())
+    assert _values(live) == [[2.0]]
+    assert not model._async_outputs
@@ -0,0 +1,88 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark of the idle CPU usage and the added latency of the flow collectors
+
+The benchmark must be run against a generated inference package because the
+common lib depends on the generated config and custom modules:
+
+    python tools/benchmarks/bench_collectors.py --package /path/to/generated/service
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+
+def idle_cpu(collector, seconds):
+    """CPU seconds consumed per wall second while the collector has nothing to collect"""
+    start_cpu = time.process_time()
+    start = time.perf_counter()
+    time.sleep(seconds)
+    return (time.process_time() - start_cpu) / (time.perf_counter() - start)
+
+
+def latency(collector, flows, iterations, aggregate, stop_cls):
+    """Time from depositing the data to the flows until it is collected"""
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        if aggregate:
+            for index, flow in enumerate(flows):
+                flow.put({f"t{index}": np.zeros(1)})
+        else:
+            flow = flows[i % len(flows)]
+            flow.put({f"t{i % len(flows)}": np.zeros(1)})
+        collector.collect()
+        samples.append(time.perf_counter() - start)
+        if not aggregate:
+            # end the turn of the flow
+            flow.put(stop_cls("end"))
+            collector.collect()
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser("Flow collector benchmark")
+    parser.add_argument("--package", type=str, required=True, help="Path to a generated inference package")
+    parser.add_argument("-n", "--iterations", type=int, default=2000, help="Number of iterations")
+    parser.add_argument("--idle", type=float, default=2.0, help="Seconds to measure the idle CPU usage")
+    args = parser.parse_args()
+
+    sys.path.insert(0, args.package)
+    from lib.inference import DataFlow, MultiFlowCollector, AggregationFlowCollector, Stop
+
+    for name, cls, aggregate in [
+        ("multi", MultiFlowCollector, False),
+        ("aggregation", AggregationFlowCollector, True),
+    ]:
+        for n_flows in [2, 4, 8]:
+            flows = [DataFlow(None, [(f"t{i}", f"t{i}")]) for i in range(n_flows)]
+            collector = cls(flows)
+            cpu = idle_cpu(collector, args.idle)
+            p50, p99 = latency(collector, flows, args.iterations, aggregate, Stop)
+            collector.stop()
+            print(
+                f"{name:<12} flows={n_flows}: idle cpu {cpu * 100:6.2f}%, "
+                f"latency p50 {p50 * 1e6:8.2f} us, p99 {p99 * 1e6:8.2f} us"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Micro-benchmark for DataFlow.put
+
+The benchmark must be run against a generated inference package because the
+common lib depends on the generated config and custom modules:
+
+    python tools/benchmarks/bench_dataflow.py --package /path/to/generated/service
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+# a realistic inbound config of a Deepstream detection pipeline with optional extras
+INPUT_CONFIGS = [
+    {"name": "media_url", "data_type": "TYPE_CUSTOM_BINARY_URLS", "dims": [-1]},
+    {"name": "mime", "data_type": "TYPE_CUSTOM_DS_MIME", "dims": [-1]},
+    {"name": "images", "data_type": "TYPE_CUSTOM_DS_IMAGE", "dims": [-1], "optional": True},
+    {"name": "text", "data_type": "TYPE_STRING", "dims": [-1], "optional": True},
+    {"name": "threshold", "data_type": "TYPE_FP32", "dims": [1], "optional": True},
+    {"name": "max_objects", "data_type": "TYPE_INT32", "dims": [1], "optional": True},
+]
+
+OUTPUT_CONFIGS = [
+    {"name": "output", "data_type": "TYPE_CUSTOM_DS_METADATA", "dims": [-1]},
+    {"name": "scores", "data_type": "TYPE_FP32", "dims": [-1], "optional": True},
+]
+
+
+def run(flow, item, iterations):
+    # warm up
+    for _ in range(100):
+        flow.put(item)
+        flow.get()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        flow.put(item)
+        flow.get()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser("DataFlow.put micro-benchmark")
+    parser.add_argument("--package", type=str, required=True, help="Path to a generated inference package")
+    parser.add_argument("-n", "--iterations", type=int, default=100000, help="Number of iterations")
+    args = parser.parse_args()
+
+    sys.path.insert(0, args.package)
+    from lib.inference import DataFlow
+
+    inbound = DataFlow(
+        INPUT_CONFIGS,
+        [(c["name"], c["name"]) for c in INPUT_CONFIGS],
+        inbound=True
+    )
+    outbound = DataFlow(
+        OUTPUT_CONFIGS,
+        [(c["name"], c["name"]) for c in OUTPUT_CONFIGS],
+        outbound=True
+    )
+    passthrough = DataFlow(None, [("output", "output"), ("scores", "scores")])
+
+    request = {
+        "media_url": np.array(["/tmp/a.jpg", "/tmp/b.jpg", "/tmp/c.jpg", "/tmp/d.jpg"]),
+        "mime": np.array(["image/jpeg"] * 4),
+        "threshold": np.array([0.5], dtype=np.float32),
+    }
+    result = {
+        "output": [{"bboxes": [[0, 0, 10, 10]], "probs": [0.9]}] * 4,
+        "scores": np.random.rand(4).astype(np.float32),
+    }
+    for name, flow, item in [
+        ("inbound", inbound, request),
+        ("outbound", outbound, result),
+        ("passthrough", passthrough, result),
+    ]:
+        latency = run(flow, item, args.iterations)
+        print(f"DataFlow.put {name:<12}: {latency * 1e6:8.2f} us/item")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark of handing encoded images over to the pipeline buffers on CPU
+
+The pyservicemaker Buffer is replaced by stand-in classes, one taking the bytes as a
+list like the original path, and one taking them through the buffer protocol:
+
+    python tools/benchmarks/bench_encoded_buffers.py --size 8
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+
+class ListBuffer:
+    """Stand-in of a buffer constructed from a list of bytes"""
+    def __init__(self, data=None):
+        if data is not None and not isinstance(data, list):
+            raise TypeError("list expected")
+        self.data = bytes(data) if data is not None else b""
+
+
+class ProtocolBuffer:
+    """Stand-in of a buffer referencing the bytes through the buffer protocol"""
+    def __init__(self, data=None):
+        self.data = memoryview(data) if data is not None else memoryview(b"")
+
+
+def legacy(path, buffer_class):
+    with open(path, "rb") as f:
+        tensor = np.frombuffer(f.read(), dtype=np.uint8)
+    return buffer_class(tensor.tolist())
+
+
+def pooled(pool, path):
+    data, storage = pool.read(path)
+    buffer = pool.wrap(data)
+    pool.release(storage)
+    return buffer
+
+
+def timeit(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser("Encoded buffer benchmark")
+    parser.add_argument("--package", type=str, default=os.path.join(os.path.dirname(__file__), "..", ".."), help="Path to the common lib")
+    parser.add_argument("--size", type=float, nargs="+", default=[0.1, 1, 8], help="Sizes of the encoded images in MB")
+    parser.add_argument("-n", "--iterations", type=int, default=20, help="Number of iterations")
+    args = parser.parse_args()
+
+    sys.path.insert(0, args.package)
+    from lib.buffers import EncodedBufferPool
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in args.size:
+            path = os.path.join(temp_dir, "image.png")
+            with open(path, "wb") as f:
+                f.write(np.random.randint(0, 256, int(size * 2**20), dtype=np.uint8).tobytes())
+            t_legacy = timeit(lambda: legacy(path, ListBuffer), args.iterations)
+            list_pool = EncodedBufferPool(ListBuffer)
+            t_list = timeit(lambda: pooled(list_pool, path), args.iterations)
+            protocol_pool = EncodedBufferPool(ProtocolBuffer)
+            t_protocol = timeit(lambda: pooled(protocol_pool, path), args.iterations)
+            print(
+                f"{size:6.1f} MB: tolist {t_legacy * 1e3:9.3f} ms, "
+                f"pooled list {t_list * 1e3:9.3f} ms, "
+                f"pooled zero copy {t_protocol * 1e3:9.3f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()